@@ -1,12 +1,8 @@
 """Main Flask application entry point."""
 import os
 from app import create_app
-from dotenv import load_dotenv
 
-# Load environment variables
-load_dotenv()
-
-# Create Flask app
+# Create Flask app (importing app loads .env)
 app = create_app()
 
 if __name__ == '__main__':
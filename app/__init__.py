@@ -3,6 +3,7 @@ import os
 from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
 from dotenv import load_dotenv
+from app.sqlite import engine_options_from_env, install_sqlite_pragmas
 
 # Load environment variables
 load_dotenv()
@@ -31,18 +32,86 @@ def create_app():
     
     app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{db_path}'
     app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options_from_env()
+    
+    # Cached export files live next to the database unless configured otherwise
+    app.config['EXPORT_CACHE_DIR'] = os.path.abspath(
+        os.getenv('EXPORT_CACHE_DIR', os.path.join(db_dir or '.', 'exports')))
+    
+    # Per-worker metrics snapshots, summed by /metrics
+    app.config['METRICS_DIR'] = os.path.abspath(
+        os.getenv('METRICS_DIR') or os.path.join(db_dir or '.', 'metrics'))
+    
+    # Item cache shared by the workers on this host
+    app.config['ITEM_CACHE_PATH'] = os.path.abspath(
+        os.getenv('ITEM_CACHE_PATH') or os.path.join(db_dir or '.', 'item_cache.db'))
     
     # Initialize extensions
     db.init_app(app)
     
+    # Apply the SQLite pragma profile (WAL, busy_timeout, ...) to every connection
+    with app.app_context():
+        install_sqlite_pragmas(db.engine)
+    
     # Register blueprints
-    from app.routes import auth, admin, user
+    from app.routes import auth, admin, user, qr, events, metrics
     app.register_blueprint(auth.bp)
     app.register_blueprint(admin.bp)
     app.register_blueprint(user.bp)
+    app.register_blueprint(qr.bp)
+    app.register_blueprint(events.bp)
+    app.register_blueprint(metrics.bp)
+    
+    # Register CLI commands
+    from app.cli import register_commands
+    register_commands(app)
     
-    # Create database tables
+    # Schema changes are applied by `flask db upgrade`; booting only checks
+    # the schema version (see app.migrations)
     with app.app_context():
-        db.create_all()
+        from app.migrations import check_database
+        schema_current = check_database()
+    
+    # Request, SQL and operation timings for /metrics
+    from app.metrics import init_metrics
+    init_metrics(app)
+    
+    # Cached item details for the scan path
+    from app.item_cache import init_item_cache
+    init_item_cache(app)
+    
+    # Periodic jobs
+    from app.digest import register_digest_job
+    from app.manifest import register_manifest_jobs
+    from app.change_feed import register_change_feed_jobs
+    from app.ledger import register_ledger_jobs
+    from app.forecast import register_forecast_job
+    from app.backup import register_backup_job
+    register_digest_job()
+    register_manifest_jobs()
+    register_change_feed_jobs()
+    register_ledger_jobs()
+    register_forecast_job()
+    register_backup_job()
+    
+    # Job rows and their starting state exist from boot, so nothing recorded
+    # before the scheduler's first tick is missed
+    if schema_current:
+        from app.scheduler import ensure_job_rows
+        with app.app_context():
+            ensure_job_rows()
+    
+    # Deliver queued email and run periodic jobs in background threads, one set
+    # per worker process. Started on the first request so they also run in
+    # workers forked after --preload.
+    from app.scheduler import start_scheduler
+    from app.outbox import start_dispatcher
+    run_dispatcher = os.getenv('EMAIL_OUTBOX_DISPATCHER', 'true').lower() == 'true'
+    
+    @app.before_request
+    def _ensure_background_threads():
+        if run_dispatcher:
+            start_dispatcher(app)
+        start_scheduler(app)
     
     return app
@@ -0,0 +1,303 @@
+"""Online backups and compressed snapshots of the SQLite database.
+
+Snapshots are taken with SQLite's online backup API while the app keeps
+running.  The database is copied ``BACKUP_PAGES_PER_STEP`` pages at a time
+with a pause of ``BACKUP_STEP_SLEEP_MS`` between steps.  Each step holds a
+read lock on the database only while it copies its pages.  With the
+default WAL journal readers never block writers anyway; in rollback-journal
+mode a commit waits for the step in progress, so short steps keep
+``take_item`` from stalling.  Every step is timed, and the durations are
+reported with the snapshot and in ``/metrics`` (``backup_step_seconds``).
+
+SQLite restarts a stepped backup from the first page whenever another
+connection writes to the database, so under steady checkouts it might
+never finish.  After ``BACKUP_MAX_RESTARTS`` restarts, a database in WAL
+mode is copied in a single step instead, which reads one consistent
+snapshot without blocking writers.  In any other journal mode that step
+would lock writers out for the whole copy, so the backup fails instead and
+the next scheduled one tries again.
+
+A snapshot is restored only into a schema it can be upgraded to: older
+snapshots are migrated right after the restore, and snapshots taken by a
+newer version of the app are refused.
+
+Snapshots are gzip-compressed files in ``BACKUP_DIR`` (by default
+``backups`` next to the database).  The newest ``BACKUP_KEEP`` are kept.  A
+scheduled job takes one every ``BACKUP_INTERVAL_HOURS``.
+"""
+import glob
+import gzip
+import os
+import shutil
+import sqlite3
+import statistics
+import tempfile
+import time
+from datetime import datetime
+from app import db
+from app.metrics import observe, timed
+
+COPY_CHUNK_SIZE = 1024 * 1024
+
+class _TooManyRestarts(Exception):
+    pass
+
+def database_path():
+    """Path of the live database file."""
+    return os.path.abspath(db.engine.url.database)
+
+def backup_dir():
+    """Directory holding snapshots."""
+    path = os.getenv('BACKUP_DIR')
+    if not path:
+        path = os.path.join(os.path.dirname(database_path()), 'backups')
+    return os.path.abspath(path)
+
+def _snapshot_prefix():
+    return os.path.splitext(os.path.basename(database_path()))[0] + '-'
+
+def _settings():
+    return {
+        'pages': int(os.getenv('BACKUP_PAGES_PER_STEP', 256)),
+        'sleep': int(os.getenv('BACKUP_STEP_SLEEP_MS', 10)) / 1000,
+        'max_restarts': int(os.getenv('BACKUP_MAX_RESTARTS', 3)),
+        'keep': int(os.getenv('BACKUP_KEEP', 7)),
+        'compress': os.getenv('BACKUP_COMPRESS', 'true').lower() == 'true',
+    }
+
+def online_backup(source_path, target_path, pages=None, sleep=None, max_restarts=None):
+    """
+    Copy a live database into ``target_path`` in small steps.
+    
+    Args:
+        source_path: Database to copy
+        target_path: New database file to write
+        pages: Pages per step (BACKUP_PAGES_PER_STEP, default 256)
+        sleep: Seconds to pause between steps (BACKUP_STEP_SLEEP_MS, default 10 ms)
+        max_restarts: Restarts caused by concurrent writes before the rest is
+            copied in one step (BACKUP_MAX_RESTARTS, default 3)
+    
+    Returns:
+        dict: pages, steps, step_seconds (one per step), restarts and
+        whether the copy finished in a single final step
+    
+    Raises:
+        RuntimeError: If the copy keeps restarting and the database is not in
+            WAL mode, where a single step would block writers
+    """
+    settings = _settings()
+    pages = pages or settings['pages']
+    sleep = settings['sleep'] if sleep is None else sleep
+    max_restarts = settings['max_restarts'] if max_restarts is None else max_restarts
+    stats = {'pages': 0, 'step_seconds': [], 'restarts': 0, 'single_step': False}
+    state = {'started': time.perf_counter(), 'remaining': None}
+    
+    def progress(status, remaining, total):
+        stats['step_seconds'].append(time.perf_counter() - state['started'])
+        stats['pages'] = total
+        # A restarted backup copies the same pages again, so nothing is gained
+        if state['remaining'] is not None and remaining >= state['remaining']:
+            stats['restarts'] += 1
+            if stats['restarts'] > max_restarts:
+                raise _TooManyRestarts()
+        state['remaining'] = remaining
+        if remaining:
+            time.sleep(sleep)
+        state['started'] = time.perf_counter()
+    
+    source = sqlite3.connect(source_path, timeout=30)
+    try:
+        wal = source.execute('PRAGMA journal_mode').fetchone()[0].lower() == 'wal'
+        target = sqlite3.connect(target_path)
+        try:
+            try:
+                source.backup(target, pages=pages, progress=progress)
+            except _TooManyRestarts:
+                if not wal:
+                    raise RuntimeError(f"Backup restarted {stats['restarts']} times because of concurrent "
+                                       'writes; copying in one step would block writers outside WAL mode')
+                stats['single_step'] = True
+                state['started'] = time.perf_counter()
+                source.backup(target)
+                stats['step_seconds'].append(time.perf_counter() - state['started'])
+        finally:
+            target.close()
+    finally:
+        source.close()
+    
+    for seconds in stats['step_seconds']:
+        observe('backup_step_seconds', seconds)
+    stats['steps'] = len(stats['step_seconds'])
+    return stats
+
+def _compress(source_path, target_path):
+    with open(source_path, 'rb') as source, gzip.open(target_path, 'wb', compresslevel=6) as target:
+        shutil.copyfileobj(source, target, COPY_CHUNK_SIZE)
+
+def _decompress(source_path, target_path):
+    opener = gzip.open if source_path.endswith('.gz') else open
+    with opener(source_path, 'rb') as source, open(target_path, 'wb') as target:
+        shutil.copyfileobj(source, target, COPY_CHUNK_SIZE)
+
+def create_backup(label=None):
+    """
+    Take a snapshot of the live database and apply retention.
+    
+    Args:
+        label: Optional suffix for the file name (e.g. ``pre-restore``)
+    
+    Returns:
+        dict: path, size, seconds, pages, steps, max_step_ms,
+        median_step_ms, restarts, single_step and the removed snapshots
+    """
+    settings = _settings()
+    directory = backup_dir()
+    os.makedirs(directory, exist_ok=True)
+    name = _snapshot_prefix() + datetime.utcnow().strftime('%Y%m%d-%H%M%S')
+    if label:
+        name += f'-{label}'
+    path = os.path.join(directory, name + ('.db.gz' if settings['compress'] else '.db'))
+    
+    started = time.perf_counter()
+    with timed('backup'):
+        fd, tmp_db = tempfile.mkstemp(prefix='.backup-', suffix='.db', dir=directory)
+        os.close(fd)
+        try:
+            stats = online_backup(database_path(), tmp_db)
+            if settings['compress']:
+                tmp_path = f'{path}.tmp'
+                _compress(tmp_db, tmp_path)
+                os.replace(tmp_path, path)
+            else:
+                os.replace(tmp_db, path)
+        finally:
+            if os.path.exists(tmp_db):
+                os.remove(tmp_db)
+    
+    steps = stats['step_seconds']
+    return {
+        'path': path,
+        'size': os.path.getsize(path),
+        'seconds': time.perf_counter() - started,
+        'pages': stats['pages'],
+        'steps': stats['steps'],
+        'max_step_ms': max(steps) * 1000 if steps else 0.0,
+        'median_step_ms': statistics.median(steps) * 1000 if steps else 0.0,
+        'restarts': stats['restarts'],
+        'single_step': stats['single_step'],
+        'removed': prune_backups(settings['keep']),
+    }
+
+def list_backups():
+    """Snapshots as (path, size, modified datetime) tuples, newest first."""
+    paths = glob.glob(os.path.join(backup_dir(), _snapshot_prefix() + '*.db*'))
+    paths = [path for path in paths if path.endswith(('.db', '.db.gz'))]
+    return sorted(((path, os.path.getsize(path), datetime.fromtimestamp(os.path.getmtime(path)))
+                   for path in paths), key=lambda entry: entry[2], reverse=True)
+
+def prune_backups(keep):
+    """Delete all but the newest ``keep`` snapshots; returns the removed paths."""
+    if keep <= 0:
+        return []
+    removed = [path for path, _, _ in list_backups()[keep:]]
+    for path in removed:
+        os.remove(path)
+    return removed
+
+def resolve_backup(name):
+    """Find a snapshot by path or by file name in the backup directory."""
+    for path in (name, os.path.join(backup_dir(), name)):
+        if os.path.isfile(path):
+            return os.path.abspath(path)
+    raise FileNotFoundError(f'No backup named {name}')
+
+def _check(path):
+    conn = sqlite3.connect(path)
+    try:
+        integrity = conn.execute('PRAGMA integrity_check').fetchone()[0]
+        result = {
+            'ok': integrity == 'ok',
+            'integrity': integrity,
+            'schema_version': conn.execute('PRAGMA user_version').fetchone()[0],
+        }
+        for table in ('items', 'transactions'):
+            try:
+                result[table] = conn.execute(f'SELECT count(*) FROM {table}').fetchone()[0]
+            except sqlite3.DatabaseError:
+                result[table] = None
+                result['ok'] = False
+        return result
+    finally:
+        conn.close()
+
+def verify_backup(path):
+    """
+    Check a snapshot's integrity without touching the live database.
+    
+    Returns:
+        dict: ok, integrity (first problem or 'ok'), schema_version, items
+        and transactions
+    """
+    with tempfile.TemporaryDirectory() as tmp:
+        copy = os.path.join(tmp, 'verify.db')
+        _decompress(path, copy)
+        return _check(copy)
+
+def restore_backup(path):
+    """
+    Replace the live database with a snapshot.
+    
+    The snapshot is verified first, and a ``pre-restore`` snapshot of the
+    current database is taken so the restore can be undone.  Pages are
+    written through the backup API, so connections that stay open see the
+    restored data, but workers keep per-process caches: restart them.
+    
+    Returns:
+        dict: the verification result, the pre-restore snapshot path and
+        the migrations applied to bring an older snapshot up to date
+    
+    Raises:
+        ValueError: If the snapshot fails verification or has a newer schema
+            than this version of the app knows
+    """
+    from app.migrations import latest_version, upgrade_database
+    with tempfile.TemporaryDirectory() as tmp:
+        # Decompressed first: retention after the safety snapshot may delete ``path``
+        copy = os.path.join(tmp, 'restore.db')
+        _decompress(path, copy)
+        check = _check(copy)
+        if not check['ok']:
+            raise ValueError(f"Backup failed verification: {check['integrity']}")
+        if check['schema_version'] > latest_version():
+            raise ValueError(f"Backup has schema version {check['schema_version']}, newer than this "
+                             f'version of the app ({latest_version()}); restore it with that version')
+        safety = create_backup(label='pre-restore')
+        
+        source = sqlite3.connect(copy)
+        target = sqlite3.connect(database_path(), timeout=30)
+        try:
+            # One step: the database must not be seen half restored
+            source.backup(target)
+        finally:
+            target.close()
+            source.close()
+    
+    # Workers only check the schema when they boot
+    upgraded = upgrade_database() if check['schema_version'] < latest_version() else []
+    
+    from app.item_cache import invalidate_items
+    invalidate_items()
+    return {'verified': check, 'pre_restore': safety['path'], 'upgraded': upgraded}
+
+def scheduled_backup(job=None):
+    """Scheduled job: take a snapshot and apply retention."""
+    result = create_backup()
+    print(f"Backup {os.path.basename(result['path'])}: {result['size'] / 1e6:.1f} MB in "
+          f"{result['seconds']:.1f}s, {result['steps']} steps, longest {result['max_step_ms']:.1f} ms")
+
+def register_backup_job():
+    """Schedule snapshots every BACKUP_INTERVAL_HOURS (0 disables them)."""
+    hours = float(os.getenv('BACKUP_INTERVAL_HOURS', 24))
+    if hours > 0:
+        from app.scheduler import register_job
+        register_job('backup_database', int(hours * 3600), scheduled_backup)
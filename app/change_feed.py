@@ -0,0 +1,179 @@
+"""Live stock updates: an SQLite change log fanned out to SSE clients.
+
+Whenever a commit touches items or transactions, ``change_events`` rows
+describing the new state are written in the same transaction (the ids come
+from the ``app.changes`` tracking, so every write path is covered).  Each
+worker runs one feed thread, started when its first client subscribes,
+that polls the log by id and hands new events to the subscribers' queues.
+A wall of open dashboards therefore costs one indexed query per worker
+per poll interval, not one query per client.
+
+Event ids are stable across workers, so a reconnecting EventSource resumes
+from its ``Last-Event-ID``.  Old events are pruned by a scheduled job.
+"""
+import os
+import queue
+import threading
+from datetime import datetime, timedelta
+from sqlalchemy import event
+from app import db
+from app.models import ChangeEvent, Item, Transaction
+
+_subscribers = set()
+_subscribers_lock = threading.Lock()
+_wakeup = threading.Event()
+_feed = None
+_feed_pid = None
+_last_id = 0
+
+def _poll_seconds():
+    return float(os.getenv('CHANGE_FEED_POLL_SECONDS', 1))
+
+def _retention():
+    return timedelta(hours=int(os.getenv('CHANGE_EVENT_RETENTION_HOURS', 24)))
+
+def _item_payload(item_id, name, quantity, version):
+    return {'id': item_id, 'name': name, 'quantity': quantity, 'version': version}
+
+def _transaction_payload(transaction_id, item_id, item_name, user_name, quantity, timestamp, kind):
+    return {'id': transaction_id, 'item_id': item_id, 'item_name': item_name or 'Unknown',
+            'user_name': user_name, 'quantity': quantity, 'kind': kind,
+            'timestamp': timestamp.isoformat() if timestamp else None}
+
+def _events_for(changes):
+    """Build change event rows describing the committed state of ``changes``."""
+    item_ids = changes.get(Item.__tablename__, set())
+    transaction_ids = changes.get(Transaction.__tablename__, set())
+    if item_ids is None or transaction_ids is None:
+        # A bulk statement changed rows we cannot name; clients reload
+        return [{'kind': 'reset', 'payload': None}]
+    
+    rows = []
+    item_ids = {item_id for item_id in item_ids if item_id is not None}
+    if item_ids:
+        found = db.session.execute(
+            db.select(Item.id, Item.name, Item.quantity, Item.version).where(Item.id.in_(item_ids))).all()
+        rows.extend({'kind': 'item', 'payload': _item_payload(*row)} for row in found)
+        rows.extend({'kind': 'item_deleted', 'payload': {'id': item_id}}
+                    for item_id in sorted(item_ids - {row[0] for row in found}))
+    
+    transaction_ids = {transaction_id for transaction_id in transaction_ids if transaction_id is not None}
+    if transaction_ids:
+        found = db.session.execute(
+            db.select(Transaction.id, Transaction.item_id, Item.name, Transaction.user_name,
+                      Transaction.quantity, Transaction.timestamp, Transaction.kind)
+            .outerjoin(Item, Transaction.item_id == Item.id)
+            .where(Transaction.id.in_(transaction_ids))
+            .order_by(Transaction.id)).all()
+        rows.extend({'kind': 'transaction', 'payload': _transaction_payload(*row)} for row in found)
+    return rows
+
+@event.listens_for(db.session, 'before_commit')
+def _write_change_events(session):
+    # Flush first so the tracked ids include everything in this transaction
+    session.flush()
+    changes = session.info.get('changed_rows')
+    if not changes or not (Item.__tablename__ in changes or Transaction.__tablename__ in changes):
+        return
+    rows = _events_for(changes)
+    if rows:
+        now = datetime.utcnow()
+        session.execute(db.insert(ChangeEvent).execution_options(changed_ids=[]),
+                        [{**row, 'created_at': now} for row in rows])
+        session.info['change_events_written'] = True
+
+@event.listens_for(db.session, 'after_commit')
+def _wake_feed(session):
+    # Events committed by this worker are picked up at once, not at the next poll
+    if session.info.pop('change_events_written', False):
+        _wakeup.set()
+
+@event.listens_for(db.session, 'after_rollback')
+def _discard(session):
+    session.info.pop('change_events_written', None)
+
+def read_events(after_id, limit=500):
+    """Return (id, kind, payload) tuples of events after ``after_id``, oldest first."""
+    return db.session.execute(
+        db.select(ChangeEvent.id, ChangeEvent.kind, ChangeEvent.payload)
+        .where(ChangeEvent.id > after_id)
+        .order_by(ChangeEvent.id)
+        .limit(limit)).all()
+
+def oldest_event_id():
+    return db.session.query(db.func.min(ChangeEvent.id)).scalar()
+
+def latest_event_id():
+    return db.session.query(db.func.max(ChangeEvent.id)).scalar() or 0
+
+def _run_feed(app):
+    global _last_id
+    while True:
+        _wakeup.wait(_poll_seconds())
+        _wakeup.clear()
+        with _subscribers_lock:
+            if not _subscribers:
+                continue
+        try:
+            with app.app_context():
+                events = read_events(_last_id)
+                while events:
+                    _last_id = events[-1][0]
+                    _publish(events)
+                    events = read_events(_last_id)
+                db.session.remove()
+        except Exception as e:
+            print(f"Change feed poll failed: {str(e)}")
+
+def _publish(events):
+    with _subscribers_lock:
+        subscribers = list(_subscribers)
+    for subscriber in subscribers:
+        try:
+            subscriber.put_nowait(events)
+        except queue.Full:
+            # A client that stopped reading is dropped; it reconnects with Last-Event-ID
+            unsubscribe(subscriber)
+            try:
+                subscriber.get_nowait()
+            except queue.Empty:
+                pass
+            subscriber.put_nowait(None)
+
+def _ensure_feed(app):
+    global _feed, _feed_pid, _last_id
+    with _subscribers_lock:
+        if _feed is not None and _feed.is_alive() and _feed_pid == os.getpid():
+            return
+        _last_id = latest_event_id()
+        _feed = threading.Thread(target=_run_feed, args=(app,), name='change-feed', daemon=True)
+        _feed_pid = os.getpid()
+        _feed.start()
+
+def subscribe(app):
+    """
+    Register a client and return its queue of event batches.
+    
+    The queue receives lists of (id, kind, payload) tuples, or None when the
+    client fell too far behind and should reconnect.
+    """
+    _ensure_feed(app)
+    subscriber = queue.Queue(maxsize=int(os.getenv('CHANGE_FEED_CLIENT_BACKLOG', 100)))
+    with _subscribers_lock:
+        _subscribers.add(subscriber)
+    return subscriber
+
+def unsubscribe(subscriber):
+    with _subscribers_lock:
+        _subscribers.discard(subscriber)
+
+def prune_change_events(job=None):
+    """Scheduled job: delete events older than CHANGE_EVENT_RETENTION_HOURS."""
+    db.session.execute(db.delete(ChangeEvent)
+                       .where(ChangeEvent.created_at < datetime.utcnow() - _retention())
+                       .execution_options(changed_ids=[]))
+    db.session.commit()
+
+def register_change_feed_jobs():
+    from app.scheduler import register_job
+    register_job('prune_change_events', 3600, prune_change_events)
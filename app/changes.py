@@ -0,0 +1,63 @@
+"""After-commit notifications about which rows changed.
+
+Caches register a callback with ``on_commit``; it is called after every
+successful commit that touched one of the tables it cares about, with the
+ids that changed.  ORM flushes are tracked automatically.  Bulk
+``update()``/``delete()`` statements executed through the session are
+tracked too, with unknown ids (``None``) unless the statement is given a
+``changed_ids`` execution option.  Raw SQL writers call ``mark_changed``.
+"""
+from sqlalchemy import event
+from app import db
+
+_callbacks = []
+
+def on_commit(callback):
+    """
+    Register ``callback(changes)`` to run after each commit with changes.
+    
+    ``changes`` maps table name to a set of primary keys, or to None when
+    the affected rows are unknown.
+    """
+    _callbacks.append(callback)
+    return callback
+
+def mark_changed(table_name, ids=None, session=None):
+    """Record changed rows in the current transaction; ids=None means unknown."""
+    session = session or db.session
+    changes = session.info.setdefault('changed_rows', {})
+    if ids is None or changes.get(table_name, set()) is None:
+        changes[table_name] = None
+    else:
+        changes.setdefault(table_name, set()).update(ids)
+
+@event.listens_for(db.session, 'after_flush')
+def _track_flush(session, flush_context):
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        table = getattr(obj, '__table__', None)
+        if table is not None:
+            mark_changed(table.name, [getattr(obj, 'id', None)], session)
+
+@event.listens_for(db.session, 'do_orm_execute')
+def _track_bulk_statements(orm_execute_state):
+    if not (orm_execute_state.is_update or orm_execute_state.is_delete or orm_execute_state.is_insert):
+        return
+    table = getattr(orm_execute_state.statement, 'table', None)
+    if table is not None:
+        ids = orm_execute_state.execution_options.get('changed_ids')
+        mark_changed(table.name, ids, orm_execute_state.session)
+
+@event.listens_for(db.session, 'after_commit')
+def _notify(session):
+    changes = session.info.pop('changed_rows', None)
+    if not changes:
+        return
+    for callback in _callbacks:
+        try:
+            callback(changes)
+        except Exception as e:
+            print(f"After-commit callback failed: {str(e)}")
+
+@event.listens_for(db.session, 'after_rollback')
+def _discard(session):
+    session.info.pop('changed_rows', None)
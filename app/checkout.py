@@ -0,0 +1,114 @@
+"""Taking stock for one or several items in a single transaction.
+
+Both the single-item take form and the cart checkout API go through
+``checkout``.  Every line is a conditional stock decrement
+(``Item.take_stock``); the decrements, the ``Transaction`` rows and the
+notification emails are committed together, or not at all if any line is
+short.  Lines are applied in item id order so concurrent checkouts touch
+rows in the same order.
+"""
+import os
+from app import db
+from app.models import Item, Transaction
+from app.outbox import enqueue_email
+from app.digest import admin_digest_enabled
+from app.utils import create_item_taken_email, create_checkout_email
+
+class InsufficientStockError(Exception):
+    """Raised when one or more checkout lines cannot be fulfilled."""
+    
+    def __init__(self, shortages):
+        super().__init__('Not enough stock for: ' + ', '.join(s['name'] or f"item {s['item_id']}" for s in shortages))
+        self.shortages = shortages
+
+def merge_lines(lines):
+    """
+    Combine checkout lines for the same item.
+    
+    Args:
+        lines: Iterable of (item_id, quantity)
+    
+    Returns:
+        dict: item_id to total quantity, in item id order
+    
+    Raises:
+        ValueError: If a quantity is not a positive whole number
+    """
+    merged = {}
+    for item_id, quantity in lines:
+        if not isinstance(quantity, int) or isinstance(quantity, bool) or quantity <= 0:
+            raise ValueError('Quantity must be greater than 0')
+        merged[item_id] = merged.get(item_id, 0) + quantity
+    if not merged:
+        raise ValueError('Nothing to check out')
+    return dict(sorted(merged.items()))
+
+def checkout(lines, user_name, user_email=None, purpose=None):
+    """
+    Take stock for every line and record the transactions in one commit.
+    
+    Args:
+        lines: Iterable of (item_id, quantity); repeated items are merged
+        user_name: Name of the person taking the items
+        user_email: Optional address for a confirmation email
+        purpose: Optional reason, stored on every transaction
+    
+    Returns:
+        list: The committed Transaction rows, in item id order
+    
+    Raises:
+        ValueError: If the request itself is invalid
+        InsufficientStockError: If any item is missing or short; nothing is
+            committed and ``shortages`` lists every failing line
+    """
+    if not user_name:
+        raise ValueError('Your name is required')
+    merged = merge_lines(lines)
+    
+    names = dict(db.session.execute(
+        db.select(Item.id, Item.name).where(Item.id.in_(list(merged)))).all())
+    
+    shortages = []
+    for item_id, quantity in merged.items():
+        if item_id not in names or not Item.take_stock(item_id, quantity):
+            shortages.append({'item_id': item_id, 'name': names.get(item_id), 'requested': quantity})
+    
+    if shortages:
+        db.session.rollback()
+        available = dict(db.session.execute(
+            db.select(Item.id, Item.quantity).where(Item.id.in_([s['item_id'] for s in shortages]))).all())
+        for shortage in shortages:
+            shortage['available'] = available.get(shortage['item_id'], 0)
+        raise InsufficientStockError(shortages)
+    
+    transactions = [Transaction(item_id=item_id, user_name=user_name, user_email=user_email or None,
+                                quantity=quantity, purpose=purpose or None)
+                    for item_id, quantity in merged.items()]
+    db.session.add_all(transactions)
+    
+    _queue_notifications(user_name, user_email, purpose,
+                         [(names[item_id], quantity) for item_id, quantity in merged.items()])
+    
+    db.session.commit()
+    return transactions
+
+def _queue_notifications(user_name, user_email, purpose, taken):
+    """Queue one email per recipient for the whole checkout."""
+    if len(taken) == 1:
+        item_name, quantity = taken[0]
+        email_content = create_item_taken_email(user_name, user_email, item_name, quantity, purpose)
+        admin_subject = f'Item Taken: {item_name}'
+        user_subject = f'Confirmation: You took {item_name}'
+    else:
+        email_content = create_checkout_email(user_name, user_email, taken, purpose)
+        admin_subject = f'Items Taken: {len(taken)} items by {user_name}'
+        user_subject = f'Confirmation: You took {len(taken)} items'
+    
+    # Send to admin, unless admin notifications are batched into a digest
+    admin_email = os.getenv('ADMIN_EMAIL')
+    if admin_email and not admin_digest_enabled():
+        enqueue_email(admin_email, admin_subject, email_content)
+    
+    # Send to user if email provided
+    if user_email:
+        enqueue_email(user_email, user_subject, email_content)
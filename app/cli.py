@@ -0,0 +1,281 @@
+"""Flask CLI commands for maintenance tasks."""
+import os
+import sqlite3
+import click
+from datetime import datetime
+from flask.cli import AppGroup
+from app import db
+
+outbox_cli = AppGroup('outbox', help='Manage the email outbox.')
+
+@outbox_cli.command('dispatch')
+def outbox_dispatch():
+    """Deliver all due messages now."""
+    from app.outbox import dispatch_pending
+    from app.utils import EmailNotConfiguredError, check_email_configured
+    try:
+        check_email_configured()
+    except EmailNotConfiguredError as e:
+        raise click.ClickException(f'{e}; queued messages stay pending until it is.')
+    sent, failed = dispatch_pending()
+    click.echo(f'Sent {sent} message(s), {failed} failed.')
+
+@outbox_cli.command('status')
+def outbox_status():
+    """Show message counts per status."""
+    from app.models import EmailOutbox
+    rows = (db.session.query(EmailOutbox.status, db.func.count(EmailOutbox.id))
+            .group_by(EmailOutbox.status).all())
+    for status, count in rows:
+        click.echo(f'{status}: {count}')
+
+@outbox_cli.command('retry-dead')
+def outbox_retry_dead():
+    """Move dead-lettered messages back to pending."""
+    from app.models import EmailOutbox
+    count = (EmailOutbox.query.filter_by(status='dead')
+             .update({'status': 'pending', 'attempts': 0, 'next_attempt_at': datetime.utcnow()},
+                     synchronize_session=False))
+    db.session.commit()
+    click.echo(f'Requeued {count} message(s).')
+
+digest_cli = AppGroup('digest', help='Admin notification digests.')
+
+@digest_cli.command('send')
+def digest_send():
+    """Queue the admin digest now instead of waiting for the next window."""
+    from app.digest import JOB_NAME, admin_digest_enabled
+    from app.scheduler import run_job
+    if not admin_digest_enabled():
+        raise click.ClickException('ADMIN_DIGEST_MINUTES is not set; digests are disabled.')
+    run_job(JOB_NAME)
+    click.echo('Digest queued.')
+
+qr_cli = AppGroup('qr', help='Manage QR code images.')
+
+@qr_cli.command('gc')
+@click.option('--dry-run', is_flag=True, help='Only report what would be removed.')
+def qr_gc(dry_run):
+    """Remove QR images no item references and fix outdated item paths."""
+    from app.models import Item
+    from app.utils import qr_code_path, qr_codes_dir
+    
+    referenced = set()
+    outdated = []
+    rows = db.session.execute(db.select(Item.id, Item.name, Item.qr_code_path)
+                              .execution_options(yield_per=1000))
+    for item_id, name, current_path in rows:
+        expected = qr_code_path(item_id, name)
+        referenced.add(os.path.basename(expected))
+        if current_path != expected:
+            outdated.append({'id': item_id, 'qr_code_path': expected})
+    
+    if outdated and not dry_run:
+        db.session.execute(db.update(Item).execution_options(changed_ids=[row['id'] for row in outdated]),
+                           outdated)
+        db.session.commit()
+    
+    removed = 0
+    qr_dir = qr_codes_dir()
+    if os.path.isdir(qr_dir):
+        for filename in os.listdir(qr_dir):
+            if filename.endswith('.png') and filename not in referenced:
+                removed += 1
+                if not dry_run:
+                    os.remove(os.path.join(qr_dir, filename))
+    
+    prefix = 'Would remove' if dry_run else 'Removed'
+    click.echo(f'{prefix} {removed} unreferenced image(s); {len(outdated)} item path(s) outdated.')
+
+labels_cli = AppGroup('labels', help='Printable QR label sheets.')
+
+@labels_cli.command('render')
+@click.option('--all', 'all_items', is_flag=True, help='Label every item.')
+@click.option('--id', 'item_ids', type=int, multiple=True, help='Item id to label (repeatable).')
+@click.option('--format', 'fmt', type=click.Choice(['pdf', 'png']), default='pdf', show_default=True)
+@click.option('--workers', type=int, help='Render processes (default LABEL_WORKERS or CPU count).')
+@click.option('-o', '--output', 'output_path', required=True, help='File to write.')
+def labels_render(all_items, item_ids, fmt, workers, output_path):
+    """Render QR label sheets for the given items."""
+    import shutil
+    import time
+    from app.labels import label_items, render_label_sheets
+    
+    if all_items == bool(item_ids):
+        raise click.UsageError('Pass either --all or at least one --id.')
+    
+    items = label_items(None if all_items else list(item_ids))
+    if not items:
+        raise click.ClickException('No matching items.')
+    
+    started = time.perf_counter()
+    output, _, extension = render_label_sheets(items, fmt, workers=workers)
+    with output, open(output_path, 'wb') as target:
+        shutil.copyfileobj(output, target)
+    click.echo(f'Wrote {len(items)} label(s) to {output_path} ({extension}) '
+               f'in {time.perf_counter() - started:.1f}s.')
+
+items_cli = AppGroup('items', help='Bulk item maintenance.')
+
+@items_cli.command('import')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--skip-existing', is_flag=True, help='Reject rows whose item name already exists.')
+def items_import(path, skip_existing):
+    """Add or update items from a CSV or Excel (.xlsx) file."""
+    import time
+    from app.imports import import_items, read_import_rows
+    
+    fmt = os.path.splitext(path)[1].lower().lstrip('.')
+    started = time.perf_counter()
+    with open(path, 'rb') as source:
+        try:
+            report = import_items(read_import_rows(source, fmt), update_existing=not skip_existing)
+        except ValueError as e:
+            raise click.ClickException(str(e))
+    
+    for error in report['errors']:
+        click.echo(f'Row {error["row"]} ({error["name"] or "no name"}): {error["error"]}', err=True)
+    if report['read_error']:
+        click.echo(f'{report["read_error"]}; the rest of the file was not imported.', err=True)
+    click.echo(f'Inserted {report["inserted"]}, updated {report["updated"]}, '
+               f'rejected {report["error_count"]} row(s) in {time.perf_counter() - started:.1f}s.')
+
+ledger_cli = AppGroup('ledger', help='Transaction rollups and archival.')
+
+@ledger_cli.command('rollup')
+def ledger_rollup():
+    """Rebuild the daily usage rollups from the ledger and its archive."""
+    from app.ledger import rebuild_rollups
+    click.echo(f'Rebuilt {rebuild_rollups()} item-day rollup row(s).')
+
+@ledger_cli.command('usage')
+@click.option('--days', type=int, default=30, show_default=True, help='Days of history to include.')
+@click.option('--limit', type=int, default=20, show_default=True, help='Items to list.')
+def ledger_usage(days, limit):
+    """Show the most used items over the last N days, from the rollups."""
+    from datetime import timedelta
+    from app.ledger import usage_by_item
+    from app.models import Item
+    
+    usage = usage_by_item(since=datetime.utcnow().date() - timedelta(days=days - 1))[:limit]
+    names = dict(db.session.query(Item.id, Item.name).filter(Item.id.in_([row[0] for row in usage])))
+    for item_id, quantity, count in usage:
+        click.echo(f'{names.get(item_id, f"#{item_id} (deleted)")}: {quantity} taken in {count} transaction(s)')
+
+@ledger_cli.command('archive')
+@click.option('--older-than', 'older_than', type=int, required=True,
+              help='Archive transactions from before this many days ago.')
+@click.option('--dry-run', is_flag=True, help='Only count the transactions that would move.')
+def ledger_archive(older_than, dry_run):
+    """Move old transactions into the archive database."""
+    from app.ledger import archive_transactions
+    try:
+        result = archive_transactions(older_than, dry_run=dry_run)
+    except ValueError as e:
+        raise click.ClickException(str(e))
+    verb = 'Would move' if dry_run else 'Moved'
+    click.echo(f"{verb} {result['moved']} transaction(s) from before {result['cutoff']:%Y-%m-%d} "
+               f"to {result['path']}.")
+    if result['left']:
+        click.echo(f"Left {result['left']} transaction(s) whose ids belong to other archived rows.", err=True)
+
+forecast_cli = AppGroup('forecast', help='Stock forecasts and reorder points.')
+
+@forecast_cli.command('run')
+def forecast_run():
+    """Recompute burn rates and reorder points for every item now."""
+    from app.forecast import refresh_forecasts
+    refresh_forecasts()
+
+backup_cli = AppGroup('backup', help='Online database backups.')
+
+@backup_cli.command('create')
+def backup_create():
+    """Take a compressed snapshot of the live database."""
+    from app.backup import create_backup
+    try:
+        result = create_backup()
+    except (RuntimeError, OSError, sqlite3.DatabaseError) as e:
+        raise click.ClickException(str(e))
+    click.echo(f"Wrote {result['path']} ({result['size'] / 1e6:.1f} MB) in {result['seconds']:.1f}s: "
+               f"{result['pages']} pages in {result['steps']} steps, longest step {result['max_step_ms']:.1f} ms, "
+               f"median {result['median_step_ms']:.1f} ms, {result['restarts']} restart(s).")
+    if result['single_step']:
+        click.echo('Writes kept restarting the backup; the rest was copied in one step.')
+    for path in result['removed']:
+        click.echo(f'Removed old snapshot {path}')
+
+@backup_cli.command('list')
+def backup_list():
+    """List snapshots, newest first."""
+    from app.backup import list_backups, backup_dir
+    backups = list_backups()
+    if not backups:
+        click.echo(f'No snapshots in {backup_dir()}.')
+    for path, size, modified in backups:
+        click.echo(f'{modified:%Y-%m-%d %H:%M:%S}  {size / 1e6:>8.1f} MB  {os.path.basename(path)}')
+
+@backup_cli.command('verify')
+@click.argument('name')
+def backup_verify(name):
+    """Check a snapshot's integrity."""
+    from app.backup import resolve_backup, verify_backup
+    try:
+        result = verify_backup(resolve_backup(name))
+    except (OSError, sqlite3.DatabaseError) as e:
+        raise click.ClickException(str(e))
+    click.echo(f"Integrity: {result['integrity']}; schema version {result['schema_version']}, "
+               f"{result['items']} item(s), {result['transactions']} transaction(s).")
+    if not result['ok']:
+        raise click.ClickException('Snapshot failed verification.')
+
+@backup_cli.command('restore')
+@click.argument('name')
+@click.option('--yes', is_flag=True, help='Do not ask for confirmation.')
+def backup_restore(name, yes):
+    """Replace the live database with a snapshot."""
+    from app.backup import resolve_backup, restore_backup
+    try:
+        path = resolve_backup(name)
+    except OSError as e:
+        raise click.ClickException(str(e))
+    if not yes:
+        click.confirm(f'Replace the live database with {os.path.basename(path)}?', abort=True)
+    try:
+        result = restore_backup(path)
+    except (ValueError, OSError, sqlite3.DatabaseError) as e:
+        raise click.ClickException(str(e))
+    click.echo(f"Restored {path}; the previous database was saved as {result['pre_restore']}.")
+    if result['upgraded']:
+        click.echo(f"Upgraded the restored schema from version {result['verified']['schema_version']} "
+                   f"to {result['upgraded'][-1]}.")
+    click.echo('Restart the app workers so no per-process state from before the restore is kept.')
+
+db_cli = AppGroup('db', help='Database schema management.')
+
+@db_cli.command('upgrade')
+def db_upgrade():
+    """Create missing tables and apply pending schema migrations."""
+    from app.migrations import upgrade_database, latest_version
+    applied = upgrade_database()
+    click.echo(f'Applied {len(applied)} migration(s); schema is at version {latest_version()}.')
+
+@db_cli.command('version')
+def db_version():
+    """Show the database schema version and the latest known migration."""
+    from app.migrations import current_version, latest_version
+    with db.engine.connect() as connection:
+        version = current_version(connection)
+    click.echo(f'Database schema version {version}, latest migration {latest_version()}.')
+
+def register_commands(app):
+    """Attach all CLI command groups to the app."""
+    app.cli.add_command(db_cli)
+    app.cli.add_command(outbox_cli)
+    app.cli.add_command(digest_cli)
+    app.cli.add_command(qr_cli)
+    app.cli.add_command(labels_cli)
+    app.cli.add_command(items_cli)
+    app.cli.add_command(ledger_cli)
+    app.cli.add_command(forecast_cli)
+    app.cli.add_command(backup_cli)
@@ -0,0 +1,119 @@
+"""Periodic admin digest replacing one email per add/take event.
+
+When ``ADMIN_DIGEST_MINUTES`` is set, ``add_item`` and ``take_item`` stop
+emailing the admin directly.  A scheduled job instead collects the items
+added and the transactions recorded since its last run, identified by id
+watermarks kept on the job row, and queues a single summary email.
+Confirmation emails to users are unaffected.
+"""
+import os
+from datetime import datetime
+from app import db
+from app.forecast import days_remaining_expr
+from app.models import Item, ItemForecast, Transaction
+from app.outbox import enqueue_email
+from app.scheduler import register_job
+from app.utils import create_admin_digest_email
+
+JOB_NAME = 'admin_digest'
+
+def digest_interval_minutes():
+    """Return the configured digest window in minutes, 0 when disabled."""
+    return int(os.getenv('ADMIN_DIGEST_MINUTES', 0))
+
+def admin_digest_enabled():
+    """True when admin notifications should be batched into a digest."""
+    return digest_interval_minutes() > 0
+
+def _current_watermark():
+    return {
+        'last_transaction_id': db.session.query(db.func.max(Transaction.id)).scalar() or 0,
+        'last_item_id': db.session.query(db.func.max(Item.id)).scalar() or 0,
+        'since': datetime.utcnow().isoformat(),
+    }
+
+def build_digest(last_transaction_id, last_item_id):
+    """
+    Collect everything recorded after the given watermarks.
+    
+    Returns:
+        dict: new_items, rollups (one per item taken from, with the days of
+        stock left at its forecast burn rate), and the new watermark ids
+    """
+    # Fix the upper bounds first so rows committed while we read are left
+    # for the next digest instead of being skipped
+    max_transaction_id = db.session.query(db.func.max(Transaction.id)).scalar() or 0
+    max_item_id = db.session.query(db.func.max(Item.id)).scalar() or 0
+    # Stock-count adjustments are not usage; they are reviewed on the stock count itself
+    in_window = db.and_(Transaction.id > last_transaction_id, Transaction.id <= max_transaction_id,
+                        Transaction.kind == 'take')
+    
+    new_items = (db.session.query(Item.id, Item.name, Item.quantity, Item.description)
+                 .filter(Item.id > last_item_id, Item.id <= max_item_id)
+                 .order_by(Item.id)
+                 .all())
+    
+    totals = (db.session.query(Item.id, Item.name, Item.quantity,
+                               db.func.sum(Transaction.quantity),
+                               db.func.count(Transaction.id),
+                               days_remaining_expr())
+              .join(Transaction, Transaction.item_id == Item.id)
+              .outerjoin(ItemForecast, ItemForecast.item_id == Item.id)
+              .filter(in_window)
+              .group_by(Item.id)
+              .order_by(db.func.sum(Transaction.quantity).desc())
+              .all())
+    
+    takers = (db.session.query(Transaction.item_id, Transaction.user_name,
+                               db.func.sum(Transaction.quantity))
+              .filter(in_window)
+              .group_by(Transaction.item_id, Transaction.user_name)
+              .order_by(Transaction.item_id, db.func.sum(Transaction.quantity).desc())
+              .all())
+    takers_by_item = {}
+    for item_id, user_name, quantity in takers:
+        takers_by_item.setdefault(item_id, []).append((user_name, quantity))
+    
+    rollups = [{
+        'item_id': item_id,
+        'name': name,
+        'current_stock': stock,
+        'total_taken': total,
+        'transaction_count': count,
+        'takers': takers_by_item.get(item_id, []),
+        'days_remaining': days_remaining,
+    } for item_id, name, stock, total, count, days_remaining in totals]
+    
+    return {
+        'new_items': new_items,
+        'rollups': rollups,
+        'last_transaction_id': max(last_transaction_id, max_transaction_id),
+        'last_item_id': max(last_item_id, max_item_id),
+    }
+
+def send_admin_digest(job):
+    """Scheduled job: queue one digest email covering the last window."""
+    state = job.state or _current_watermark()
+    digest = build_digest(state['last_transaction_id'], state['last_item_id'])
+    now = datetime.utcnow()
+    
+    admin_email = os.getenv('ADMIN_EMAIL')
+    if admin_email and (digest['new_items'] or digest['rollups']):
+        since = datetime.fromisoformat(state['since'])
+        email_content = create_admin_digest_email(since, now, digest['new_items'], digest['rollups'])
+        enqueue_email(admin_email, f'Inventory Digest: {since:%Y-%m-%d %H:%M} - {now:%H:%M} UTC',
+                      email_content)
+    
+    # Reassign rather than mutate so the JSON column is flagged as changed
+    job.state = {
+        'last_transaction_id': digest['last_transaction_id'],
+        'last_item_id': digest['last_item_id'],
+        'since': now.isoformat(),
+    }
+    db.session.commit()
+
+def register_digest_job():
+    """Schedule the digest if ADMIN_DIGEST_MINUTES is configured."""
+    if admin_digest_enabled():
+        register_job(JOB_NAME, digest_interval_minutes() * 60, send_admin_digest,
+                     initial_state=_current_watermark)
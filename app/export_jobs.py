@@ -0,0 +1,254 @@
+"""Background export jobs with cached, incrementally refreshed files.
+
+An export request becomes an ``ExportJob`` row that any worker can report
+on.  The file is built in a small per-process thread pool and cached under
+``EXPORT_CACHE_DIR``, keyed by a watermark of the data it contains:
+
+- items: row count, highest id and latest ``updated_at``
+- transactions: highest id and the number of rows up to it
+
+A repeat request with an unchanged watermark is served from the cache at
+once.  The transaction ledger is cached as CSV in id order (the order of
+every transaction export, see ``app.exports``), so a newer
+watermark only appends the rows added since the last cached file instead
+of re-reading the whole table; the Excel variant is then converted from
+that CSV.  Item names in cached ledger rows are the names at the time the
+row was first exported.
+"""
+import csv
+import glob
+import hashlib
+import json
+import os
+import shutil
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from flask import current_app
+from app import db
+from app.models import ExportJob, Item, Transaction
+from app.exports import (ITEM_COLUMNS, TRANSACTION_COLUMNS, iter_item_rows,
+                         transaction_rows_query, format_transaction_rows, write_xlsx)
+
+EXPORT_KINDS = ('items', 'transactions')
+EXPORT_FORMATS = ('xlsx', 'csv')
+
+# Part of every cache key; bump it when the exported columns change so
+# files cached in the old layout are neither served nor appended to
+EXPORT_CACHE_VERSION = 2
+
+_executor = None
+_executor_pid = None
+_executor_lock = threading.Lock()
+
+def _get_executor():
+    global _executor, _executor_pid
+    with _executor_lock:
+        if _executor is None or _executor_pid != os.getpid():
+            _executor = ThreadPoolExecutor(max_workers=int(os.getenv('EXPORT_WORKERS', 2)),
+                                           thread_name_prefix='export')
+            _executor_pid = os.getpid()
+        return _executor
+
+def cache_dir():
+    path = current_app.config['EXPORT_CACHE_DIR']
+    os.makedirs(path, exist_ok=True)
+    return path
+
+def data_watermark(kind):
+    """Return a small dict that changes whenever the export's contents would."""
+    if kind == 'items':
+        count, max_id, max_updated = db.session.query(
+            db.func.count(Item.id), db.func.max(Item.id), db.func.max(Item.updated_at)).one()
+        return {'count': count, 'max_id': max_id or 0,
+                'max_updated_at': max_updated.isoformat() if max_updated else None}
+    
+    max_id = db.session.query(db.func.max(Transaction.id)).scalar() or 0
+    count = db.session.query(db.func.count(Transaction.id)).filter(Transaction.id <= max_id).scalar()
+    return {'count': count, 'max_id': max_id}
+
+def _cache_path(kind, fmt, watermark):
+    keyed = {**watermark, 'version': EXPORT_CACHE_VERSION}
+    key = hashlib.sha1(json.dumps(keyed, sort_keys=True).encode()).hexdigest()[:16]
+    return os.path.join(cache_dir(), f'{kind}-{key}.{fmt}')
+
+def _replace(tmp_path, path):
+    os.replace(tmp_path, path)
+    return path
+
+def _write_items(path, fmt):
+    tmp_path = f'{path}.{uuid.uuid4().hex}.tmp'
+    if fmt == 'csv':
+        with open(tmp_path, 'w', newline='') as output:
+            writer = csv.writer(output)
+            writer.writerow(ITEM_COLUMNS)
+            writer.writerows(iter_item_rows())
+    else:
+        with open(tmp_path, 'wb') as output:
+            write_xlsx(output, 'Items', ITEM_COLUMNS, iter_item_rows())
+    return _replace(tmp_path, path)
+
+def _ledger_rows(after_id, upto_id):
+    query = (transaction_rows_query()
+             .where(Transaction.id > after_id, Transaction.id <= upto_id)
+             .order_by(Transaction.id))
+    return format_transaction_rows(db.session.execute(query))
+
+def _latest_cached_ledger():
+    """Return (path, watermark) of the newest cached ledger CSV, or (None, None)."""
+    best = (None, None)
+    for meta_path in glob.glob(os.path.join(cache_dir(), 'transactions-*.csv.json')):
+        csv_path = meta_path[:-len('.json')]
+        if not os.path.exists(csv_path):
+            continue
+        with open(meta_path) as meta:
+            watermark = json.load(meta)
+        if watermark.pop('version', None) != EXPORT_CACHE_VERSION:
+            continue
+        if best[1] is None or watermark['max_id'] > best[1]['max_id']:
+            best = (csv_path, watermark)
+    return best
+
+def _write_ledger_csv(path, watermark):
+    """Build the ledger CSV for ``watermark``, appending to a cached one when possible."""
+    tmp_path = f'{path}.{uuid.uuid4().hex}.tmp'
+    base_path, base = _latest_cached_ledger()
+    
+    appendable = False
+    if base_path and base['max_id'] <= watermark['max_id']:
+        # Only valid if no row at or below the cached watermark was removed since
+        added = (db.session.query(db.func.count(Transaction.id))
+                 .filter(Transaction.id > base['max_id'], Transaction.id <= watermark['max_id'])
+                 .scalar())
+        appendable = base['count'] + added == watermark['count']
+    
+    if appendable:
+        shutil.copyfile(base_path, tmp_path)
+        with open(tmp_path, 'a', newline='') as output:
+            csv.writer(output).writerows(_ledger_rows(base['max_id'], watermark['max_id']))
+    else:
+        with open(tmp_path, 'w', newline='') as output:
+            writer = csv.writer(output)
+            writer.writerow(TRANSACTION_COLUMNS)
+            writer.writerows(_ledger_rows(0, watermark['max_id']))
+    
+    _replace(tmp_path, path)
+    with open(f'{path}.json', 'w') as meta:
+        json.dump({**watermark, 'version': EXPORT_CACHE_VERSION}, meta)
+    return path
+
+def _csv_to_xlsx(csv_path, path, sheet_name, columns, int_columns):
+    def rows():
+        with open(csv_path, newline='') as source:
+            reader = csv.reader(source)
+            next(reader)
+            for row in reader:
+                for index in int_columns:
+                    row[index] = int(row[index])
+                yield row
+    
+    tmp_path = f'{path}.{uuid.uuid4().hex}.tmp'
+    with open(tmp_path, 'wb') as output:
+        write_xlsx(output, sheet_name, columns, rows())
+    return _replace(tmp_path, path)
+
+def _build(kind, fmt, watermark):
+    path = _cache_path(kind, fmt, watermark)
+    if os.path.exists(path):
+        return path
+    
+    if kind == 'items':
+        return _write_items(path, fmt)
+    
+    csv_path = _cache_path(kind, 'csv', watermark)
+    if not os.path.exists(csv_path):
+        _write_ledger_csv(csv_path, watermark)
+    if fmt == 'csv':
+        return csv_path
+    return _csv_to_xlsx(csv_path, path, 'Transactions', TRANSACTION_COLUMNS, int_columns=(0, 5))
+
+def _prune_cache(kind, fmt):
+    """Keep only the newest EXPORT_CACHE_KEEP files per kind and format."""
+    keep = int(os.getenv('EXPORT_CACHE_KEEP', 3))
+    paths = sorted(glob.glob(os.path.join(cache_dir(), f'{kind}-*.{fmt}')), key=os.path.getmtime, reverse=True)
+    for path in paths[keep:]:
+        for stale in (path, f'{path}.json'):
+            if os.path.exists(stale):
+                os.remove(stale)
+
+def _run_job(app, job_id):
+    with app.app_context():
+        try:
+            job = db.session.get(ExportJob, job_id)
+            job.status = 'running'
+            job.started_at = datetime.utcnow()
+            db.session.commit()
+            job.file_path = _build(job.kind, job.format, job.watermark)
+            job.status = 'done'
+        except Exception as e:
+            db.session.rollback()
+            print(f"Export job {job_id} failed: {str(e)}")
+            job = db.session.get(ExportJob, job_id)
+            if job is None:
+                return
+            job.status = 'failed'
+            job.error = str(e)
+        job.finished_at = datetime.utcnow()
+        db.session.commit()
+        if job.status == 'done':
+            for fmt in EXPORT_FORMATS:
+                _prune_cache(job.kind, fmt)
+
+def submit_export(kind, fmt):
+    """
+    Start an export, or reuse a cached file or an identical job in progress.
+    
+    Args:
+        kind: 'items' or 'transactions'
+        fmt: 'xlsx' or 'csv'
+    
+    Returns:
+        ExportJob: The job, already 'done' when served from the cache
+    """
+    if kind not in EXPORT_KINDS or fmt not in EXPORT_FORMATS:
+        raise ValueError(f'Unknown export {kind}.{fmt}')
+    
+    watermark = data_watermark(kind)
+    
+    in_progress = (ExportJob.query
+                   .filter(ExportJob.kind == kind, ExportJob.format == fmt,
+                           ExportJob.status.in_(('queued', 'running')))
+                   .order_by(ExportJob.created_at.desc())
+                   .all())
+    for job in in_progress:
+        if job.watermark == watermark and not _is_stale(job):
+            return job
+    
+    job = ExportJob(id=uuid.uuid4().hex, kind=kind, format=fmt, watermark=watermark)
+    cached = _cache_path(kind, fmt, watermark)
+    if os.path.exists(cached):
+        job.status = 'done'
+        job.file_path = cached
+        job.finished_at = datetime.utcnow()
+    db.session.add(job)
+    db.session.commit()
+    
+    if job.status == 'queued':
+        _get_executor().submit(_run_job, current_app._get_current_object(), job.id)
+    return job
+
+def _is_stale(job):
+    """True for a job whose worker most likely died before finishing it."""
+    timeout = timedelta(seconds=int(os.getenv('EXPORT_JOB_TIMEOUT_SECONDS', 1800)))
+    started = job.started_at or job.created_at
+    return started is not None and datetime.utcnow() - started > timeout
+
+def get_job(job_id):
+    """Return the job, marking it failed if its worker appears to have died."""
+    job = db.session.get(ExportJob, job_id)
+    if job is not None and job.status in ('queued', 'running') and _is_stale(job):
+        job.status = 'failed'
+        job.error = 'Export timed out'
+        db.session.commit()
+    return job
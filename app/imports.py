@@ -0,0 +1,241 @@
+"""Bulk item import from CSV or Excel files.
+
+Rows are read lazily (``csv`` or openpyxl's ``read_only`` mode) and
+validated against a set of existing item names loaded in one query, so
+no row needs its own lookup.  Valid rows are written in chunks of
+``IMPORT_CHUNK_SIZE``: new items in one executemany INSERT, existing items
+in one executemany UPDATE by primary key, each chunk in its own
+transaction.  QR images are left to be rendered on first view, and the
+admin gets a single summary email through the outbox.
+"""
+import csv
+import io
+import os
+import zipfile
+from datetime import datetime
+from sqlalchemy.exc import SQLAlchemyError
+from app import db
+from app.models import Item
+from app.changes import mark_changed
+from app.outbox import enqueue_email
+from app.digest import admin_digest_enabled
+from app.utils import qr_code_path, create_items_imported_email
+
+IMPORT_FORMATS = ('csv', 'xlsx')
+
+# Accepted header spellings, including the columns of our own item export
+_HEADER_ALIASES = {
+    'name': 'name', 'item': 'name', 'item name': 'name',
+    'description': 'description',
+    'quantity': 'quantity', 'qty': 'quantity', 'stock': 'quantity',
+}
+
+_NAME_LENGTH = Item.__table__.c.name.type.length
+
+def _chunk_size():
+    return int(os.getenv('IMPORT_CHUNK_SIZE', 1000))
+
+def _columns(header, aliases, key_fields):
+    columns = {}
+    for index, title in enumerate(header):
+        field = aliases.get(str(title or '').strip().lower())
+        if field and field not in columns:
+            columns[field] = index
+    if not any(field in columns for field in key_fields):
+        titles = ' or '.join(f'"{field.upper() if field == "id" else field.title()}"' for field in key_fields)
+        raise ValueError(f'The file has no {titles} column')
+    return columns
+
+def _iter_csv(fileobj):
+    try:
+        yield from csv.reader(io.TextIOWrapper(fileobj, encoding='utf-8-sig', newline=''))
+    except (UnicodeDecodeError, csv.Error) as e:
+        raise ValueError(f'The file is not a readable UTF-8 CSV file ({e})') from e
+
+def _iter_xlsx(fileobj):
+    from openpyxl import load_workbook
+    from openpyxl.utils.exceptions import InvalidFileException
+    # A damaged workbook or another file renamed to .xlsx fails in zipfile or
+    # on a missing archive member, at open or while streaming the sheet
+    errors = (zipfile.BadZipFile, InvalidFileException, KeyError)
+    try:
+        workbook = load_workbook(fileobj, read_only=True, data_only=True)
+    except errors as e:
+        raise ValueError(f'The file is not a readable Excel (.xlsx) workbook ({e})') from e
+    try:
+        yield from workbook.worksheets[0].iter_rows(values_only=True)
+    except errors as e:
+        raise ValueError(f'The Excel (.xlsx) workbook is damaged ({e})') from e
+    finally:
+        workbook.close()
+
+def read_import_rows(fileobj, fmt, aliases=None, key_fields=('name',)):
+    """
+    Read item rows from an uploaded file.
+    
+    Args:
+        fileobj: Binary file object
+        fmt: 'csv' or 'xlsx'
+        aliases: Header spelling to field name (default: the item import columns)
+        key_fields: Fields of which the header must contain at least one
+    
+    Yields:
+        tuple: (row number in the file, dict of the fields present in the
+        header; for items 'name' and any of 'description' and 'quantity')
+    
+    Raises:
+        ValueError: If the file type is unsupported, the header lacks the key
+            columns, or the file cannot be read or decoded (possibly only
+            part-way through, since rows are read lazily)
+    """
+    if fmt not in IMPORT_FORMATS:
+        raise ValueError(f'Unsupported file type {fmt}; upload a CSV or Excel (.xlsx) file')
+    rows = _iter_csv(fileobj) if fmt == 'csv' else _iter_xlsx(fileobj)
+    
+    header = next(rows, None)
+    if header is None:
+        raise ValueError('The file is empty')
+    columns = _columns(header, aliases or _HEADER_ALIASES, key_fields)
+    
+    for number, row in enumerate(rows, 2):
+        if not any(value not in (None, '') for value in row):
+            continue
+        yield number, {field: row[index] if index < len(row) else None
+                       for field, index in columns.items()}
+
+def _validate(values):
+    """Return (cleaned values, None) or (None, error message) for one row."""
+    name = str(values['name'] if values['name'] is not None else '').strip()
+    if not name:
+        return None, 'Name is required'
+    if len(name) > _NAME_LENGTH:
+        return None, f'Name is longer than {_NAME_LENGTH} characters'
+    cleaned = {'name': name}
+    
+    if 'description' in values:
+        description = values['description']
+        cleaned['description'] = str(description).strip() if description is not None else ''
+    
+    if 'quantity' in values:
+        quantity = values['quantity']
+        if quantity is None or str(quantity).strip() == '':
+            quantity = 0
+        try:
+            number = float(str(quantity).strip())
+            whole = int(number)
+        except (ValueError, OverflowError):
+            return None, f'Quantity "{quantity}" is not a number'
+        if number != whole or number < 0:
+            return None, f'Quantity "{quantity}" must be a whole number of 0 or more'
+        cleaned['quantity'] = whole
+    return cleaned, None
+
+def _write_chunk(inserts, updates):
+    """Write one chunk in a single transaction; returns the names inserted with their ids."""
+    now = datetime.utcnow()
+    inserted = []
+    if inserts:
+        rows = [{'description': '', 'quantity': 0, **values, 'created_at': now, 'updated_at': now}
+                for values in inserts]
+        result = db.session.execute(db.insert(Item).returning(Item.id, Item.name)
+                                    .execution_options(changed_ids=[]), rows)
+        inserted = result.all()
+        # The QR image itself is rendered the first time someone views it
+        db.session.execute(db.update(Item).execution_options(changed_ids=[]),
+                           [{'id': item_id, 'qr_code_path': qr_code_path(item_id, name)}
+                            for item_id, name in inserted])
+        mark_changed('items', [item_id for item_id, _ in inserted])
+    if updates:
+        db.session.execute(db.update(Item).execution_options(changed_ids=[row['id'] for row in updates]),
+                           [{**values, 'updated_at': now} for values in updates])
+    db.session.commit()
+    return inserted
+
+def _read_until_error(rows, report):
+    """Yield rows until the file turns out unreadable; the error goes in the report."""
+    number = None
+    try:
+        for number, values in rows:
+            yield number, values
+    except ValueError as e:
+        # Earlier chunks are already committed, so report what was saved
+        if number is None:
+            raise
+        report['read_error'] = f'Reading stopped after row {number}: {e}'
+
+def import_items(rows, update_existing=True):
+    """
+    Insert new items and update existing ones, in chunked transactions.
+    
+    Args:
+        rows: Iterable of (row number, values) as yielded by read_import_rows
+        update_existing: Update items whose name already exists; otherwise
+            report those rows as errors
+    
+    Returns:
+        dict: inserted, updated and error counts, 'errors' as a list of
+        {'row', 'name', 'error'}, 'new_items' as (id, name) pairs, and
+        'read_error' if the file stopped being readable part-way through;
+        the rows read before it are saved and counted
+    
+    Raises:
+        ValueError: If the file cannot be read at all (nothing is saved)
+    """
+    existing = dict(db.session.execute(db.select(Item.name, Item.id)).all())
+    seen = {}
+    report = {'inserted': 0, 'updated': 0, 'errors': [], 'new_items': [], 'read_error': None}
+    
+    inserts, updates, chunk_rows = [], [], []
+    
+    def flush():
+        try:
+            inserted = _write_chunk(inserts, updates)
+        except SQLAlchemyError as e:
+            db.session.rollback()
+            for number, name in chunk_rows:
+                report['errors'].append({'row': number, 'name': name,
+                                         'error': f'Not saved, the batch failed: {e.__class__.__name__}'})
+        else:
+            report['inserted'] += len(inserted)
+            report['updated'] += len(updates)
+            report['new_items'].extend(inserted)
+        inserts.clear()
+        updates.clear()
+        chunk_rows.clear()
+    
+    for number, values in _read_until_error(rows, report):
+        cleaned, error = _validate(values)
+        name = cleaned['name'] if cleaned else str(values.get('name') or '')
+        if error is None and name in seen:
+            error = f'Duplicate of row {seen[name]}'
+        if error is None and name in existing and not update_existing:
+            error = 'An item with this name already exists'
+        if error:
+            report['errors'].append({'row': number, 'name': name, 'error': error})
+            continue
+        seen[name] = number
+        
+        if name in existing:
+            cleaned.pop('name')
+            if not cleaned:
+                continue
+            updates.append({'id': existing[name], **cleaned})
+        else:
+            inserts.append(cleaned)
+        chunk_rows.append((number, name))
+        if len(chunk_rows) >= _chunk_size():
+            flush()
+    if chunk_rows:
+        flush()
+    
+    report['error_count'] = len(report['errors'])
+    _notify_admin(report)
+    return report
+
+def _notify_admin(report):
+    """Queue one summary email for the whole import instead of one per item."""
+    admin_email = os.getenv('ADMIN_EMAIL')
+    if not admin_email or admin_digest_enabled() or not (report['inserted'] or report['updated']):
+        return
+    enqueue_email(admin_email, 'Items Imported into Inventory', create_items_imported_email(report))
+    db.session.commit()
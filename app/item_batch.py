@@ -0,0 +1,112 @@
+"""Batch item lookups for integrations and bulk scanners.
+
+Clients send many item ids or names at once and pick the fields they need.
+The whole list is bound as a single JSON parameter and expanded with
+``json_each``, so a lookup is one query with the same statement text
+whatever the batch size, and results come back in request order with a
+row for every key, found or not.  Results are streamed as JSON lines.
+
+The collection ETag is a hash of the requested keys, the fields, and the id
+and version of every matching item, read in a cheap first pass.  A client
+whose copy is current gets a 304 without any item being serialized.  The
+body is read after that pass, so a commit in between can make it newer
+than its ETag: the ETag is weak, and such a client only gets the full body
+again on its next request, never a 304 for data it does not have.
+"""
+import hashlib
+import json
+import os
+from app import db
+from app.models import Item
+
+# Item.to_dict() keys; 'id' is always returned
+BATCH_FIELDS = ['id', 'name', 'description', 'quantity', 'qr_code_path', 'created_at', 'updated_at', 'version']
+
+NDJSON_MIMETYPE = 'application/x-ndjson'
+
+BATCH_CHUNK_SIZE = 1000
+
+def _max_keys():
+    return int(os.getenv('ITEM_BATCH_MAX_KEYS', 10000))
+
+def parse_batch_request(ids=None, names=None, fields=None):
+    """
+    Validate a batch request.
+    
+    Args:
+        ids: Item ids to look up
+        names: Item names to look up
+        fields: Fields to return (default: all of BATCH_FIELDS)
+    
+    Returns:
+        tuple: (ids, names, fields) with duplicates removed, order kept
+    
+    Raises:
+        ValueError: If a key or field is invalid, or there are too many keys
+    """
+    if not all(isinstance(value, (list, tuple)) for value in (ids or [], names or [], fields or [])):
+        raise ValueError('ids, names and fields must be lists')
+    ids = list(dict.fromkeys(ids or []))
+    names = list(dict.fromkeys(names or []))
+    if any(not isinstance(item_id, int) or isinstance(item_id, bool) for item_id in ids):
+        raise ValueError('ids must be integers')
+    if any(not isinstance(name, str) for name in names):
+        raise ValueError('names must be strings')
+    if not ids and not names:
+        raise ValueError('Give at least one id or name')
+    if len(ids) + len(names) > _max_keys():
+        raise ValueError(f'At most {_max_keys()} ids and names per request')
+    
+    fields = list(dict.fromkeys(fields or BATCH_FIELDS))
+    unknown = [field for field in fields if field not in BATCH_FIELDS]
+    if unknown:
+        raise ValueError(f"Unknown field(s) {', '.join(map(str, unknown))}; "
+                         f"available: {', '.join(BATCH_FIELDS)}")
+    if 'id' not in fields:
+        fields.insert(0, 'id')
+    return ids, names, fields
+
+def _lookups(ids, names):
+    """(lookup column name, requested keys, join column) for each non-empty key list."""
+    return [(label, keys, column) for label, keys, column in
+            (('id', ids, Item.id), ('name', names, Item.name)) if keys]
+
+def _query(keys, column, *columns):
+    requested = db.func.json_each(json.dumps(keys)).table_valued('key', 'value')
+    return (db.select(requested.c.value, *columns)
+            .select_from(requested.outerjoin(Item, column == requested.c.value))
+            .order_by(requested.c.key))
+
+def batch_etag(ids, names, fields):
+    """Collection ETag for a parsed batch request (to be sent as a weak ETag)."""
+    digest = hashlib.sha1(json.dumps([ids, names, fields]).encode())
+    for _, keys, column in _lookups(ids, names):
+        for _, item_id, version in db.session.execute(_query(keys, column, Item.id, Item.version)):
+            digest.update(f'{item_id}:{version};'.encode())
+    return digest.hexdigest()[:20]
+
+def _format(value):
+    return value.isoformat() if hasattr(value, 'isoformat') else value
+
+def iter_batch_lines(ids, names, fields):
+    """
+    Yield one JSON line per requested key, ids first, in request order.
+    
+    Found items are objects with the requested fields; keys that match no
+    item yield ``{"id": ..., "error": "not found"}`` (or ``"name"``).
+    """
+    columns = [getattr(Item, field) for field in fields]
+    for label, keys, column in _lookups(ids, names):
+        # Item.id leads so a miss is told apart from a requested field that is NULL
+        query = _query(keys, column, Item.id, *columns).execution_options(yield_per=BATCH_CHUNK_SIZE)
+        lines = []
+        for key, found_id, *values in db.session.execute(query):
+            if found_id is None:
+                lines.append(json.dumps({label: key, 'error': 'not found'}))
+            else:
+                lines.append(json.dumps({field: _format(value) for field, value in zip(fields, values)}))
+            if len(lines) == BATCH_CHUNK_SIZE:
+                yield '\n'.join(lines) + '\n'
+                lines = []
+        if lines:
+            yield '\n'.join(lines) + '\n'
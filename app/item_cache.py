@@ -0,0 +1,224 @@
+"""Read-through cache of item details for the scan path.
+
+A QR scan requests the item API, then the item page and the take form, and
+the item page loads the QR image; each used to load and serialize the item
+on its own.  They now read ``get_item``, which returns the item as a dict
+(``Item.to_dict`` plus its QR digest) and only queries the database on a
+miss.  Entries carry the item's version, which is also its ETag.
+
+Backends (``ITEM_CACHE_BACKEND``):
+
+- ``sqlite`` (default): a small SQLite file shared by every worker on the
+  host (``ITEM_CACHE_PATH``, by default ``item_cache.db`` next to the
+  database).  A commit that writes items drops their entries for all
+  workers at once.  Nothing in it needs to survive a crash, so it is
+  written without syncing.
+- ``memory``: a per-worker LRU of ``ITEM_CACHE_SIZE`` entries, also used
+  when the shared file cannot be opened.  Commits in other workers do not
+  reach it, so every hit is checked against the item's current version
+  with a primary-key lookup.
+
+Entries are invalidated after every commit that writes items (see
+``app.changes``).  Each invalidation bumps a per-item generation (and
+clearing everything bumps a global one), and a miss only stores what it
+loaded if neither changed in the meantime, so a reader that loaded the old
+row just before a commit cannot put it back afterwards.  Stock shown on the take form therefore lags a commit by at
+most the time it takes the committing worker to run its after-commit
+hooks; the stock check itself is always made by the checkout UPDATE.
+"""
+import json
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+from app import db
+from app.changes import on_commit
+from app.metrics import increment
+from app.models import Item
+
+ITEM_CACHE_SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS item_cache (
+        item_id INTEGER PRIMARY KEY,
+        generation INTEGER NOT NULL DEFAULT 0,
+        version INTEGER,
+        payload TEXT
+    )
+'''
+
+class SQLiteItemStore:
+    """Entries in a SQLite file shared by all workers on the host."""
+    shared = True
+    
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._connection().execute(ITEM_CACHE_SCHEMA)
+    
+    def _connection(self):
+        # One connection per thread, and never one inherited across a fork
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=OFF')
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+    
+    def get(self, item_id):
+        """Return (token, version, payload); payload is None on a miss."""
+        # Row 0 holds the generation of the whole cache, bumped by clear()
+        epoch, generation, version, payload = self._connection().execute(
+            'SELECT e.generation, coalesce(c.generation, 0), c.version, c.payload '
+            'FROM (SELECT coalesce(max(generation), 0) AS generation FROM item_cache WHERE item_id = 0) e '
+            'LEFT JOIN item_cache c ON c.item_id = ?', (item_id,)).fetchone()
+        return (epoch, generation), version, payload
+    
+    def put(self, item_id, token, version, payload):
+        """Store an entry unless the item was invalidated since ``token`` was read."""
+        epoch, generation = token
+        self._connection().execute(
+            'INSERT INTO item_cache (item_id, generation, version, payload) '
+            'SELECT ?, ?, ?, ? WHERE coalesce((SELECT generation FROM item_cache WHERE item_id = 0), 0) = ? '
+            'ON CONFLICT (item_id) DO UPDATE SET version = excluded.version, payload = excluded.payload '
+            'WHERE item_cache.generation = excluded.generation',
+            (item_id, generation, version, payload, epoch))
+    
+    def invalidate(self, item_ids):
+        self._write(('INSERT INTO item_cache (item_id, generation) VALUES (?, 1) '
+                     'ON CONFLICT (item_id) DO UPDATE SET generation = generation + 1, '
+                     'version = NULL, payload = NULL',
+                     [(item_id,) for item_id in item_ids]))
+    
+    def clear(self):
+        self._write(('INSERT INTO item_cache (item_id, generation) VALUES (0, 1) '
+                     'ON CONFLICT (item_id) DO UPDATE SET generation = generation + 1', [()]),
+                    ('UPDATE item_cache SET version = NULL, payload = NULL WHERE item_id != 0', [()]))
+    
+    def _write(self, *statements):
+        conn = self._connection()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            for sql, rows in statements:
+                conn.executemany(sql, rows)
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+class MemoryItemStore:
+    """Per-worker LRU, for when no shared file is available."""
+    # Hits are checked against the item's version in the database, so a
+    # stale entry is never served and fills need no generation check
+    shared = False
+    
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def get(self, item_id):
+        with self._lock:
+            entry = self._entries.get(item_id)
+            if entry is None:
+                return None, None, None
+            self._entries.move_to_end(item_id)
+            return (None,) + entry
+    
+    def put(self, item_id, token, version, payload):
+        with self._lock:
+            self._entries[item_id] = (version, payload)
+            self._entries.move_to_end(item_id)
+            while len(self._entries) > self.capacity:
+                self._entries.popitem(last=False)
+    
+    def invalidate(self, item_ids):
+        with self._lock:
+            for item_id in item_ids:
+                self._entries.pop(item_id, None)
+    
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+_store = None
+
+def _memory_store():
+    return MemoryItemStore(int(os.getenv('ITEM_CACHE_SIZE', 10000)))
+
+def init_item_cache(app):
+    """Open the configured cache backend for this app."""
+    global _store
+    backend = os.getenv('ITEM_CACHE_BACKEND', 'sqlite').lower()
+    if backend == 'sqlite':
+        try:
+            _store = SQLiteItemStore(app.config['ITEM_CACHE_PATH'])
+            return
+        except sqlite3.Error as e:
+            print(f"Item cache at {app.config['ITEM_CACHE_PATH']} unavailable, using a per-worker cache: {str(e)}")
+    _store = _memory_store()
+
+def _get_store():
+    global _store
+    if _store is None:
+        _store = _memory_store()
+    return _store
+
+def _load(item_id):
+    item = db.session.get(Item, item_id)
+    if item is None:
+        return None
+    data = item.to_dict()
+    data['qr_digest'] = item.qr_digest
+    return data
+
+def get_item(item_id):
+    """
+    Return an item's details, from the cache when possible.
+    
+    Args:
+        item_id: The item's database ID
+    
+    Returns:
+        dict: ``Item.to_dict()`` plus ``qr_digest``, or None if there is no
+        such item
+    """
+    store = _get_store()
+    try:
+        token, version, payload = store.get(item_id)
+    except sqlite3.Error as e:
+        print(f"Item cache read failed: {str(e)}")
+        return _load(item_id)
+    
+    if payload is not None and not store.shared:
+        current = db.session.query(Item.version).filter(Item.id == item_id).scalar()
+        if current != version:
+            payload = None
+    if payload is not None:
+        increment('item_cache_requests_total', result='hit')
+        return json.loads(payload)
+    
+    increment('item_cache_requests_total', result='miss')
+    data = _load(item_id)
+    if data is not None:
+        try:
+            store.put(item_id, token, data['version'], json.dumps(data))
+        except sqlite3.Error as e:
+            print(f"Item cache write failed: {str(e)}")
+    return data
+
+def invalidate_items(item_ids=None):
+    """Drop cached entries for the given item ids, or all entries when None."""
+    store = _get_store()
+    if item_ids is None:
+        store.clear()
+    else:
+        item_ids = [item_id for item_id in item_ids if item_id is not None]
+        if item_ids:
+            store.invalidate(item_ids)
+
+@on_commit
+def _invalidate_on_write(changes):
+    if Item.__tablename__ in changes:
+        invalidate_items(changes[Item.__tablename__])
@@ -0,0 +1,219 @@
+"""Printable QR label sheets for many items at once.
+
+Each label (QR code plus item name) is rendered in a process pool, since
+QR encoding and rasterising are CPU bound, and the labels are then laid
+out in a grid on A4 pages.  Pages are appended to the output one at a
+time, so memory stays flat for thousands of labels.  Output is a
+multi-page PDF, or PNG (a ZIP of pages when there is more than one).
+"""
+import io
+import multiprocessing
+import os
+import tempfile
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from app import db
+from app.models import Item
+from app.utils import qr_payload
+
+LABEL_FORMATS = ('pdf', 'png')
+
+# A4 at 150 dpi
+PAGE_DPI = 150
+PAGE_SIZE = (1240, 1754)
+PAGE_MARGIN = 60
+
+# Pages held in memory between PDF writes
+PDF_PAGE_BATCH = 25
+
+# Small batches are faster without the cost of starting worker processes
+SERIAL_THRESHOLD = 50
+
+def label_items(item_ids=None):
+    """
+    Load (id, name) pairs for labelling, in name order.
+    
+    Args:
+        item_ids: Ids to include, or None for every item
+    
+    Returns:
+        list: (item_id, name) tuples
+    """
+    query = db.select(Item.id, Item.name).order_by(Item.name, Item.id)
+    if item_ids is not None:
+        query = query.where(Item.id.in_(item_ids))
+    return [tuple(row) for row in db.session.execute(query)]
+
+@lru_cache(maxsize=8)
+def _font(size):
+    from PIL import ImageFont
+    try:
+        return ImageFont.load_default(size=size)
+    except TypeError:
+        # Pillow < 10.1 only has the fixed-size bitmap font
+        return ImageFont.load_default()
+
+def _fit_text(text, font, width):
+    """Shorten ``text`` with an ellipsis until it fits ``width`` pixels."""
+    if font.getlength(text) <= width:
+        return text
+    low, high = 0, len(text)
+    while low < high:
+        middle = (low + high + 1) // 2
+        if font.getlength(text[:middle] + '...') <= width:
+            low = middle
+        else:
+            high = middle - 1
+    return text[:low] + '...'
+
+def _qr_image(payload, side):
+    """Draw the QR code for ``payload`` as a 1-bit image at most ``side`` pixels square."""
+    import qrcode
+    from PIL import Image
+    qr = qrcode.QRCode(error_correction=qrcode.constants.ERROR_CORRECT_L, border=4)
+    qr.add_data(payload)
+    qr.make(fit=True)
+    matrix = qr.get_matrix()
+    modules = Image.frombytes('L', (len(matrix), len(matrix)),
+                              bytes(0 if dark else 255 for row in matrix for dark in row))
+    # Whole pixels per module, so every module prints at the same size
+    scale = max(1, side // len(matrix))
+    return modules.resize((len(matrix) * scale,) * 2, Image.NEAREST).convert('1')
+
+def render_label(item, cell_size):
+    """
+    Render one label: the item's QR code with its name underneath.
+    
+    Args:
+        item: (item_id, name) tuple
+        cell_size: (width, height) of a grid cell in pixels
+    
+    Returns:
+        bytes: Raw 1-bit pixel data of a ``cell_size`` image
+    """
+    from PIL import Image, ImageDraw
+    item_id, name = item
+    width, height = cell_size
+    text_height = max(24, height // 8)
+    side = min(width, height - text_height)
+    
+    label = Image.new('1', (width, height), 1)
+    qr = _qr_image(qr_payload(item_id, name), side)
+    label.paste(qr, ((width - qr.width) // 2, (side - qr.height) // 2))
+    
+    font = _font(text_height * 2 // 3)
+    draw = ImageDraw.Draw(label)
+    draw.text((width // 2, side + text_height // 2), _fit_text(name, font, width - 10),
+              fill=0, font=font, anchor='mm')
+    return label.tobytes()
+
+def _render_chunk(args):
+    items, cell_size = args
+    return [render_label(item, cell_size) for item in items]
+
+def _cell_size(columns, rows):
+    usable_width = PAGE_SIZE[0] - 2 * PAGE_MARGIN
+    usable_height = PAGE_SIZE[1] - 2 * PAGE_MARGIN
+    return usable_width // columns, usable_height // rows
+
+def _iter_labels(items, cell_size, workers):
+    """Yield rendered labels in input order, using a process pool for big batches."""
+    if len(items) <= SERIAL_THRESHOLD or workers <= 1:
+        for item in items:
+            yield render_label(item, cell_size)
+        return
+    
+    chunk = 64
+    chunks = [(items[i:i + chunk], cell_size) for i in range(0, len(items), chunk)]
+    # spawn rather than fork: the calling worker runs background threads
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context) as executor:
+        for labels in executor.map(_render_chunk, chunks):
+            yield from labels
+
+def _iter_pages(items, columns, rows, workers):
+    from PIL import Image
+    cell_width, cell_height = _cell_size(columns, rows)
+    per_page = columns * rows
+    page = None
+    for index, label in enumerate(_iter_labels(items, (cell_width, cell_height), workers)):
+        slot = index % per_page
+        if slot == 0:
+            if page is not None:
+                yield page
+            page = Image.new('1', PAGE_SIZE, 1)
+        x = PAGE_MARGIN + (slot % columns) * cell_width
+        y = PAGE_MARGIN + (slot // columns) * cell_height
+        page.paste(Image.frombytes('1', (cell_width, cell_height), label), (x, y))
+    if page is not None:
+        yield page
+
+def _png_bytes(page):
+    buffer = io.BytesIO()
+    page.save(buffer, format='PNG', dpi=(PAGE_DPI, PAGE_DPI))
+    return buffer.getvalue()
+
+def _save_pdf(path, pages, append):
+    pages[0].save(path, format='PDF', resolution=PAGE_DPI, append=append,
+                  save_all=True, append_images=pages[1:])
+
+def render_label_sheets(items, fmt='pdf', columns=None, rows=None, workers=None):
+    """
+    Render label sheets for the given items into a temporary file.
+    
+    Args:
+        items: List of (item_id, name) tuples, in print order
+        fmt: 'pdf', or 'png' (a ZIP of PNG pages when there is more than one)
+        columns: Labels per row (LABEL_COLUMNS, default 4)
+        rows: Label rows per page (LABEL_ROWS, default 5)
+        workers: Render processes (LABEL_WORKERS, default CPU count)
+    
+    Returns:
+        tuple: (open binary file positioned at the start, mimetype, file extension)
+    """
+    if fmt not in LABEL_FORMATS:
+        raise ValueError(f'Unknown label format {fmt}')
+    from PIL import Image
+    columns = columns or int(os.getenv('LABEL_COLUMNS', 4))
+    rows = rows or int(os.getenv('LABEL_ROWS', 5))
+    workers = workers or int(os.getenv('LABEL_WORKERS', os.cpu_count() or 1))
+    
+    pages = _iter_pages(items, columns, rows, workers)
+    
+    if fmt == 'pdf':
+        fd, path = tempfile.mkstemp(suffix='.pdf')
+        os.close(fd)
+        try:
+            # Each append adds an incremental update, so append pages in batches
+            batch = []
+            appended = False
+            for page in pages:
+                batch.append(page)
+                if len(batch) == PDF_PAGE_BATCH:
+                    _save_pdf(path, batch, appended)
+                    appended = True
+                    batch = []
+            if batch or not appended:
+                _save_pdf(path, batch or [Image.new('1', PAGE_SIZE, 1)], appended)
+            output = open(path, 'rb')
+        finally:
+            # The open handle keeps the data readable until it is closed
+            os.remove(path)
+        return output, 'application/pdf', 'pdf'
+    
+    output = tempfile.TemporaryFile()
+    first = next(pages, None)
+    second = next(pages, None)
+    if second is None:
+        (first or Image.new('1', PAGE_SIZE, 1)).save(output, format='PNG', dpi=(PAGE_DPI, PAGE_DPI))
+        output.seek(0)
+        return output, 'image/png', 'png'
+    
+    with zipfile.ZipFile(output, 'w', zipfile.ZIP_DEFLATED) as archive:
+        for number, page in enumerate([first, second], 1):
+            archive.writestr(f'labels_page_{number:03d}.png', _png_bytes(page))
+        for number, page in enumerate(pages, 3):
+            archive.writestr(f'labels_page_{number:03d}.png', _png_bytes(page))
+    output.seek(0)
+    return output, 'application/zip', 'zip'
@@ -0,0 +1,267 @@
+"""Daily usage rollups and archival of old ledger rows.
+
+``item_daily_usage`` holds the quantity taken and the number of
+transactions per item per day.  A trigger on ``transactions`` (migration 4)
+adds every new take to its day, whichever code path wrote it, so usage
+reports and consumption rates read a few rows per item and day instead of
+scanning the ledger.
+
+Transactions older than a retention window can be moved out of the hot
+table into an archive database (``ARCHIVE_DATABASE_PATH``, by default
+``archive.db`` next to the main database).  Each row keeps a copy of its
+item name, so archived history stays readable after items are deleted.
+Rollups are not touched by archival, and exports can include archived rows.
+
+Stock-count adjustments (``kind = 'adjustment'``) are ledger rows too, so
+stock plus everything that left it still adds up, but they are not usage
+and never reach the rollups.
+"""
+import json
+import os
+import sqlite3
+from datetime import datetime, timedelta
+from flask import current_app
+from app import db
+from app.changes import mark_changed
+from app.models import ItemDailyUsage, StockCount, Transaction
+
+ARCHIVE_SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS archive.archived_transactions (
+        id INTEGER PRIMARY KEY,
+        item_id INTEGER NOT NULL,
+        item_name VARCHAR(100),
+        user_name VARCHAR(100) NOT NULL,
+        user_email VARCHAR(120),
+        quantity INTEGER NOT NULL,
+        purpose TEXT,
+        timestamp DATETIME,
+        archived_at DATETIME NOT NULL,
+        kind VARCHAR(20) NOT NULL DEFAULT 'take'
+    )
+'''
+ARCHIVE_INDEX = ('CREATE INDEX IF NOT EXISTS archive.ix_archived_transactions_timestamp_id '
+                 'ON archived_transactions (timestamp, id)')
+
+def archive_path():
+    """Path of the archive database."""
+    path = os.getenv('ARCHIVE_DATABASE_PATH')
+    if not path:
+        path = os.path.join(os.path.dirname(db.engine.url.database), 'archive.db')
+    return os.path.abspath(path)
+
+def _attach_archive(connection):
+    connection.exec_driver_sql('ATTACH DATABASE ? AS archive', (archive_path(),))
+    connection.exec_driver_sql(ARCHIVE_SCHEMA)
+    columns = {row[1] for row in connection.exec_driver_sql('PRAGMA archive.table_info(archived_transactions)')}
+    if 'kind' not in columns:
+        # Archives written before transactions had kinds hold only takes
+        connection.exec_driver_sql(
+            "ALTER TABLE archive.archived_transactions ADD COLUMN kind VARCHAR(20) NOT NULL DEFAULT 'take'")
+    connection.exec_driver_sql(ARCHIVE_INDEX)
+
+def rebuild_daily_usage(connection, include_archive=False):
+    """
+    Recompute every rollup from the ledger.
+    
+    Only needed for databases that predate the rollup trigger, or after
+    rows were changed by hand.  Usage of deleted items survives only as far
+    as their transactions do (deleting an item deletes its transactions).
+    
+    Args:
+        connection: SQLAlchemy connection; the caller commits
+        include_archive: Also count rows in the archive database, which
+            must be attached as ``archive``
+    """
+    source = "SELECT item_id, timestamp, quantity FROM main.transactions WHERE kind = 'take'"
+    if include_archive:
+        source += (" UNION ALL SELECT item_id, timestamp, quantity FROM archive.archived_transactions "
+                   "WHERE kind = 'take'")
+    connection.exec_driver_sql('DELETE FROM item_daily_usage')
+    connection.exec_driver_sql(
+        'INSERT INTO item_daily_usage (item_id, day, quantity_taken, transaction_count) '
+        "SELECT item_id, coalesce(date(timestamp), date('now')), sum(quantity), count(*) "
+        f'FROM ({source}) GROUP BY 1, 2')
+
+def rebuild_rollups():
+    """Rebuild rollups from the hot table and, when it exists, the archive."""
+    with db.engine.connect() as connection:
+        include_archive = os.path.exists(archive_path())
+        if include_archive:
+            _attach_archive(connection)
+        try:
+            rebuild_daily_usage(connection, include_archive)
+            connection.commit()
+        finally:
+            connection.rollback()
+            if include_archive:
+                connection.exec_driver_sql('DETACH DATABASE archive')
+    return db.session.query(db.func.count()).select_from(ItemDailyUsage).scalar()
+
+def usage_by_item(since=None, until=None, item_ids=None):
+    """
+    Quantity taken per item between two days, from the rollups.
+    
+    Args:
+        since: First day included (date), or None for all history
+        until: Last day included (date), or None for today
+        item_ids: Optional iterable of item ids to restrict to
+    
+    Returns:
+        list: (item_id, quantity_taken, transaction_count) tuples, largest first
+    """
+    query = db.select(ItemDailyUsage.item_id,
+                      db.func.sum(ItemDailyUsage.quantity_taken),
+                      db.func.sum(ItemDailyUsage.transaction_count))
+    if since is not None:
+        query = query.where(ItemDailyUsage.day >= since)
+    if until is not None:
+        query = query.where(ItemDailyUsage.day <= until)
+    if item_ids is not None:
+        query = query.where(ItemDailyUsage.item_id.in_(list(item_ids)))
+    query = query.group_by(ItemDailyUsage.item_id).order_by(db.func.sum(ItemDailyUsage.quantity_taken).desc())
+    return [tuple(row) for row in db.session.execute(query)]
+
+def daily_usage(item_id, since=None):
+    """Return (day, quantity_taken) pairs for one item, oldest first."""
+    query = (db.select(ItemDailyUsage.day, ItemDailyUsage.quantity_taken)
+             .where(ItemDailyUsage.item_id == item_id)
+             .order_by(ItemDailyUsage.day))
+    if since is not None:
+        query = query.where(ItemDailyUsage.day >= since)
+    return [tuple(row) for row in db.session.execute(query)]
+
+def total_transaction_count():
+    """All transactions ever recorded, archived ones included."""
+    takes = db.session.query(db.func.coalesce(db.func.sum(ItemDailyUsage.transaction_count), 0)).scalar()
+    # Rollups hold takes only; each applied stock count keeps its number of adjustments
+    adjustments = (db.session.query(db.func.coalesce(db.func.sum(StockCount.adjusted_items), 0))
+                   .filter(StockCount.status == 'applied').scalar())
+    return takes + adjustments
+
+def archive_transactions(older_than_days, batch_size=None, dry_run=False):
+    """
+    Move transactions from before a cutoff day into the archive database.
+    
+    Rows are copied in batches, committed, and only then deleted from the
+    hot table, so an interrupted run leaves rows in both places (the next
+    run finishes the move) but never loses any.
+    
+    Args:
+        older_than_days: Keep this many whole days of transactions
+        batch_size: Rows per batch (LEDGER_ARCHIVE_BATCH, default 5000)
+        dry_run: Only count the rows that would move
+    
+    Returns:
+        dict: cutoff (datetime), moved (row count), left (rows not moved
+        because their id belongs to a different archived row) and path of
+        the archive
+    """
+    if older_than_days < 1:
+        raise ValueError('older_than_days must be at least 1')
+    batch_size = batch_size or int(os.getenv('LEDGER_ARCHIVE_BATCH', 5000))
+    # Whole days, so a day's rollup never straddles the hot table and the archive
+    cutoff = datetime.combine(datetime.utcnow().date() - timedelta(days=older_than_days), datetime.min.time())
+    cutoff_text = cutoff.isoformat(' ')
+    path = archive_path()
+    
+    if dry_run:
+        count = (db.session.query(db.func.count(Transaction.id))
+                 .filter(Transaction.timestamp < cutoff).scalar())
+        return {'cutoff': cutoff, 'moved': count, 'left': 0, 'path': path}
+    
+    moved = left = 0
+    with db.engine.connect() as connection:
+        _attach_archive(connection)
+        connection.commit()
+        try:
+            while True:
+                # Transaction ids are AUTOINCREMENT (migration 7), so an
+                # archived id is never handed out again
+                ids = [row[0] for row in connection.exec_driver_sql(
+                    'SELECT id FROM main.transactions WHERE timestamp < ? ORDER BY timestamp, id LIMIT ?',
+                    (cutoff_text, batch_size))]
+                if not ids:
+                    break
+                batch = json.dumps(ids)
+                connection.exec_driver_sql(
+                    'INSERT OR IGNORE INTO archive.archived_transactions '
+                    '(id, item_id, item_name, user_name, user_email, quantity, purpose, timestamp, archived_at, kind) '
+                    'SELECT t.id, t.item_id, i.name, t.user_name, t.user_email, t.quantity, t.purpose, '
+                    't.timestamp, ?, t.kind FROM main.transactions t LEFT JOIN main.items i ON i.id = t.item_id '
+                    'WHERE t.id IN (SELECT value FROM json_each(?))',
+                    (datetime.utcnow().isoformat(' '), batch))
+                connection.commit()
+                # Delete only rows the archive now holds an identical copy of
+                deleted = connection.exec_driver_sql(
+                    'DELETE FROM main.transactions WHERE id IN ('
+                    'SELECT a.id FROM archive.archived_transactions a JOIN main.transactions t ON t.id = a.id '
+                    'AND t.timestamp IS a.timestamp AND t.quantity = a.quantity AND t.user_name = a.user_name '
+                    'WHERE a.id IN (SELECT value FROM json_each(?)))',
+                    (batch,)).rowcount
+                connection.commit()
+                moved += deleted
+                if deleted < len(ids):
+                    # Archived under the same id by another database; never retried
+                    left = len(ids) - deleted
+                    break
+        finally:
+            connection.rollback()
+            connection.exec_driver_sql('DETACH DATABASE archive')
+    
+    if moved:
+        # Dashboards, export caches and live feeds see the ledger shrink
+        mark_changed(Transaction.__tablename__)
+        db.session.commit()
+    return {'cutoff': cutoff, 'moved': moved, 'left': left, 'path': path}
+
+def has_archived_transactions():
+    """True when the archive database holds any transactions."""
+    path = archive_path()
+    if not os.path.exists(path):
+        return False
+    conn = sqlite3.connect(f'file:{path}?mode=ro', uri=True)
+    try:
+        return conn.execute('SELECT 1 FROM archived_transactions LIMIT 1').fetchone() is not None
+    except sqlite3.OperationalError:
+        return False
+    finally:
+        conn.close()
+
+def iter_archived_transaction_rows(chunk_size=1000):
+    """Yield export rows for archived transactions in id order (they precede the live ones)."""
+    path = archive_path()
+    if not os.path.exists(path):
+        return
+    conn = sqlite3.connect(f'file:{path}?mode=ro', uri=True)
+    try:
+        columns = {row[1] for row in conn.execute('PRAGMA table_info(archived_transactions)')}
+        # Read only, so an archive not yet given its kind column is read as takes
+        kind = 'kind' if 'kind' in columns else "'take'"
+        cursor = conn.execute(
+            f'SELECT id, item_name, user_name, user_email, {kind}, quantity, purpose, timestamp '
+            'FROM archived_transactions ORDER BY id')
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                break
+            for transaction_id, item_name, user_name, user_email, kind, quantity, purpose, timestamp in rows:
+                yield (transaction_id, item_name or 'Unknown', user_name, user_email or '', kind, quantity,
+                       purpose or '', (timestamp or '')[:19])
+    finally:
+        conn.close()
+
+def archive_old_transactions(job=None):
+    """Scheduled job: archive transactions older than LEDGER_ARCHIVE_DAYS."""
+    result = archive_transactions(int(os.getenv('LEDGER_ARCHIVE_DAYS', 0)))
+    if result['moved']:
+        current_app.logger.info('Archived %d transaction(s) from before %s',
+                                result['moved'], f"{result['cutoff']:%Y-%m-%d}")
+    if result['left']:
+        current_app.logger.warning('Left %d transaction(s) whose ids belong to other archived rows',
+                                   result['left'])
+
+def register_ledger_jobs():
+    """Schedule daily archival when LEDGER_ARCHIVE_DAYS is set."""
+    if int(os.getenv('LEDGER_ARCHIVE_DAYS', 0)) > 0:
+        from app.scheduler import register_job
+        register_job('archive_transactions', 24 * 3600, archive_old_transactions)
@@ -0,0 +1,179 @@
+"""Reusable SMTP sessions for email delivery.
+
+Opening a connection, running STARTTLS and logging in costs several round
+trips, so each worker process keeps one authenticated session open and
+sends every message over it.  The session is closed after it has been
+idle for ``SMTP_IDLE_TIMEOUT`` seconds or has carried
+``SMTP_MAX_MESSAGES_PER_SESSION`` messages, and is transparently reopened
+when the relay drops it.
+"""
+import os
+import smtplib
+import threading
+import time
+from app.metrics import timed
+
+# Errors that mean the session itself is unusable, as opposed to the relay
+# rejecting one particular message.
+_CONNECTION_ERRORS = (smtplib.SMTPServerDisconnected, smtplib.SMTPConnectError, ConnectionError, TimeoutError)
+
+class DeliveryDeferred(Exception):
+    """A message in a batch that was not tried because the relay could not be reached."""
+
+def is_connection_failure(error):
+    """True if ``error`` means the relay could not be reached or dropped the session."""
+    # SMTPException subclasses OSError too, but those are the relay answering
+    if isinstance(error, _CONNECTION_ERRORS):
+        return True
+    return isinstance(error, OSError) and not isinstance(error, smtplib.SMTPException)
+
+class SMTPConnectionManager:
+    """Keep one SMTP session alive and deliver messages over it."""
+    
+    def __init__(self, host, port, username=None, password=None, use_tls=True,
+                 timeout=30, idle_timeout=60, max_messages_per_session=100):
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.use_tls = use_tls
+        self.timeout = timeout
+        self.idle_timeout = idle_timeout
+        self.max_messages_per_session = max_messages_per_session
+        
+        self._server = None
+        self._last_used = 0.0
+        self._sent_in_session = 0
+        self._lock = threading.Lock()
+    
+    @classmethod
+    def from_env(cls):
+        """Build a manager from the SMTP_* environment variables."""
+        return cls(
+            host=os.getenv('SMTP_SERVER', 'smtp.gmail.com'),
+            port=int(os.getenv('SMTP_PORT', 587)),
+            username=os.getenv('SMTP_USERNAME'),
+            password=os.getenv('SMTP_PASSWORD'),
+            use_tls=os.getenv('SMTP_USE_TLS', 'true').lower() == 'true',
+            timeout=float(os.getenv('SMTP_TIMEOUT', 30)),
+            idle_timeout=float(os.getenv('SMTP_IDLE_TIMEOUT', 60)),
+            max_messages_per_session=int(os.getenv('SMTP_MAX_MESSAGES_PER_SESSION', 100)),
+        )
+    
+    def _connect(self):
+        server = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        try:
+            if self.use_tls:
+                server.starttls()
+            # Local relays and test sinks usually do not offer AUTH
+            if self.username and self.password:
+                server.login(self.username, self.password)
+        except Exception:
+            server.close()
+            raise
+        self._server = server
+        self._sent_in_session = 0
+    
+    def _disconnect(self):
+        if self._server is None:
+            return
+        try:
+            self._server.quit()
+        except Exception:
+            self._server.close()
+        self._server = None
+    
+    def _drop(self):
+        if self._server is not None:
+            self._server.close()
+        self._server = None
+    
+    def _session(self):
+        """Return a usable session, reconnecting when idle or exhausted."""
+        if self._server is not None:
+            idle = time.monotonic() - self._last_used
+            if idle > self.idle_timeout or self._sent_in_session >= self.max_messages_per_session:
+                self._disconnect()
+        if self._server is None:
+            self._connect()
+        return self._server
+    
+    def _send_one(self, msg):
+        reused = self._server is not None
+        try:
+            self._session().send_message(msg)
+        except _CONNECTION_ERRORS:
+            self._drop()
+            if not reused:
+                raise
+            # The relay dropped a session we had kept open; retry once on a fresh one
+            self._session().send_message(msg)
+        except smtplib.SMTPResponseException as e:
+            # 421 means the relay is closing the session
+            if e.smtp_code == 421:
+                self._disconnect()
+            raise
+        self._sent_in_session += 1
+        self._last_used = time.monotonic()
+    
+    def send(self, msg):
+        """Send one message, raising on failure."""
+        with self._lock, timed('smtp_send'):
+            self._send_one(msg)
+    
+    def send_many(self, messages):
+        """
+        Send several messages over as few sessions as possible.
+        
+        If the relay cannot be reached, the rest of the batch is not tried:
+        each message would otherwise reconnect and wait out the timeout.
+        
+        Args:
+            messages: Iterable of email.message.Message objects
+        
+        Returns:
+            list: One entry per message, None on success or the exception
+            raised; DeliveryDeferred for messages after a connection failure
+        """
+        results = []
+        unreachable = None
+        with self._lock:
+            for msg in messages:
+                if unreachable is not None:
+                    results.append(DeliveryDeferred(f'Not sent, the relay is unreachable: {unreachable}'))
+                    continue
+                try:
+                    with timed('smtp_send'):
+                        self._send_one(msg)
+                except Exception as e:
+                    results.append(e)
+                    if is_connection_failure(e):
+                        unreachable = e
+                else:
+                    results.append(None)
+        return results
+    
+    def close_if_idle(self):
+        """Close the session if it has been idle longer than the idle timeout."""
+        with self._lock:
+            if self._server is not None and time.monotonic() - self._last_used > self.idle_timeout:
+                self._disconnect()
+    
+    def close(self):
+        """Close the session now."""
+        with self._lock:
+            self._disconnect()
+
+_manager = None
+_manager_pid = None
+_manager_lock = threading.Lock()
+
+def get_smtp_manager():
+    """Return this process's connection manager, creating it on first use."""
+    global _manager, _manager_pid
+    with _manager_lock:
+        # A session inherited across fork() would share its socket with the parent
+        if _manager is None or _manager_pid != os.getpid():
+            _manager = SMTPConnectionManager.from_env()
+            _manager_pid = os.getpid()
+        return _manager
@@ -0,0 +1,90 @@
+"""Compact item manifest for clients that resolve scans offline.
+
+The scanner keeps a copy of every item's id, name, quantity and version
+and asks for changes with ``since=<watermark>``.  Changes are found through
+the indexed ``items.updated_at`` column plus ``item_tombstones`` for
+deletions.  Timestamps are taken when a row is written, not when its
+transaction commits, so each delta re-reads an overlap window before the
+watermark; clients apply rows by version, so repeats are harmless.
+"""
+import hashlib
+import os
+from datetime import datetime, timedelta
+from app import db
+from app.models import Item, ItemTombstone
+
+MANIFEST_FIELDS = ['id', 'name', 'quantity', 'version']
+
+def _overlap():
+    return timedelta(seconds=int(os.getenv('MANIFEST_OVERLAP_SECONDS', 60)))
+
+def _tombstone_retention():
+    return timedelta(days=int(os.getenv('ITEM_TOMBSTONE_DAYS', 30)))
+
+def parse_watermark(value):
+    """Parse a ``since`` watermark; None when missing or malformed (full sync)."""
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        return None
+
+def manifest_etag():
+    """
+    Cheap validator for the state of the manifest.
+    
+    Inserts and updates move ``max(updated_at)``, deletes move the
+    tombstones, and a write committed late (with an older timestamp) still
+    bumps the versions inside the overlap window.  A client whose copy
+    matches the tag has nothing to fetch, whatever its watermark.
+    """
+    item_count, last_update = db.session.query(db.func.count(Item.id), db.func.max(Item.updated_at)).one()
+    recent_versions = (db.session.query(db.func.sum(Item.version))
+                       .filter(Item.updated_at >= datetime.utcnow() - _overlap()).scalar())
+    tombstone_count, last_delete = db.session.query(
+        db.func.count(ItemTombstone.item_id), db.func.max(ItemTombstone.deleted_at)).one()
+    state = f'{item_count}|{last_update}|{recent_versions}|{tombstone_count}|{last_delete}'
+    return hashlib.sha1(state.encode()).hexdigest()[:20]
+
+def build_manifest(since=None):
+    """
+    Build the full manifest, or the changes since a watermark.
+    
+    Args:
+        since: Watermark from a previous response, or None for everything.
+            Watermarks older than the tombstone retention get a full manifest.
+    
+    Returns:
+        dict: ``watermark`` for the next request, ``full`` (replace rather
+        than merge), ``fields``, ``items`` as rows of MANIFEST_FIELDS and
+        ``deleted`` item ids
+    """
+    now = datetime.utcnow()
+    full = since is None or since < now - _tombstone_retention()
+    
+    query = db.select(Item.id, Item.name, Item.quantity, Item.version).order_by(Item.id)
+    deleted = []
+    if not full:
+        changed_after = since - _overlap()
+        query = query.where(Item.updated_at >= changed_after)
+        deleted = list(db.session.execute(
+            db.select(ItemTombstone.item_id).where(ItemTombstone.deleted_at >= changed_after)).scalars())
+    
+    return {
+        'watermark': now.isoformat(),
+        'full': full,
+        'fields': MANIFEST_FIELDS,
+        'items': [list(row) for row in db.session.execute(query)],
+        'deleted': deleted,
+    }
+
+def prune_tombstones(job=None):
+    """Scheduled job: forget deletions older than the retention period."""
+    db.session.execute(db.delete(ItemTombstone)
+                       .where(ItemTombstone.deleted_at < datetime.utcnow() - _tombstone_retention()))
+    db.session.commit()
+
+def register_manifest_jobs():
+    from app.scheduler import register_job
+    register_job('prune_item_tombstones', 24 * 3600, prune_tombstones)
@@ -0,0 +1,327 @@
+"""Request, query and operation instrumentation with Prometheus output.
+
+Each worker keeps its own counters and histograms in memory:
+
+- ``http_request_duration_seconds`` per endpoint, method and status
+- ``http_request_db_queries`` and ``http_request_db_seconds`` per endpoint,
+  from SQLAlchemy cursor events
+- ``db_query_duration_seconds`` per statement type
+- ``operation_duration_seconds`` for SMTP sends, QR rendering, Excel
+  exports and backups (``timed('name')``)
+- ``backup_step_seconds``: duration of each online backup step
+- ``db_n_plus_one_total``: requests that ran the same SELECT at least
+  METRICS_N_PLUS_ONE_THRESHOLD times, which are also logged
+
+Workers write their totals to ``METRICS_DIR/<pid>-<start>.json`` every few
+seconds, and ``/metrics`` sums the files of every worker, so a scrape that
+lands on any worker reports the whole server.  Files left by exited workers
+are folded into ``exited.json``, so totals never go backwards when gunicorn
+recycles a worker.
+"""
+import atexit
+import fcntl
+import glob
+import json
+import os
+import re
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from flask import g, request, has_request_context
+from sqlalchemy import event
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+QUERY_COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+STEP_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+
+# name: (type, help, buckets)
+METRICS = {
+    'http_request_duration_seconds': ('histogram', 'Request latency by endpoint', LATENCY_BUCKETS),
+    'http_request_db_queries': ('histogram', 'SQL statements executed per request', QUERY_COUNT_BUCKETS),
+    'http_request_db_seconds': ('histogram', 'Time spent in SQL per request', LATENCY_BUCKETS),
+    'db_query_duration_seconds': ('histogram', 'SQL statement latency by statement type', LATENCY_BUCKETS),
+    'operation_duration_seconds': ('histogram', 'Latency of SMTP sends, QR rendering, exports and backups', LATENCY_BUCKETS),
+    'backup_step_seconds': ('histogram', 'Time each online backup step held the database read lock', STEP_BUCKETS),
+    'operation_errors_total': ('counter', 'Timed operations that raised', None),
+    'db_n_plus_one_total': ('counter', 'Requests that repeated one SELECT past the N+1 threshold', None),
+}
+
+_lock = threading.Lock()
+_histograms = {}
+_counters = {}
+_started = int(time.time())
+_pid = os.getpid()
+_flush_timer = None
+_metrics_dir = None
+
+def _check_pid():
+    # A worker forked after --preload starts from zero, not the master's totals
+    global _started, _pid, _flush_timer
+    if _pid != os.getpid():
+        with _lock:
+            _histograms.clear()
+            _counters.clear()
+            _started = int(time.time())
+            _pid = os.getpid()
+            _flush_timer = None
+
+def _key(name, labels):
+    return (name, tuple(sorted(labels.items())))
+
+def observe(name, value, **labels):
+    """Record ``value`` in histogram ``name``."""
+    buckets = METRICS[name][2]
+    _check_pid()
+    with _lock:
+        series = _histograms.get(_key(name, labels))
+        if series is None:
+            series = _histograms[_key(name, labels)] = {'buckets': [0] * len(buckets), 'sum': 0.0, 'count': 0}
+        for index, bound in enumerate(buckets):
+            if value <= bound:
+                series['buckets'][index] += 1
+                break
+        series['sum'] += value
+        series['count'] += 1
+    _schedule_flush()
+
+def increment(name, amount=1, **labels):
+    """Add ``amount`` to counter ``name``."""
+    _check_pid()
+    with _lock:
+        key = _key(name, labels)
+        _counters[key] = _counters.get(key, 0) + amount
+    _schedule_flush()
+
+@contextmanager
+def timed(operation):
+    """Time a block into ``operation_duration_seconds{operation=...}``."""
+    started = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        increment('operation_errors_total', operation=operation)
+        raise
+    finally:
+        observe('operation_duration_seconds', time.perf_counter() - started, operation=operation)
+
+# Per-worker snapshot files
+
+def _snapshot():
+    with _lock:
+        return {
+            'histograms': [[name, dict(labels), series['buckets'], series['sum'], series['count']]
+                           for (name, labels), series in _histograms.items()],
+            'counters': [[name, dict(labels), value] for (name, labels), value in _counters.items()],
+        }
+
+def _snapshot_path():
+    return os.path.join(_metrics_dir, f'{os.getpid()}-{_started}.json')
+
+def _write_json(path, data):
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'w') as output:
+        json.dump(data, output)
+    os.replace(tmp_path, path)
+
+def flush():
+    """Write this worker's totals to its snapshot file."""
+    global _flush_timer
+    _flush_timer = None
+    if _metrics_dir is None:
+        return
+    try:
+        os.makedirs(_metrics_dir, exist_ok=True)
+        _write_json(_snapshot_path(), _snapshot())
+    except OSError as e:
+        print(f"Failed to write metrics snapshot: {str(e)}")
+
+def _flush_seconds():
+    return float(os.getenv('METRICS_FLUSH_SECONDS', 5))
+
+def _schedule_flush():
+    global _flush_timer
+    if _metrics_dir is None or _flush_timer is not None:
+        return
+    with _lock:
+        if _flush_timer is not None:
+            return
+        _flush_timer = threading.Timer(_flush_seconds(), flush)
+        _flush_timer.daemon = True
+        _flush_timer.start()
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+def _merge(totals, data):
+    for name, labels, buckets, total, count in data.get('histograms', []):
+        series = totals['histograms'].setdefault(_key(name, labels), {'buckets': [0] * len(buckets),
+                                                                      'sum': 0.0, 'count': 0})
+        series['buckets'] = [a + b for a, b in zip(series['buckets'], buckets)]
+        series['sum'] += total
+        series['count'] += count
+    for name, labels, value in data.get('counters', []):
+        key = _key(name, labels)
+        totals['counters'][key] = totals['counters'].get(key, 0) + value
+
+def _as_data(totals):
+    return {
+        'histograms': [[name, dict(labels), series['buckets'], series['sum'], series['count']]
+                       for (name, labels), series in totals['histograms'].items()],
+        'counters': [[name, dict(labels), value] for (name, labels), value in totals['counters'].items()],
+    }
+
+def collect():
+    """
+    Sum the snapshots of every worker, including exited ones.
+    
+    Returns:
+        dict: ``histograms`` and ``counters`` keyed by (name, labels)
+    """
+    flush()
+    totals = {'histograms': {}, 'counters': {}}
+    if _metrics_dir is None:
+        return totals
+    
+    exited_path = os.path.join(_metrics_dir, 'exited.json')
+    with open(os.path.join(_metrics_dir, '.lock'), 'w') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        exited = {'histograms': {}, 'counters': {}}
+        if os.path.exists(exited_path):
+            with open(exited_path) as source:
+                _merge(exited, json.load(source))
+        
+        dead = []
+        for path in glob.glob(os.path.join(_metrics_dir, '*-*.json')):
+            match = re.match(r'(\d+)-\d+\.json$', os.path.basename(path))
+            if not match:
+                continue
+            try:
+                with open(path) as source:
+                    data = json.load(source)
+            except (OSError, ValueError):
+                continue
+            if _pid_alive(int(match.group(1))):
+                _merge(totals, data)
+            else:
+                _merge(exited, data)
+                dead.append(path)
+        
+        if dead:
+            # Fold exited workers into one file before removing theirs
+            _write_json(exited_path, _as_data(exited))
+            for path in dead:
+                os.remove(path)
+    
+    _merge(totals, _as_data(exited))
+    return totals
+
+def _format_labels(labels, **extra):
+    pairs = list(labels) + list(extra.items())
+    if not pairs:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in pairs)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+def render_prometheus(totals):
+    """Render collected totals in the Prometheus text exposition format."""
+    lines = []
+    for name, (kind, help_text, buckets) in METRICS.items():
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} {kind}')
+        if kind == 'counter':
+            for (series_name, labels), value in sorted(totals['counters'].items()):
+                if series_name == name:
+                    lines.append(f'{name}{_format_labels(labels)} {value}')
+            continue
+        for (series_name, labels), series in sorted(totals['histograms'].items()):
+            if series_name != name:
+                continue
+            cumulative = 0
+            for bound, count in zip(buckets, series['buckets']):
+                cumulative += count
+                lines.append(f'{name}_bucket{_format_labels(labels, le=bound)} {cumulative}')
+            lines.append(f'{name}_bucket{_format_labels(labels, le="+Inf")} {series["count"]}')
+            lines.append(f'{name}_sum{_format_labels(labels)} {series["sum"]}')
+            lines.append(f'{name}_count{_format_labels(labels)} {series["count"]}')
+    return '\n'.join(lines) + '\n'
+
+# Request and query hooks
+
+def _n_plus_one_threshold():
+    return int(os.getenv('METRICS_N_PLUS_ONE_THRESHOLD', 10))
+
+def _endpoint():
+    return request.endpoint or 'unmatched'
+
+def _install_query_hooks(engine):
+    @event.listens_for(engine, 'before_cursor_execute')
+    def _query_started(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('query_started', []).append(time.perf_counter())
+    
+    @event.listens_for(engine, 'after_cursor_execute')
+    def _query_finished(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info['query_started'].pop()
+        verb = statement.lstrip().split(None, 1)[0].lower() if statement.strip() else 'other'
+        observe('db_query_duration_seconds', elapsed, statement=verb)
+        if has_request_context() and 'metrics_started' in g:
+            g.metrics_queries += 1
+            g.metrics_query_seconds += elapsed
+            if verb == 'select':
+                g.metrics_statements[statement] += 1
+
+def _record_request(status):
+    if g.get('metrics_recorded') or 'metrics_started' not in g:
+        return
+    g.metrics_recorded = True
+    endpoint = _endpoint()
+    observe('http_request_duration_seconds', time.perf_counter() - g.metrics_started,
+            endpoint=endpoint, method=request.method, status=str(status))
+    observe('http_request_db_queries', g.metrics_queries, endpoint=endpoint)
+    observe('http_request_db_seconds', g.metrics_query_seconds, endpoint=endpoint)
+    
+    if g.metrics_statements:
+        statement, count = g.metrics_statements.most_common(1)[0]
+        if count >= _n_plus_one_threshold():
+            increment('db_n_plus_one_total', endpoint=endpoint)
+            print(f"Possible N+1 query in {endpoint}: {count} executions of "
+                  f"{' '.join(statement.split())[:200]}")
+
+def init_metrics(app):
+    """Install the request and SQL hooks and set up the snapshot directory."""
+    global _metrics_dir
+    if os.getenv('METRICS_ENABLED', 'true').lower() != 'true':
+        return
+    _metrics_dir = app.config['METRICS_DIR']
+    atexit.register(flush)
+    
+    with app.app_context():
+        from app import db
+        _install_query_hooks(db.engine)
+    
+    @app.before_request
+    def _start_request_metrics():
+        g.metrics_started = time.perf_counter()
+        g.metrics_queries = 0
+        g.metrics_query_seconds = 0.0
+        g.metrics_statements = Counter()
+    
+    @app.after_request
+    def _finish_request_metrics(response):
+        _record_request(response.status_code)
+        return response
+    
+    @app.teardown_request
+    def _failed_request_metrics(exc):
+        # after_request is skipped when a view raises
+        if exc is not None:
+            _record_request(500)
+
+def metrics_enabled():
+    return _metrics_dir is not None
@@ -0,0 +1,225 @@
+"""Versioned schema migrations for existing databases.
+
+Schema changes are applied by ``flask db upgrade``, which creates missing
+tables and then runs pending migrations.  ``create_all`` never alters
+existing tables, so changes to tables that already hold data (new indexes,
+columns, virtual tables) are applied here, and so are new tables: workers
+only compare ``PRAGMA user_version`` with the latest migration when they
+boot, so a schema change without a migration would go unnoticed.  Every
+migration must be idempotent, because on a fresh database ``create_all``
+has already built the current schema.
+"""
+import fcntl
+import os
+import sqlite3
+import click
+from app import db
+
+MIGRATIONS = []
+
+# Adds every new take to its day's rollup (migration 6 on)
+TAKES_USAGE_TRIGGER = (
+    "CREATE TRIGGER transactions_usage_ai AFTER INSERT ON transactions WHEN new.kind = 'take' BEGIN "
+    "INSERT INTO item_daily_usage (item_id, day, quantity_taken, transaction_count) "
+    "VALUES (new.item_id, coalesce(date(new.timestamp), date('now')), new.quantity, 1) "
+    "ON CONFLICT (item_id, day) DO UPDATE SET "
+    "quantity_taken = quantity_taken + excluded.quantity_taken, "
+    "transaction_count = transaction_count + 1; "
+    "END")
+
+def migration(version, description):
+    """Register a migration function taking a SQLAlchemy connection."""
+    def decorator(func):
+        MIGRATIONS.append((version, description, func))
+        MIGRATIONS.sort(key=lambda m: m[0])
+        return func
+    return decorator
+
+def current_version(connection):
+    return connection.exec_driver_sql('PRAGMA user_version').scalar()
+
+def latest_version():
+    return MIGRATIONS[-1][0] if MIGRATIONS else 0
+
+def upgrade_database():
+    """
+    Create missing tables and apply pending migrations in order. Needs an
+    app context.
+    
+    Returns:
+        list: Versions applied in this run
+    """
+    applied = []
+    with db.engine.begin() as connection:
+        db.metadata.create_all(connection)
+        version = current_version(connection)
+        for target, description, func in MIGRATIONS:
+            if target <= version:
+                continue
+            print(f"Applying migration {target}: {description}")
+            func(connection)
+            # PRAGMA does not accept bound parameters
+            connection.exec_driver_sql(f'PRAGMA user_version = {int(target)}')
+            applied.append(target)
+    return applied
+
+def check_database():
+    """
+    Make sure the schema is current before serving. Needs an app context.
+    
+    Costs one ``PRAGMA user_version`` read when nothing is pending.  An
+    outdated or new database is upgraded here when DB_AUTO_MIGRATE is true
+    (the default), under a file lock so workers booting together upgrade it
+    once.  Otherwise booting fails until ``flask db upgrade`` has run; CLI
+    commands only warn, so that the upgrade itself can load the app.
+    
+    Returns:
+        bool: True when the schema is current
+    """
+    with db.engine.connect() as connection:
+        version = current_version(connection)
+    if version >= latest_version():
+        return True
+    
+    if os.getenv('DB_AUTO_MIGRATE', 'true').lower() != 'true':
+        message = (f'Database schema is at version {version}, this code needs {latest_version()}; '
+                   'run `flask db upgrade`')
+        if click.get_current_context(silent=True) is None:
+            raise RuntimeError(message)
+        print(f"Warning: {message}")
+        return False
+    
+    with open(f'{db.engine.url.database}.migrate.lock', 'w') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        upgrade_database()
+    return True
+
+@migration(1, 'transactions keyset pagination indexes')
+def _transactions_indexes(connection):
+    connection.exec_driver_sql(
+        'CREATE INDEX IF NOT EXISTS ix_transactions_timestamp_id ON transactions (timestamp, id)')
+    connection.exec_driver_sql(
+        'CREATE INDEX IF NOT EXISTS ix_transactions_item_id ON transactions (item_id)')
+
+@migration(2, 'full-text search index over item names and descriptions')
+def _items_fts(connection):
+    connection.exec_driver_sql(
+        "CREATE VIRTUAL TABLE IF NOT EXISTS items_fts USING fts5("
+        "name, description, content='items', content_rowid='id', "
+        "tokenize='unicode61 remove_diacritics 2', prefix='2 3')")
+    # External-content tables are kept in sync by the triggers below; stock
+    # updates do not touch name or description, so they skip the index
+    connection.exec_driver_sql(
+        "CREATE TRIGGER IF NOT EXISTS items_fts_ai AFTER INSERT ON items BEGIN "
+        "INSERT INTO items_fts(rowid, name, description) VALUES (new.id, new.name, new.description); "
+        "END")
+    connection.exec_driver_sql(
+        "CREATE TRIGGER IF NOT EXISTS items_fts_ad AFTER DELETE ON items BEGIN "
+        "INSERT INTO items_fts(items_fts, rowid, name, description) "
+        "VALUES ('delete', old.id, old.name, old.description); "
+        "END")
+    connection.exec_driver_sql(
+        "CREATE TRIGGER IF NOT EXISTS items_fts_au AFTER UPDATE OF name, description ON items BEGIN "
+        "INSERT INTO items_fts(items_fts, rowid, name, description) "
+        "VALUES ('delete', old.id, old.name, old.description); "
+        "INSERT INTO items_fts(rowid, name, description) VALUES (new.id, new.name, new.description); "
+        "END")
+    connection.exec_driver_sql("INSERT INTO items_fts(items_fts) VALUES ('rebuild')")
+
+@migration(3, 'item versions and updated_at index for delta sync')
+def _items_version(connection):
+    columns = {row[1] for row in connection.exec_driver_sql('PRAGMA table_info(items)')}
+    if 'version' not in columns:
+        connection.exec_driver_sql('ALTER TABLE items ADD COLUMN version INTEGER NOT NULL DEFAULT 1')
+    connection.exec_driver_sql(
+        'CREATE INDEX IF NOT EXISTS ix_items_updated_at ON items (updated_at)')
+
+@migration(4, 'daily per-item usage rollups maintained by a trigger')
+def _item_daily_usage(connection):
+    # create_all has made the table; the trigger adds every new transaction
+    # to its item's day, and the rebuild covers the rows already recorded
+    connection.exec_driver_sql(
+        "CREATE TRIGGER IF NOT EXISTS transactions_usage_ai AFTER INSERT ON transactions BEGIN "
+        "INSERT INTO item_daily_usage (item_id, day, quantity_taken, transaction_count) "
+        "VALUES (new.item_id, coalesce(date(new.timestamp), date('now')), new.quantity, 1) "
+        "ON CONFLICT (item_id, day) DO UPDATE SET "
+        "quantity_taken = quantity_taken + excluded.quantity_taken, "
+        "transaction_count = transaction_count + 1; "
+        "END")
+    from app.ledger import rebuild_daily_usage
+    rebuild_daily_usage(connection)
+
+@migration(5, 'stored per-item forecasts')
+def _item_forecasts(connection):
+    from app.models import ItemForecast
+    ItemForecast.__table__.create(connection, checkfirst=True)
+
+@migration(6, 'transaction kinds, stock-count sessions, usage rollups of takes only')
+def _stock_counts(connection):
+    columns = {row[1] for row in connection.exec_driver_sql('PRAGMA table_info(transactions)')}
+    if 'kind' not in columns:
+        connection.exec_driver_sql(
+            "ALTER TABLE transactions ADD COLUMN kind VARCHAR(20) NOT NULL DEFAULT 'take'")
+    from app.models import StockCount, StockCountLine
+    StockCount.__table__.create(connection, checkfirst=True)
+    StockCountLine.__table__.create(connection, checkfirst=True)
+    # Stock-count adjustments are corrections, not usage: keep them out of the rollups
+    connection.exec_driver_sql('DROP TRIGGER IF EXISTS transactions_usage_ai')
+    connection.exec_driver_sql(TAKES_USAGE_TRIGGER)
+
+@migration(7, 'transaction ids never reused (AUTOINCREMENT)')
+def _transactions_autoincrement(connection):
+    from app.models import Transaction
+    sql = connection.exec_driver_sql(
+        "SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'transactions'").scalar()
+    if 'AUTOINCREMENT' not in sql.upper():
+        # SQLite cannot add AUTOINCREMENT to an existing table, so rebuild it
+        connection.exec_driver_sql('DROP TRIGGER IF EXISTS transactions_usage_ai')
+        connection.exec_driver_sql('DROP INDEX IF EXISTS ix_transactions_timestamp_id')
+        connection.exec_driver_sql('DROP INDEX IF EXISTS ix_transactions_item_id')
+        connection.exec_driver_sql('ALTER TABLE transactions RENAME TO _transactions_old')
+        Transaction.__table__.create(connection)
+        columns = ', '.join(column.name for column in Transaction.__table__.columns)
+        connection.exec_driver_sql(
+            f'INSERT INTO transactions ({columns}) SELECT {columns} FROM _transactions_old')
+        connection.exec_driver_sql('DROP TABLE _transactions_old')
+        connection.exec_driver_sql(TAKES_USAGE_TRIGGER)
+    
+    # Ids already handed out twice: give the live rows fresh ones, so the
+    # archive can take them, and start the sequence past every archived id
+    top, clashes = _archived_ids_in_use(connection)
+    for transaction_id in clashes:
+        top += 1
+        connection.exec_driver_sql('UPDATE transactions SET id = ? WHERE id = ?', (top, transaction_id))
+    if top:
+        connection.exec_driver_sql("DELETE FROM sqlite_sequence WHERE name = 'transactions'")
+        connection.exec_driver_sql(
+            "INSERT INTO sqlite_sequence (name, seq) VALUES ('transactions', ?)", (top,))
+
+def _archived_ids_in_use(connection):
+    """
+    Compare the live ledger with the archive database, if there is one.
+    
+    Returns:
+        tuple: Highest transaction id in either place, and the ids of live
+        rows whose id belongs to a different archived row
+    """
+    low, top = connection.exec_driver_sql('SELECT min(id), coalesce(max(id), 0) FROM transactions').one()
+    from app.ledger import archive_path
+    path = archive_path()
+    if not os.path.exists(path):
+        return top, []
+    archive = sqlite3.connect(f'file:{path}?mode=ro', uri=True)
+    try:
+        top = max(top, archive.execute('SELECT coalesce(max(id), 0) FROM archived_transactions').fetchone()[0])
+        # A live row identical to its archived copy is a move cut short, not a clash
+        archived = {row[0]: row[1:] for row in archive.execute(
+            'SELECT id, timestamp, quantity, user_name FROM archived_transactions WHERE id >= ?', (low or 0,))}
+    except sqlite3.OperationalError:
+        return top, []
+    finally:
+        archive.close()
+    clashes = [transaction_id for transaction_id, *row in connection.exec_driver_sql(
+        'SELECT id, timestamp, quantity, user_name FROM transactions WHERE id >= ? ORDER BY id', (low or 0,))
+        if transaction_id in archived and archived[transaction_id] != tuple(row)]
+    return top, clashes
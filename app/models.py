@@ -1,6 +1,9 @@
 """Database models for the inventory management system."""
 from datetime import datetime
+from sqlalchemy import event
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from app import db
+from app.utils import qr_payload, qr_digest
 
 class User(db.Model):
     """User model for authentication."""
@@ -26,7 +29,10 @@ class Item(db.Model):
     quantity = db.Column(db.Integer, nullable=False, default=0)
     qr_code_path = db.Column(db.String(200), nullable=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
-    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
+    # Incremented in SQL by every UPDATE, including bulk ones, for ETags and client sync
+    version = db.Column(db.Integer, nullable=False, default=1, server_default='1',
+                        onupdate=db.literal_column('version') + 1)
     
     # Relationship with transactions
     transactions = db.relationship('Transaction', backref='item', lazy=True, cascade='all, delete-orphan')
@@ -34,6 +40,34 @@ class Item(db.Model):
     def __repr__(self):
         return f'<Item {self.name}>'
     
+    @property
+    def qr_digest(self):
+        """Content hash of this item's QR payload, used in its image URL."""
+        return qr_digest(qr_payload(self.id, self.name))
+    
+    @classmethod
+    def take_stock(cls, item_id, quantity):
+        """
+        Atomically decrement an item's stock within the current transaction.
+        
+        The check and the decrement are a single conditional UPDATE, so two
+        concurrent takes can never both pass the check and oversell.
+        
+        Args:
+            item_id: The item's database ID
+            quantity: Number of units to take (must be positive)
+        
+        Returns:
+            bool: True if the stock was decremented, False if not enough was left
+        """
+        result = db.session.execute(
+            db.update(cls)
+            .where(cls.id == item_id, cls.quantity >= quantity)
+            .values(quantity=cls.quantity - quantity, updated_at=datetime.utcnow())
+            .execution_options(synchronize_session=False, changed_ids=[item_id])
+        )
+        return result.rowcount == 1
+    
     def to_dict(self):
         """Convert item to dictionary."""
         return {
@@ -43,22 +77,53 @@ class Item(db.Model):
             'quantity': self.quantity,
             'qr_code_path': self.qr_code_path,
             'created_at': self.created_at.isoformat() if self.created_at else None,
-            'updated_at': self.updated_at.isoformat() if self.updated_at else None
+            'updated_at': self.updated_at.isoformat() if self.updated_at else None,
+            'version': self.version
         }
+    
+    @property
+    def etag(self):
+        """Strong ETag for this item's current state."""
+        return f'{self.id}-{self.version}'
+
+class ItemTombstone(db.Model):
+    """Deleted item ids, so delta syncs can tell clients to drop them."""
+    __tablename__ = 'item_tombstones'
+    
+    item_id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    deleted_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, index=True)
+
+@event.listens_for(Item, 'after_delete')
+def _record_item_tombstone(mapper, connection, target):
+    connection.execute(
+        sqlite_insert(ItemTombstone.__table__)
+        .values(item_id=target.id, deleted_at=datetime.utcnow())
+        .on_conflict_do_update(index_elements=['item_id'], set_={'deleted_at': datetime.utcnow()})
+    )
 
 class Transaction(db.Model):
     """Transaction log for item movements."""
     __tablename__ = 'transactions'
+    __table_args__ = (
+        # Keyset pagination of the ledger, newest first
+        db.Index('ix_transactions_timestamp_id', 'timestamp', 'id'),
+        # Ids of deleted or archived rows are never handed out again
+        {'sqlite_autoincrement': True},
+    )
     
     id = db.Column(db.Integer, primary_key=True)
-    item_id = db.Column(db.Integer, db.ForeignKey('items.id'), nullable=False)
+    item_id = db.Column(db.Integer, db.ForeignKey('items.id'), nullable=False, index=True)
     user_name = db.Column(db.String(100), nullable=False)
     user_email = db.Column(db.String(120), nullable=True)
+    # Units that left stock; for adjustments, negative when a count found more than expected
     quantity = db.Column(db.Integer, nullable=False)
     purpose = db.Column(db.Text, nullable=True)
     timestamp = db.Column(db.DateTime, default=datetime.utcnow)
+    kind = db.Column(db.String(20), nullable=False, default='take', server_default='take')  # 'take' or 'adjustment'
     
     def __repr__(self):
+        if self.kind == 'adjustment':
+            return f'<Transaction {self.id}: stock count adjusted item {self.item_id} by {-self.quantity:+d}>'
         return f'<Transaction {self.id}: {self.user_name} took {self.quantity} of item {self.item_id}>'
     
     def to_dict(self):
@@ -71,5 +136,143 @@ class Transaction(db.Model):
             'user_email': self.user_email,
             'quantity': self.quantity,
             'purpose': self.purpose,
-            'timestamp': self.timestamp.isoformat() if self.timestamp else None
+            'timestamp': self.timestamp.isoformat() if self.timestamp else None,
+            'kind': self.kind
         }
+
+class EmailOutbox(db.Model):
+    """Outgoing email queued for background delivery."""
+    __tablename__ = 'email_outbox'
+    __table_args__ = (
+        db.Index('ix_email_outbox_status_next_attempt', 'status', 'next_attempt_at'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    to_email = db.Column(db.Text, nullable=False)
+    subject = db.Column(db.String(255), nullable=False)
+    html_content = db.Column(db.Text, nullable=False)
+    status = db.Column(db.String(20), nullable=False, default='pending')  # 'pending', 'sending', 'sent' or 'dead'
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    next_attempt_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    claim_token = db.Column(db.String(32), nullable=True)
+    locked_until = db.Column(db.DateTime, nullable=True)
+    last_error = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    sent_at = db.Column(db.DateTime, nullable=True)
+    
+    def __repr__(self):
+        return f'<EmailOutbox {self.id}: {self.status} to {self.to_email}>'
+
+class ScheduledJob(db.Model):
+    """Run bookkeeping for periodic background jobs, shared by all workers."""
+    __tablename__ = 'scheduled_jobs'
+    
+    name = db.Column(db.String(50), primary_key=True)
+    next_run_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    last_run_at = db.Column(db.DateTime, nullable=True)
+    state = db.Column(db.JSON, nullable=True)
+    
+    def __repr__(self):
+        return f'<ScheduledJob {self.name} next at {self.next_run_at}>'
+
+class ExportJob(db.Model):
+    """Background export request and its cached result file."""
+    __tablename__ = 'export_jobs'
+    
+    id = db.Column(db.String(32), primary_key=True)
+    kind = db.Column(db.String(20), nullable=False)  # 'items' or 'transactions'
+    format = db.Column(db.String(10), nullable=False)  # 'xlsx' or 'csv'
+    status = db.Column(db.String(20), nullable=False, default='queued')  # 'queued', 'running', 'done' or 'failed'
+    watermark = db.Column(db.JSON, nullable=True)
+    file_path = db.Column(db.String(500), nullable=True)
+    error = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime, nullable=True)
+    finished_at = db.Column(db.DateTime, nullable=True)
+    
+    def __repr__(self):
+        return f'<ExportJob {self.id}: {self.kind}.{self.format} {self.status}>'
+    
+    def to_dict(self):
+        """Convert export job to dictionary."""
+        return {
+            'id': self.id,
+            'kind': self.kind,
+            'format': self.format,
+            'status': self.status,
+            'error': self.error,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None
+        }
+
+class ItemDailyUsage(db.Model):
+    """Quantity taken per item per day, kept up to date by a trigger on transactions."""
+    __tablename__ = 'item_daily_usage'
+    __table_args__ = (
+        db.Index('ix_item_daily_usage_day', 'day'),
+    )
+    
+    # No foreign key: usage history outlives archived rows and deleted items
+    item_id = db.Column(db.Integer, primary_key=True)
+    day = db.Column(db.Date, primary_key=True)
+    quantity_taken = db.Column(db.Integer, nullable=False, default=0)
+    transaction_count = db.Column(db.Integer, nullable=False, default=0)
+    
+    def __repr__(self):
+        return f'<ItemDailyUsage item {self.item_id} on {self.day}: {self.quantity_taken}>'
+
+class ItemForecast(db.Model):
+    """Burn rate and reorder point per item, recomputed on a schedule by app.forecast."""
+    __tablename__ = 'item_forecasts'
+    
+    item_id = db.Column(db.Integer, primary_key=True)
+    burn_rate = db.Column(db.Float, nullable=False)  # units per day, exponentially smoothed
+    demand_std = db.Column(db.Float, nullable=False)  # daily variation around the burn rate
+    reorder_point = db.Column(db.Integer, nullable=False)
+    computed_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<ItemForecast item {self.item_id}: {self.burn_rate:.2f}/day, reorder at {self.reorder_point}>'
+
+class ChangeEvent(db.Model):
+    """Committed item and transaction changes, read by every worker's live feed."""
+    __tablename__ = 'change_events'
+    # Ids must never be reused after pruning, since clients resume from them
+    __table_args__ = {'sqlite_autoincrement': True}
+    
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(20), nullable=False)  # 'item', 'item_deleted', 'transaction' or 'reset'
+    payload = db.Column(db.JSON, nullable=True)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, index=True)
+
+class StockCount(db.Model):
+    """A physical stock-count session, reconciled against item quantities by app.stock_count."""
+    __tablename__ = 'stock_counts'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(100), nullable=False)
+    status = db.Column(db.String(20), nullable=False, default='open')  # 'open', 'applied' or 'cancelled'
+    created_by = db.Column(db.String(100), nullable=False)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    applied_by = db.Column(db.String(100), nullable=True)
+    applied_at = db.Column(db.DateTime, nullable=True)
+    # Filled in when applied: items adjusted and the net change in units
+    adjusted_items = db.Column(db.Integer, nullable=True)
+    net_change = db.Column(db.Integer, nullable=True)
+    
+    def __repr__(self):
+        return f'<StockCount {self.id}: {self.name} {self.status}>'
+
+class StockCountLine(db.Model):
+    """Counted quantity of one item in a stock count, with the stock expected when it was counted."""
+    __tablename__ = 'stock_count_lines'
+    
+    count_id = db.Column(db.Integer, db.ForeignKey('stock_counts.id', ondelete='CASCADE'), primary_key=True)
+    # No foreign key: a deleted item's line is simply left out of the diff
+    item_id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    counted = db.Column(db.Integer, nullable=False)
+    expected = db.Column(db.Integer, nullable=False)
+    counted_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<StockCountLine count {self.count_id} item {self.item_id}: {self.counted}/{self.expected}>'
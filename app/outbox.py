@@ -0,0 +1,217 @@
+"""Persistent email outbox with a background dispatcher.
+
+Request handlers call ``enqueue_email`` before committing, so the message
+is stored in the same database transaction as the change it describes.
+A daemon thread in each worker then claims pending messages and delivers
+them, retrying with exponential backoff and moving messages that keep
+failing to the ``dead`` state.  While SMTP is not configured nothing is
+claimed, so queued messages wait as ``pending`` instead of using up their
+attempts.
+"""
+import os
+import threading
+import uuid
+from datetime import datetime, timedelta
+from sqlalchemy import event, or_, and_
+from app import db
+from app.models import EmailOutbox
+from app.mailer import DeliveryDeferred, get_smtp_manager, is_connection_failure
+from app.utils import EmailNotConfiguredError, build_email_message, check_email_configured
+
+_wakeup = threading.Event()
+_dispatcher = None
+_dispatcher_pid = None
+_dispatcher_lock = threading.Lock()
+_unconfigured_logged = False
+
+def _max_attempts():
+    return int(os.getenv('EMAIL_OUTBOX_MAX_ATTEMPTS', 8))
+
+def _backoff_delay(attempts):
+    """Return the delay before the next attempt, doubling each time."""
+    base = float(os.getenv('EMAIL_OUTBOX_BACKOFF_SECONDS', 30))
+    cap = float(os.getenv('EMAIL_OUTBOX_BACKOFF_MAX_SECONDS', 3600))
+    return timedelta(seconds=min(cap, base * (2 ** max(attempts - 1, 0))))
+
+def enqueue_email(to_email, subject, html_content):
+    """
+    Queue an email for background delivery.
+    
+    The message is added to the current session but not committed, so it
+    is only sent if the caller's transaction commits.
+    
+    Args:
+        to_email: Recipient email address (can be a list)
+        subject: Email subject
+        html_content: HTML content of the email
+    
+    Returns:
+        EmailOutbox: The queued message
+    """
+    message = EmailOutbox(
+        to_email=to_email if isinstance(to_email, str) else ', '.join(to_email),
+        subject=subject,
+        html_content=html_content,
+    )
+    db.session.add(message)
+    db.session.info['outbox_dirty'] = True
+    return message
+
+def notify():
+    """Wake the dispatcher so freshly committed messages go out immediately."""
+    _wakeup.set()
+
+@event.listens_for(db.session, 'after_commit')
+def _notify_after_commit(session):
+    if session.info.pop('outbox_dirty', False):
+        notify()
+
+@event.listens_for(db.session, 'after_rollback')
+def _clear_after_rollback(session):
+    session.info.pop('outbox_dirty', None)
+
+def _claim_batch(batch_size):
+    """
+    Atomically claim up to ``batch_size`` due messages for this worker.
+    
+    Messages left in ``sending`` by a worker that died are reclaimed once
+    their lease expires.
+    """
+    now = datetime.utcnow()
+    lease = timedelta(seconds=float(os.getenv('EMAIL_OUTBOX_LEASE_SECONDS', 300)))
+    token = uuid.uuid4().hex
+    
+    due = or_(
+        and_(EmailOutbox.status == 'pending', EmailOutbox.next_attempt_at <= now),
+        and_(EmailOutbox.status == 'sending', EmailOutbox.locked_until < now),
+    )
+    candidates = (db.select(EmailOutbox.id)
+                  .where(due)
+                  .order_by(EmailOutbox.next_attempt_at)
+                  .limit(batch_size)
+                  .scalar_subquery())
+    
+    db.session.execute(
+        db.update(EmailOutbox)
+        .where(EmailOutbox.id.in_(candidates), due)
+        .values(status='sending', claim_token=token, locked_until=now + lease)
+    )
+    db.session.commit()
+    
+    return EmailOutbox.query.filter_by(claim_token=token, status='sending').order_by(EmailOutbox.id).all()
+
+def _record_result(message, error=None):
+    """Mark a claimed message as sent, or schedule its retry."""
+    message.claim_token = None
+    message.locked_until = None
+    if isinstance(error, DeliveryDeferred):
+        # Never tried, so no attempt is used up; wait as long as a failure would
+        message.status = 'pending'
+        message.last_error = str(error)
+        message.next_attempt_at = datetime.utcnow() + _backoff_delay(message.attempts + 1)
+    elif error is None:
+        message.status = 'sent'
+        message.sent_at = datetime.utcnow()
+        message.last_error = None
+    else:
+        message.attempts += 1
+        message.last_error = str(error)
+        if message.attempts >= _max_attempts():
+            message.status = 'dead'
+            print(f"Email {message.id} to {message.to_email} moved to dead letters: {error}")
+        else:
+            message.status = 'pending'
+            message.next_attempt_at = datetime.utcnow() + _backoff_delay(message.attempts)
+    db.session.commit()
+
+def dispatch_pending(batch_size=None):
+    """
+    Deliver due messages until none are left.
+    
+    Must be called inside an application context.
+    
+    Stops early when the SMTP relay is unreachable; the messages not tried
+    go back to pending.  Does nothing while SMTP is not configured.
+    
+    Returns:
+        tuple: (sent, failed) counts for this run
+    """
+    global _unconfigured_logged
+    try:
+        check_email_configured()
+    except EmailNotConfiguredError as e:
+        if not _unconfigured_logged:
+            print(f"Email outbox paused, queued messages are kept: {str(e)}")
+            _unconfigured_logged = True
+        return 0, 0
+    _unconfigured_logged = False
+    
+    batch_size = batch_size or int(os.getenv('EMAIL_OUTBOX_BATCH_SIZE', 50))
+    sent = failed = 0
+    
+    while True:
+        batch = _claim_batch(batch_size)
+        if not batch:
+            break
+        
+        # Build every message first, then push the batch over one SMTP session
+        outgoing, results = [], {}
+        for message in batch:
+            try:
+                outgoing.append((message, build_email_message(message.to_email, message.subject,
+                                                              message.html_content)))
+            except Exception as e:
+                results[message.id] = e
+        
+        errors = get_smtp_manager().send_many(msg for _, msg in outgoing)
+        for (message, _), error in zip(outgoing, errors):
+            results[message.id] = error
+        
+        unreachable = False
+        for message in batch:
+            error = results[message.id]
+            _record_result(message, error)
+            if error is None:
+                sent += 1
+            elif isinstance(error, DeliveryDeferred):
+                unreachable = True
+            else:
+                failed += 1
+                unreachable = unreachable or is_connection_failure(error)
+        # Later batches would only wait out the same timeout
+        if unreachable:
+            break
+    
+    return sent, failed
+
+def _run_dispatcher(app):
+    interval = float(os.getenv('EMAIL_OUTBOX_POLL_SECONDS', 10))
+    while True:
+        _wakeup.wait(interval)
+        _wakeup.clear()
+        try:
+            with app.app_context():
+                dispatch_pending()
+            get_smtp_manager().close_if_idle()
+        except Exception as e:
+            print(f"Email outbox dispatcher error: {str(e)}")
+
+def start_dispatcher(app):
+    """
+    Start the dispatcher thread for this process, once.
+    
+    Safe to call on every request: the thread is (re)started only if this
+    process does not have one yet, which also covers workers forked from a
+    preloaded master.
+    """
+    global _dispatcher, _dispatcher_pid
+    if _dispatcher_pid == os.getpid():
+        return
+    
+    with _dispatcher_lock:
+        if _dispatcher_pid == os.getpid():
+            return
+        _dispatcher = threading.Thread(target=_run_dispatcher, args=(app,),
+                                       name='email-outbox', daemon=True)
+        _dispatcher.start()
+        _dispatcher_pid = os.getpid()
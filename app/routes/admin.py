@@ -1,13 +1,26 @@
 """Admin routes for inventory management."""
+import itertools
 import os
-from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify, send_file
+from flask import (Blueprint, render_template, request, redirect, url_for, flash, jsonify, send_file,
+                   Response, stream_with_context, current_app, session, abort)
 from app import db
-from app.models import Item, Transaction
-from app.utils import generate_qr_code, send_email, create_item_added_email
+from app.models import Item, StockCount, Transaction
+from app.utils import qr_code_path, create_item_added_email
+from app.outbox import enqueue_email
+from app.digest import admin_digest_enabled
 from app.routes.auth import login_required
-import pandas as pd
-from io import BytesIO
-from datetime import datetime
+from app.export_jobs import submit_export, get_job
+from app.stats import get_dashboard_stats
+from app.forecast import reorder_points
+from app.labels import LABEL_FORMATS, label_items, render_label_sheets
+from app.imports import import_items, read_import_rows
+from app.stock_count import (COUNT_HEADER_ALIASES, COUNT_KEY_FIELDS, create_count, list_counts, record_counts,
+                             count_summary, count_differences, apply_count, cancel_count)
+from app.search import search_items, pagination_dict
+from app.ledger import has_archived_transactions, iter_archived_transaction_rows
+from app.exports import (ITEM_COLUMNS, TRANSACTION_COLUMNS, CSV_MIMETYPE, XLSX_MIMETYPE,
+                         iter_item_rows, iter_transaction_rows, stream_csv, xlsx_tempfile)
+from datetime import datetime, timedelta
 
 bp = Blueprint('admin', __name__, url_prefix='/admin')
 
@@ -15,25 +28,35 @@ bp = Blueprint('admin', __name__, url_prefix='/admin')
 @login_required(role='admin')
 def dashboard():
     """Admin dashboard."""
-    items = Item.query.all()
-    transactions = Transaction.query.order_by(Transaction.timestamp.desc()).limit(10).all()
-    total_items = len(items)
-    total_transactions = Transaction.query.count()
-    low_stock_items = Item.query.filter(Item.quantity <= 5).all()
+    stats = get_dashboard_stats()
     
     return render_template('admin/dashboard.html', 
-                         items=items, 
-                         transactions=transactions,
-                         total_items=total_items,
-                         total_transactions=total_transactions,
-                         low_stock_items=low_stock_items)
+                         transactions=stats['recent_transactions'],
+                         total_items=stats['total_items'],
+                         total_transactions=stats['total_transactions'],
+                         low_stock_count=stats['low_stock_count'],
+                         low_stock_items=stats['low_stock_items'])
 
 @bp.route('/items')
 @login_required(role='admin')
 def items():
-    """View all items."""
-    items = Item.query.all()
-    return render_template('admin/items.html', items=items)
+    """View items, one page at a time, optionally filtered by a search."""
+    query = request.args.get('q', '').strip()
+    pagination = search_items(query, page=request.args.get('page', 1, type=int))
+    return render_template('admin/items.html', 
+                         items=pagination.items,
+                         reorder_points=reorder_points(item.id for item in pagination.items),
+                         pagination=pagination,
+                         query=query)
+
+@bp.route('/api/items/search')
+@login_required(role='admin')
+def api_search_items():
+    """Search items by name and description (prefix match, ranked)."""
+    query = request.args.get('q', '').strip()
+    pagination = search_items(query, page=request.args.get('page', 1, type=int),
+                              per_page=request.args.get('per_page', type=int))
+    return jsonify(pagination_dict(pagination, query))
 
 @bp.route('/items/add', methods=['GET', 'POST'])
 @login_required(role='admin')
@@ -57,25 +80,54 @@ def add_item():
         # Create new item
         new_item = Item(name=name, description=description, quantity=quantity)
         db.session.add(new_item)
-        db.session.commit()
         
-        # Generate QR code
-        qr_path = generate_qr_code(new_item.id, new_item.name)
-        if qr_path:
-            new_item.qr_code_path = qr_path
-            db.session.commit()
-        
-        # Send email notification to admin
+        # Queue email notification to admin, committed together with the item
         admin_email = os.getenv('ADMIN_EMAIL')
-        if admin_email:
+        if admin_email and not admin_digest_enabled():
             email_content = create_item_added_email(name, quantity, description)
-            send_email(admin_email, 'New Item Added to Inventory', email_content)
+            enqueue_email(admin_email, 'New Item Added to Inventory', email_content)
+        
+        db.session.commit()
+        
+        # Point at the QR code; the image is rendered on first request
+        new_item.qr_code_path = qr_code_path(new_item.id, new_item.name)
+        db.session.commit()
         
         flash(f'Item "{name}" added successfully!', 'success')
         return redirect(url_for('admin.items'))
     
     return render_template('admin/add_item.html')
 
+@bp.route('/items/import', methods=['GET', 'POST'])
+@login_required(role='admin')
+def import_items_view():
+    """Bulk add or update items from a CSV or Excel file."""
+    if request.method == 'POST':
+        upload = request.files.get('file')
+        if not upload or not upload.filename:
+            flash('Choose a CSV or Excel file to import', 'danger')
+            return redirect(url_for('admin.import_items_view'))
+        
+        fmt = os.path.splitext(upload.filename)[1].lower().lstrip('.')
+        try:
+            report = import_items(read_import_rows(upload.stream, fmt),
+                                  update_existing=request.form.get('existing') != 'skip')
+        except ValueError as e:
+            flash(str(e), 'danger')
+            return redirect(url_for('admin.import_items_view'))
+        
+        if report['read_error']:
+            flash(f'{report["read_error"]}. The rows before it were imported: {report["inserted"]} new and '
+                  f'{report["updated"]} updated item(s).', 'danger')
+            return render_template('admin/import_items.html', report=report)
+        
+        flash(f'Imported {report["inserted"]} new and updated {report["updated"]} existing item(s); '
+              f'{report["error_count"]} row(s) rejected.',
+              'warning' if report['error_count'] else 'success')
+        return render_template('admin/import_items.html', report=report)
+    
+    return render_template('admin/import_items.html', report=None)
+
 @bp.route('/items/edit/<int:item_id>', methods=['GET', 'POST'])
 @login_required(role='admin')
 def edit_item(item_id):
@@ -91,15 +143,9 @@ def edit_item(item_id):
             flash('Item name is required', 'danger')
             return redirect(url_for('admin.edit_item', item_id=item_id))
         
-        # Regenerate QR code if name changed
-        if item.qr_code_path:
-            old_qr_path = os.path.join('app', item.qr_code_path)
-            if os.path.exists(old_qr_path):
-                os.remove(old_qr_path)
-        
-        qr_path = generate_qr_code(item.id, item.name)
-        if qr_path:
-            item.qr_code_path = qr_path
+        # QR images are named by a hash of their payload, so only a rename
+        # changes the path; the old image is removed by 'flask qr gc'
+        item.qr_code_path = qr_code_path(item.id, item.name)
         
         db.session.commit()
         flash(f'Item "{item.name}" updated successfully!', 'success')
@@ -115,7 +161,7 @@ def delete_item(item_id):
     
     # Delete QR code file
     if item.qr_code_path:
-        qr_path = os.path.join('app', item.qr_code_path)
+        qr_path = os.path.join(current_app.root_path, item.qr_code_path)
         if os.path.exists(qr_path):
             os.remove(qr_path)
     
@@ -125,72 +171,313 @@ def delete_item(item_id):
     flash(f'Item "{item.name}" deleted successfully!', 'success')
     return redirect(url_for('admin.items'))
 
-@bp.route('/transactions')
+@bp.route('/items/labels', methods=['POST'])
 @login_required(role='admin')
-def transactions():
-    """View all transactions."""
-    transactions = Transaction.query.order_by(Transaction.timestamp.desc()).all()
-    return render_template('admin/transactions.html', transactions=transactions)
+def print_labels():
+    """Download printable QR label sheets for the selected items, or all of them."""
+    fmt = request.form.get('format', 'pdf')
+    if fmt not in LABEL_FORMATS:
+        flash('Unknown label format', 'danger')
+        return redirect(url_for('admin.items'))
+    
+    item_ids = None
+    if request.form.get('scope') != 'all':
+        item_ids = request.form.getlist('item_ids', type=int)
+        if not item_ids:
+            flash('Select at least one item to print labels for', 'warning')
+            return redirect(url_for('admin.items'))
+    
+    items = label_items(item_ids)
+    if not items:
+        flash('No items to print labels for', 'warning')
+        return redirect(url_for('admin.items'))
+    
+    output, mimetype, extension = render_label_sheets(items, fmt)
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    return send_file(output, 
+                    mimetype=mimetype,
+                    as_attachment=True,
+                    download_name=f'qr_labels_{timestamp}.{extension}')
 
-@bp.route('/export/items')
+TRANSACTIONS_PER_PAGE = 50
+
+def _encode_cursor(timestamp, transaction_id):
+    """Encode a (timestamp, id) keyset position for use in a URL."""
+    return f"{timestamp.isoformat()}_{transaction_id}"
+
+def _decode_cursor(cursor):
+    """Decode a cursor from _encode_cursor, or return None if it is malformed."""
+    try:
+        timestamp, transaction_id = cursor.rsplit('_', 1)
+        return datetime.fromisoformat(timestamp), int(transaction_id)
+    except (AttributeError, ValueError):
+        return None
+
+def _parse_date(value):
+    try:
+        return datetime.strptime(value, '%Y-%m-%d') if value else None
+    except ValueError:
+        return None
+
+@bp.route('/transactions')
 @login_required(role='admin')
-def export_items():
-    """Export items to Excel."""
-    items = Item.query.all()
+def transactions():
+    """View transactions, newest first, one keyset page at a time."""
+    filters = {
+        'item_id': request.args.get('item_id', type=int),
+        'item': request.args.get('item', '').strip(),
+        'user': request.args.get('user', '').strip(),
+        'date_from': request.args.get('date_from', '').strip(),
+        'date_to': request.args.get('date_to', '').strip(),
+    }
     
-    # Create DataFrame
-    data = [{
-        'ID': item.id,
-        'Name': item.name,
-        'Description': item.description or '',
-        'Quantity': item.quantity,
-        'Created At': item.created_at.strftime('%Y-%m-%d %H:%M:%S') if item.created_at else '',
-        'Updated At': item.updated_at.strftime('%Y-%m-%d %H:%M:%S') if item.updated_at else ''
-    } for item in items]
+    # One query fetches each row together with its item name (no lazy load per row)
+    query = (db.session.query(Transaction, Item.name)
+             .outerjoin(Item, Transaction.item_id == Item.id))
     
-    df = pd.DataFrame(data)
+    if filters['item_id']:
+        query = query.filter(Transaction.item_id == filters['item_id'])
+    if filters['item']:
+        query = query.filter(Item.name.ilike(f"%{filters['item']}%"))
+    if filters['user']:
+        query = query.filter(Transaction.user_name.ilike(f"%{filters['user']}%"))
+    date_from = _parse_date(filters['date_from'])
+    if date_from:
+        query = query.filter(Transaction.timestamp >= date_from)
+    date_to = _parse_date(filters['date_to'])
+    if date_to:
+        query = query.filter(Transaction.timestamp < date_to + timedelta(days=1))
     
-    # Create Excel file in memory
-    output = BytesIO()
-    with pd.ExcelWriter(output, engine='openpyxl') as writer:
-        df.to_excel(writer, index=False, sheet_name='Items')
+    # Keyset pagination on (timestamp, id): 'before' pages towards older rows,
+    # 'after' pages back towards newer rows
+    position = db.tuple_(Transaction.timestamp, Transaction.id)
+    before = _decode_cursor(request.args.get('before'))
+    after = _decode_cursor(request.args.get('after'))
+    if after:
+        query = (query.filter(position > db.tuple_(*after))
+                 .order_by(Transaction.timestamp.asc(), Transaction.id.asc()))
+    else:
+        if before:
+            query = query.filter(position < db.tuple_(*before))
+        query = query.order_by(Transaction.timestamp.desc(), Transaction.id.desc())
+    
+    rows = query.limit(TRANSACTIONS_PER_PAGE + 1).all()
+    has_more = len(rows) > TRANSACTIONS_PER_PAGE
+    rows = rows[:TRANSACTIONS_PER_PAGE]
+    if after:
+        rows.reverse()
+    
+    older_cursor = newer_cursor = None
+    if rows:
+        first, last = rows[0][0], rows[-1][0]
+        if has_more or after:
+            older_cursor = _encode_cursor(last.timestamp, last.id)
+        if before or (after and has_more):
+            newer_cursor = _encode_cursor(first.timestamp, first.id)
+    
+    active_filters = {key: value for key, value in filters.items() if value}
+    return render_template('admin/transactions.html',
+                         transactions=rows,
+                         filters=filters,
+                         active_filters=active_filters,
+                         older_cursor=older_cursor,
+                         newer_cursor=newer_cursor,
+                         has_archive=has_archived_transactions())
+
+def _export_response(basename, sheet_name, columns, rows):
+    """Stream CSV, or send an Excel file written in write-only mode."""
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
     
-    output.seek(0)
+    if request.args.get('format') == 'csv':
+        response = Response(stream_with_context(stream_csv(columns, rows)), mimetype=CSV_MIMETYPE)
+        response.headers['Content-Disposition'] = f'attachment; filename={basename}_{timestamp}.csv'
+        return response
     
-    filename = f'inventory_items_{datetime.now().strftime("%Y%m%d_%H%M%S")}.xlsx'
+    output = xlsx_tempfile(sheet_name, columns, rows)
     return send_file(output, 
-                    mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+                    mimetype=XLSX_MIMETYPE,
                     as_attachment=True,
-                    download_name=filename)
+                    download_name=f'{basename}_{timestamp}.xlsx')
+
+@bp.route('/export/items')
+@login_required(role='admin')
+def export_items():
+    """Export items to Excel (or CSV with ?format=csv)."""
+    return _export_response('inventory_items', 'Items', ITEM_COLUMNS, iter_item_rows())
 
 @bp.route('/export/transactions')
 @login_required(role='admin')
 def export_transactions():
-    """Export transactions to Excel."""
-    transactions = Transaction.query.order_by(Transaction.timestamp.desc()).all()
-    
-    # Create DataFrame
-    data = [{
-        'ID': t.id,
-        'Item Name': t.item.name if t.item else 'Unknown',
-        'User Name': t.user_name,
-        'User Email': t.user_email or '',
-        'Quantity': t.quantity,
-        'Purpose': t.purpose or '',
-        'Timestamp': t.timestamp.strftime('%Y-%m-%d %H:%M:%S') if t.timestamp else ''
-    } for t in transactions]
-    
-    df = pd.DataFrame(data)
-    
-    # Create Excel file in memory
-    output = BytesIO()
-    with pd.ExcelWriter(output, engine='openpyxl') as writer:
-        df.to_excel(writer, index=False, sheet_name='Transactions')
-    
-    output.seek(0)
-    
-    filename = f'inventory_transactions_{datetime.now().strftime("%Y%m%d_%H%M%S")}.xlsx'
-    return send_file(output, 
-                    mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+    """Export transactions to Excel (or CSV with ?format=csv); ?archived=1 adds archived rows."""
+    rows = iter_transaction_rows()
+    if request.args.get('archived') == '1':
+        rows = itertools.chain(iter_archived_transaction_rows(), rows)
+    return _export_response('inventory_transactions', 'Transactions', TRANSACTION_COLUMNS, rows)
+
+def _export_job_response(job):
+    body = job.to_dict()
+    body['status_url'] = url_for('admin.export_job_status', job_id=job.id)
+    if job.status == 'done':
+        body['download_url'] = url_for('admin.download_export_job', job_id=job.id)
+    return jsonify(body)
+
+@bp.route('/export/jobs', methods=['POST'])
+@login_required(role='admin')
+def submit_export_job():
+    """Start a background export, answering at once if a cached file is current."""
+    data = request.get_json(silent=True)
+    if data is not None and not isinstance(data, dict):
+        return jsonify({'error': 'Expected a JSON object with kind and format'}), 400
+    data = data or request.form
+    try:
+        job = submit_export(data.get('kind', ''), data.get('format', 'xlsx'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return _export_job_response(job), 202
+
+@bp.route('/export/jobs/<job_id>')
+@login_required(role='admin')
+def export_job_status(job_id):
+    """Poll the status of a background export."""
+    job = get_job(job_id)
+    if job is None:
+        return jsonify({'error': 'Export job not found'}), 404
+    return _export_job_response(job)
+
+@bp.route('/export/jobs/<job_id>/download')
+@login_required(role='admin')
+def download_export_job(job_id):
+    """Download the file produced by a finished export job."""
+    job = get_job(job_id)
+    if job is None or job.status != 'done':
+        return jsonify({'error': 'Export is not ready'}), 404
+    if not job.file_path or not os.path.exists(job.file_path):
+        return jsonify({'error': 'Export file has expired, please export again'}), 410
+    
+    finished = job.finished_at or datetime.utcnow()
+    return send_file(job.file_path,
+                    mimetype=XLSX_MIMETYPE if job.format == 'xlsx' else CSV_MIMETYPE,
                     as_attachment=True,
-                    download_name=filename)
+                    download_name=f'inventory_{job.kind}_{finished.strftime("%Y%m%d_%H%M%S")}.{job.format}')
+
+DIFFERENCES_PER_PAGE = 100
+
+@bp.route('/stock-counts', methods=['GET', 'POST'])
+@login_required(role='admin')
+def stock_counts():
+    """List stock counts, or start a new one."""
+    if request.method == 'POST':
+        count = create_count(request.form.get('name', '').strip(), session.get('username'))
+        flash(f'Stock count "{count.name}" started', 'success')
+        return redirect(url_for('admin.stock_count', count_id=count.id))
+    
+    return render_template('admin/stock_counts.html', counts=list_counts())
+
+@bp.route('/stock-counts/<int:count_id>')
+@login_required(role='admin')
+def stock_count(count_id):
+    """Review a stock count: totals and the items whose count differs from stock."""
+    count = db.session.get(StockCount, count_id) or abort(404)
+    return _render_stock_count(count, max(request.args.get('page', 1, type=int), 1))
+
+def _render_stock_count(count, page, report=None):
+    summary = count_summary(count.id)
+    return render_template('admin/stock_count.html',
+                         count=count,
+                         summary=summary,
+                         differences=count_differences(count.id, page, DIFFERENCES_PER_PAGE),
+                         page=page,
+                         has_next=page * DIFFERENCES_PER_PAGE < summary['over'] + summary['short'],
+                         report=report)
+
+@bp.route('/stock-counts/<int:count_id>/upload', methods=['POST'])
+@login_required(role='admin')
+def upload_stock_count(count_id):
+    """Add counts from a CSV or Excel count sheet."""
+    count = db.session.get(StockCount, count_id) or abort(404)
+    upload = request.files.get('file')
+    if not upload or not upload.filename:
+        flash('Choose a CSV or Excel file with the counts', 'danger')
+        return redirect(url_for('admin.stock_count', count_id=count_id))
+    
+    fmt = os.path.splitext(upload.filename)[1].lower().lstrip('.')
+    try:
+        rows = read_import_rows(upload.stream, fmt, aliases=COUNT_HEADER_ALIASES, key_fields=COUNT_KEY_FIELDS)
+        report = record_counts(count_id, rows, mode=request.form.get('mode', 'set'))
+    except ValueError as e:
+        # Also a sheet that stops being readable part-way: none of it is recorded
+        db.session.rollback()
+        flash(str(e), 'danger')
+        return redirect(url_for('admin.stock_count', count_id=count_id))
+    
+    flash(f'Recorded counts for {report["items"]} item(s); {report["error_count"]} row(s) rejected.',
+          'warning' if report['error_count'] else 'success')
+    return _render_stock_count(count, 1, report)
+
+@bp.route('/stock-counts/<int:count_id>/apply', methods=['POST'])
+@login_required(role='admin')
+def apply_stock_count(count_id):
+    """Correct stock for every difference in the count, in one transaction."""
+    try:
+        count = apply_count(count_id, session.get('username'))
+    except ValueError as e:
+        flash(str(e), 'danger')
+        return redirect(url_for('admin.stock_count', count_id=count_id))
+    
+    flash(f'Applied "{count.name}": adjusted {count.adjusted_items} item(s), net change {count.net_change:+d} unit(s).',
+          'success')
+    return redirect(url_for('admin.stock_count', count_id=count_id))
+
+@bp.route('/stock-counts/<int:count_id>/cancel', methods=['POST'])
+@login_required(role='admin')
+def cancel_stock_count(count_id):
+    """Close a stock count without changing any stock."""
+    try:
+        count = cancel_count(count_id)
+    except ValueError as e:
+        flash(str(e), 'danger')
+        return redirect(url_for('admin.stock_count', count_id=count_id))
+    
+    flash(f'Stock count "{count.name}" cancelled', 'info')
+    return redirect(url_for('admin.stock_counts'))
+
+@bp.route('/api/stock-counts/<int:count_id>/lines', methods=['POST'])
+@login_required(role='admin')
+def api_stock_count_lines(count_id):
+    """
+    Record counts sent by a scanner or another tool.
+    
+    Body: ``{"lines": [{"item_id": 1, "counted": 12}, {"name": "Cable", "counted": 3}],
+    "mode": "set"}``; with ``"mode": "add"`` counts are added to earlier ones.
+    """
+    data = request.get_json(silent=True) or {}
+    if not isinstance(data, dict):
+        return jsonify({'error': 'Expected a JSON object with lines'}), 400
+    lines = data.get('lines')
+    if not isinstance(lines, list) or not all(isinstance(line, dict) for line in lines):
+        return jsonify({'error': 'lines must be a list of objects'}), 400
+    rows = ((number, {'id': line.get('item_id'), 'name': line.get('name'), 'counted': line.get('counted')})
+            for number, line in enumerate(lines, 1))
+    try:
+        report = record_counts(count_id, rows, mode=data.get('mode', 'set'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    report['summary'] = count_summary(count_id)
+    return jsonify(report)
+
+@bp.route('/api/stock-counts/<int:count_id>/differences')
+@login_required(role='admin')
+def api_stock_count_differences(count_id):
+    """Totals of a stock count and one page of its differences."""
+    count = db.session.get(StockCount, count_id)
+    if count is None:
+        return jsonify({'error': 'Stock count not found'}), 404
+    page = max(request.args.get('page', 1, type=int), 1)
+    return jsonify({
+        'id': count.id,
+        'name': count.name,
+        'status': count.status,
+        'summary': count_summary(count_id),
+        'page': page,
+        'differences': count_differences(count_id, page, DIFFERENCES_PER_PAGE),
+    })
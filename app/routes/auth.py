@@ -4,9 +4,6 @@ from flask import Blueprint, render_template, request, redirect, url_for, sessio
 from werkzeug.security import check_password_hash, generate_password_hash
 from app import db
 from app.models import User
-from dotenv import load_dotenv
-
-load_dotenv()
 
 bp = Blueprint('auth', __name__)
 
@@ -0,0 +1,138 @@
+"""Server-sent event streams for live stock updates.
+
+Each open stream holds one worker thread until it expires, so a worker
+serves at most ``SSE_MAX_STREAMS`` of them at once and answers further
+ones with a 503 and ``Retry-After``.  The rest of its threads stay free
+for takes, checkouts and page loads however many dashboards are open.
+"""
+import json
+import os
+import queue
+import threading
+import time
+from flask import Blueprint, Response, current_app, jsonify, request, session
+from app.change_feed import subscribe, unsubscribe, read_events, oldest_event_id, latest_event_id
+from app.routes.auth import login_required
+
+bp = Blueprint('events', __name__, url_prefix='/events')
+
+# Event kinds each role may see; transactions name the people taking items
+VISIBLE_KINDS = {
+    'admin': {'item', 'item_deleted', 'transaction', 'reset'},
+    'user': {'item', 'item_deleted', 'reset'},
+}
+
+# A client further behind than this reloads instead of replaying
+REPLAY_LIMIT = 1000
+
+# Seconds a client turned away because the worker is full waits before retrying
+STREAM_RETRY_AFTER = 30
+
+_open_streams = 0
+_streams_lock = threading.Lock()
+
+def _max_streams():
+    return int(os.getenv('SSE_MAX_STREAMS', 4))
+
+def _acquire_stream():
+    """Take one of this worker's stream slots; False if all are in use."""
+    global _open_streams
+    with _streams_lock:
+        if _open_streams >= _max_streams():
+            return False
+        _open_streams += 1
+        return True
+
+def _release_stream():
+    global _open_streams
+    with _streams_lock:
+        _open_streams -= 1
+
+def _format_event(event_id, kind, payload):
+    return f'id: {event_id}\nevent: {kind}\ndata: {json.dumps(payload)}\n\n'
+
+def _stream(subscriber, backlog, last_id, kinds):
+    """Yield the replayed backlog, then live events until the stream expires."""
+    heartbeat = int(os.getenv('SSE_HEARTBEAT_SECONDS', 15))
+    expires = time.monotonic() + int(os.getenv('SSE_MAX_SECONDS', 300))
+    try:
+        # Ask the browser to wait a little before reconnecting after expiry
+        yield 'retry: 2000\n\n'
+        for event_id, kind, payload in backlog:
+            if kind in kinds:
+                yield _format_event(event_id, kind, payload)
+        
+        while time.monotonic() < expires:
+            try:
+                events = subscriber.get(timeout=heartbeat)
+            except queue.Empty:
+                yield ': keep-alive\n\n'
+                continue
+            if events is None:
+                # Fell behind and was dropped by the feed; reconnect and replay
+                return
+            for event_id, kind, payload in events:
+                # Events replayed from the log may also arrive from the feed
+                if event_id > last_id:
+                    last_id = event_id
+                    if kind in kinds:
+                        yield _format_event(event_id, kind, payload)
+    finally:
+        unsubscribe(subscriber)
+
+@bp.route('/stock')
+@login_required()
+def stock():
+    """
+    Stream item quantity changes (and, for admins, new transactions).
+    
+    Clients resume with the ``Last-Event-ID`` header that EventSource sends
+    on reconnect.  A client that has been away longer than the retained log
+    gets a ``reset`` event and should reload.  When this worker already
+    serves ``SSE_MAX_STREAMS`` streams the answer is a 503 with
+    ``Retry-After``.
+    """
+    if not _acquire_stream():
+        response = jsonify({'error': 'Too many live update streams on this worker; retry later'})
+        response.status_code = 503
+        response.headers['Retry-After'] = str(STREAM_RETRY_AFTER)
+        return response
+    
+    subscriber = None
+    try:
+        # Subscribe before reading the backlog so no event falls in between
+        subscriber = subscribe(current_app._get_current_object())
+        last_id = request.headers.get('Last-Event-ID', type=int)
+        if last_id is None:
+            last_id = request.args.get('last_event_id', type=int)
+        
+        backlog = []
+        if last_id is None:
+            last_id = latest_event_id()
+        else:
+            oldest = oldest_event_id()
+            backlog = read_events(last_id, limit=REPLAY_LIMIT + 1)
+            if (oldest is not None and oldest > last_id + 1) or len(backlog) > REPLAY_LIMIT:
+                # Missed events were pruned, or there are too many to replay
+                latest = latest_event_id()
+                backlog = [(latest, 'reset', None)]
+            if backlog:
+                last_id = backlog[-1][0]
+    except Exception:
+        if subscriber is not None:
+            unsubscribe(subscriber)
+        _release_stream()
+        raise
+    
+    kinds = VISIBLE_KINDS.get(session.get('role'), VISIBLE_KINDS['user'])
+    response = Response(_stream(subscriber, backlog, last_id, kinds),
+                        mimetype='text/event-stream',
+                        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+    
+    # On close as well as in the generator, which never runs if the client leaves first
+    @response.call_on_close
+    def _close():
+        unsubscribe(subscriber)
+        _release_stream()
+    
+    return response
@@ -0,0 +1,22 @@
+"""Prometheus scrape endpoint.
+
+The response sums the snapshots of every worker (see ``app.metrics``), so
+it does not matter which worker answers the scrape.  When METRICS_TOKEN is
+set, scrapers must send it as a bearer token.
+"""
+import hmac
+import os
+from flask import Blueprint, Response, abort, request
+from app.metrics import collect, render_prometheus, metrics_enabled
+
+bp = Blueprint('metrics', __name__)
+
+@bp.route('/metrics')
+def metrics():
+    """Request, query and operation metrics in the Prometheus text format."""
+    if not metrics_enabled():
+        abort(404)
+    token = os.getenv('METRICS_TOKEN')
+    if token and not hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}'):
+        abort(401)
+    return Response(render_prometheus(collect()), mimetype='text/plain; version=0.0.4')
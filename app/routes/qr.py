@@ -0,0 +1,67 @@
+"""QR code image routes.
+
+Images are addressed by a hash of their payload, rendered on first request
+and cached on disk and in a per-process LRU of encoded PNG bytes.  Because
+a URL's content never changes, responses carry a strong ETag and a
+year-long immutable Cache-Control header.
+"""
+import os
+import threading
+from collections import OrderedDict
+from flask import Blueprint, Response, abort, request
+from app.item_cache import get_item
+from app.utils import qr_codes_dir, generate_qr_code
+
+bp = Blueprint('qr', __name__, url_prefix='/qr')
+
+QR_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+_png_cache = OrderedDict()
+_png_cache_lock = threading.Lock()
+
+def _cache_get(digest):
+    with _png_cache_lock:
+        png = _png_cache.get(digest)
+        if png is not None:
+            _png_cache.move_to_end(digest)
+        return png
+
+def _cache_put(digest, png):
+    capacity = int(os.getenv('QR_CACHE_SIZE', 512))
+    with _png_cache_lock:
+        _png_cache[digest] = png
+        _png_cache.move_to_end(digest)
+        while len(_png_cache) > capacity:
+            _png_cache.popitem(last=False)
+
+def _png_response(digest, png):
+    response = Response(png, mimetype='image/png')
+    response.set_etag(digest)
+    response.headers['Cache-Control'] = QR_CACHE_CONTROL
+    return response
+
+@bp.route('/<int:item_id>/<digest>.png')
+def image(item_id, digest):
+    """Serve an item's QR code, rendering it the first time it is requested."""
+    # Content-addressed: a matching validator means the client already has these bytes
+    if digest in request.if_none_match:
+        response = Response(status=304)
+        response.set_etag(digest)
+        response.headers['Cache-Control'] = QR_CACHE_CONTROL
+        return response
+    
+    png = _cache_get(digest)
+    if png is not None:
+        return _png_response(digest, png)
+    
+    item = get_item(item_id)
+    if item is None or item['qr_digest'] != digest:
+        abort(404)
+    name = item['name']
+    
+    if generate_qr_code(item_id, name) is None:
+        abort(500)
+    with open(os.path.join(qr_codes_dir(), f'{digest}.png'), 'rb') as f:
+        png = f.read()
+    _cache_put(digest, png)
+    return _png_response(digest, png)
@@ -1,9 +1,11 @@
 """User routes for taking items."""
-import os
-from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify
-from app import db
-from app.models import Item, Transaction
-from app.utils import send_email, create_item_taken_email
+from flask import (Blueprint, Response, abort, render_template, request, redirect, url_for, flash, jsonify,
+                   stream_with_context)
+from app.item_cache import get_item
+from app.item_batch import NDJSON_MIMETYPE, parse_batch_request, batch_etag, iter_batch_lines
+from app.checkout import checkout, InsufficientStockError
+from app.search import search_items, pagination_dict
+from app.manifest import build_manifest, manifest_etag, parse_watermark
 from app.routes.auth import login_required
 
 bp = Blueprint('user', __name__, url_prefix='/user')
@@ -11,9 +13,13 @@ bp = Blueprint('user', __name__, url_prefix='/user')
 @bp.route('/dashboard')
 @login_required(role='user')
 def dashboard():
-    """User dashboard."""
-    items = Item.query.filter(Item.quantity > 0).all()
-    return render_template('user/dashboard.html', items=items)
+    """User dashboard with in-stock items, one page at a time, optionally searched."""
+    query = request.args.get('q', '').strip()
+    pagination = search_items(query, page=request.args.get('page', 1, type=int), in_stock_only=True)
+    return render_template('user/dashboard.html', 
+                         items=pagination.items,
+                         pagination=pagination,
+                         query=query)
 
 @bp.route('/scan')
 @login_required(role='user')
@@ -25,14 +31,14 @@ def scan():
 @login_required(role='user')
 def view_item(item_id):
     """View item details."""
-    item = Item.query.get_or_404(item_id)
+    item = get_item(item_id) or abort(404)
     return render_template('user/view_item.html', item=item)
 
 @bp.route('/take/<int:item_id>', methods=['GET', 'POST'])
 @login_required(role='user')
 def take_item(item_id):
     """Take an item from inventory."""
-    item = Item.query.get_or_404(item_id)
+    item = get_item(item_id) or abort(404)
     
     if request.method == 'POST':
         user_name = request.form.get('user_name', '').strip()
@@ -49,37 +55,14 @@ def take_item(item_id):
             flash('Quantity must be greater than 0', 'danger')
             return redirect(url_for('user.take_item', item_id=item_id))
         
-        if quantity > item.quantity:
-            flash(f'Not enough items in stock. Available: {item.quantity}', 'danger')
+        # The conditional UPDATE in checkout is the authoritative stock check
+        try:
+            checkout([(item_id, quantity)], user_name, user_email, purpose)
+        except InsufficientStockError as e:
+            flash(f'Not enough items in stock. Available: {e.shortages[0]["available"]}', 'danger')
             return redirect(url_for('user.take_item', item_id=item_id))
         
-        # Create transaction
-        transaction = Transaction(
-            item_id=item.id,
-            user_name=user_name,
-            user_email=user_email if user_email else None,
-            quantity=quantity,
-            purpose=purpose if purpose else None
-        )
-        db.session.add(transaction)
-        
-        # Update item quantity
-        item.quantity -= quantity
-        db.session.commit()
-        
-        # Send email notifications
-        admin_email = os.getenv('ADMIN_EMAIL')
-        email_content = create_item_taken_email(user_name, user_email, item.name, quantity, purpose)
-        
-        # Send to admin
-        if admin_email:
-            send_email(admin_email, f'Item Taken: {item.name}', email_content)
-        
-        # Send to user if email provided
-        if user_email:
-            send_email(user_email, f'Confirmation: You took {item.name}', email_content)
-        
-        flash(f'Successfully took {quantity} of "{item.name}"!', 'success')
+        flash(f'Successfully took {quantity} of "{item["name"]}"!', 'success')
         return redirect(url_for('user.dashboard'))
     
     return render_template('user/take_item.html', item=item)
@@ -88,5 +71,102 @@ def take_item(item_id):
 @login_required(role='user')
 def api_get_item(item_id):
     """API endpoint to get item details (for QR scanner)."""
-    item = Item.query.get_or_404(item_id)
-    return jsonify(item.to_dict())
+    item = get_item(item_id) or abort(404)
+    response = jsonify(item)
+    response.set_etag(f"{item['id']}-{item['version']}")
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response.make_conditional(request)
+
+@bp.route('/api/items/manifest')
+@login_required(role='user')
+def api_items_manifest():
+    """Compact list of every item for offline scanning, or the changes since a watermark."""
+    since = parse_watermark(request.args.get('since'))
+    etag = manifest_etag()
+    if etag in request.if_none_match:
+        response = Response(status=304)
+    else:
+        response = jsonify(build_manifest(since))
+    response.set_etag(etag)
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response
+
+@bp.route('/api/items/batch', methods=['GET', 'POST'])
+@login_required(role='user')
+def api_items_batch():
+    """Many items by id or name in one request, as JSON lines in request order."""
+    if request.method == 'POST':
+        # Large batches: {"ids": [...], "names": [...], "fields": [...]}
+        data = request.get_json(silent=True)
+        if not isinstance(data, dict):
+            return jsonify({'error': 'Expected a JSON object with ids and/or names'}), 400
+        ids, names, fields = data.get('ids'), data.get('names'), data.get('fields')
+    else:
+        # ?ids=1,2,3&name=Cable&name=Switch&fields=id,quantity
+        try:
+            ids = [int(value) for value in request.args.get('ids', '').split(',') if value.strip()]
+        except ValueError:
+            return jsonify({'error': 'ids must be integers'}), 400
+        names = request.args.getlist('name')
+        fields = [field for field in request.args.get('fields', '').split(',') if field] or None
+    
+    try:
+        ids, names, fields = parse_batch_request(ids, names, fields)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    etag = batch_etag(ids, names, fields)
+    if request.if_none_match.contains_weak(etag):
+        response = Response(status=304)
+    else:
+        response = Response(stream_with_context(iter_batch_lines(ids, names, fields)), mimetype=NDJSON_MIMETYPE)
+    response.set_etag(etag, weak=True)
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response
+
+@bp.route('/api/items/search')
+@login_required(role='user')
+def api_search_items():
+    """Search items by name and description (prefix match, ranked)."""
+    query = request.args.get('q', '').strip()
+    pagination = search_items(query, page=request.args.get('page', 1, type=int),
+                              per_page=request.args.get('per_page', type=int),
+                              in_stock_only=request.args.get('in_stock') == '1')
+    return jsonify(pagination_dict(pagination, query))
+
+@bp.route('/cart')
+@login_required(role='user')
+def cart():
+    """Review scanned items and take them all at once."""
+    return render_template('user/cart.html')
+
+@bp.route('/api/checkout', methods=['POST'])
+@login_required(role='user')
+def api_checkout():
+    """Take several items in one transaction (cart checkout)."""
+    data = request.get_json(silent=True) or {}
+    if not isinstance(data, dict):
+        return jsonify({'error': 'Expected a JSON object with items'}), 400
+    try:
+        lines = [(int(line['item_id']), line['quantity']) for line in data.get('items') or []]
+    except (KeyError, TypeError, ValueError):
+        return jsonify({'error': 'Each item needs an item_id and a quantity'}), 400
+    
+    fields = {}
+    for field in ('user_name', 'user_email', 'purpose'):
+        value = data.get(field) or ''
+        if not isinstance(value, str):
+            return jsonify({'error': f'{field} must be a string'}), 400
+        fields[field] = value.strip()
+    
+    try:
+        transactions = checkout(lines, fields['user_name'], fields['user_email'], fields['purpose'])
+    except InsufficientStockError as e:
+        return jsonify({'error': str(e), 'shortages': e.shortages}), 409
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    return jsonify({'transactions': [transaction.to_dict() for transaction in transactions]}), 201
@@ -0,0 +1,106 @@
+"""Periodic background jobs shared across gunicorn workers.
+
+Every worker runs a scheduler thread, but each job is claimed through a
+conditional UPDATE on its ``scheduled_jobs`` row, so exactly one worker
+runs it per interval.  Jobs can keep a small JSON ``state`` (for example a
+watermark) on the same row.
+"""
+import os
+import threading
+from datetime import datetime, timedelta
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from app import db
+from app.models import ScheduledJob
+
+_jobs = {}
+_scheduler = None
+_scheduler_pid = None
+_scheduler_lock = threading.Lock()
+
+def register_job(name, interval_seconds, func, initial_state=None):
+    """
+    Register a periodic job.
+    
+    Args:
+        name: Unique job name, used as the database key
+        interval_seconds: Time between runs
+        func: Callable taking the claimed ScheduledJob row; it may update
+            ``job.state`` and must commit its own work
+        initial_state: Optional callable returning the state stored when the
+            job row is first created
+    """
+    _jobs[name] = (interval_seconds, func, initial_state)
+
+def ensure_job_rows(now=None):
+    """
+    Create the row of every registered job that has none yet. Needs an app
+    context.
+    
+    Called at boot, so a job's initial state (such as the digest's
+    watermark) is taken then rather than on the first scheduler tick, which
+    comes a tick after the first request.
+    """
+    now = now or datetime.utcnow()
+    for name, (interval, _, initial_state) in _jobs.items():
+        if db.session.get(ScheduledJob, name) is not None:
+            continue
+        db.session.execute(
+            sqlite_insert(ScheduledJob)
+            .values(name=name, next_run_at=now + timedelta(seconds=interval),
+                    state=initial_state() if initial_state else None)
+            .on_conflict_do_nothing(index_elements=['name'])
+        )
+    db.session.commit()
+
+def _claim(name, interval, now):
+    """Move the job's next run forward; True if this worker won the run."""
+    result = db.session.execute(
+        db.update(ScheduledJob)
+        .where(ScheduledJob.name == name, ScheduledJob.next_run_at <= now)
+        .values(next_run_at=now + timedelta(seconds=interval), last_run_at=now)
+    )
+    db.session.commit()
+    return result.rowcount == 1
+
+def run_job(name):
+    """Run a registered job now, regardless of its schedule."""
+    _, func, _ = _jobs[name]
+    ensure_job_rows()
+    func(db.session.get(ScheduledJob, name))
+
+def run_due_jobs():
+    """Run every job whose next run time has passed. Needs an app context."""
+    now = datetime.utcnow()
+    ensure_job_rows(now)
+    for name, (interval, func, _) in _jobs.items():
+        if not _claim(name, interval, now):
+            continue
+        try:
+            func(db.session.get(ScheduledJob, name))
+        except Exception as e:
+            db.session.rollback()
+            print(f"Scheduled job {name} failed: {str(e)}")
+
+def _run_scheduler(app):
+    tick = float(os.getenv('SCHEDULER_TICK_SECONDS', 30))
+    stop = threading.Event()
+    while not stop.wait(tick):
+        try:
+            with app.app_context():
+                run_due_jobs()
+        except Exception as e:
+            print(f"Scheduler error: {str(e)}")
+
+def start_scheduler(app):
+    """Start the scheduler thread for this process, once."""
+    global _scheduler, _scheduler_pid
+    if not _jobs or _scheduler_pid == os.getpid():
+        return
+    
+    with _scheduler_lock:
+        if _scheduler_pid == os.getpid():
+            return
+        _scheduler = threading.Thread(target=_run_scheduler, args=(app,),
+                                      name='scheduler', daemon=True)
+        _scheduler.start()
+        _scheduler_pid = os.getpid()
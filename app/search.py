@@ -0,0 +1,114 @@
+"""Full-text item search backed by an SQLite FTS5 index.
+
+``items_fts`` is an external-content FTS5 table over ``items.name`` and
+``items.description``, kept in sync by triggers (see migration 2), so the
+index never needs to be maintained from Python.  Every word the user types
+is matched as a prefix, all words must match, and results are ranked by
+bm25 with name matches weighted above description matches.
+
+Scoring costs time for every matching row, so a query that matches more
+than ``SEARCH_RANK_MAX_HITS`` items (a word or two typed into a large
+catalog) is listed in index order instead, which FTS5 can stop reading
+after one page.
+"""
+import os
+import re
+from sqlalchemy import table, column, literal_column
+from app import db
+from app.models import Item
+
+# Lightweight handle on the virtual table; it is not part of the metadata,
+# so ``create_all`` leaves it to the migration
+items_fts = table('items_fts', column('rowid'), column('items_fts'))
+
+NAME_WEIGHT = 10.0
+DESCRIPTION_WEIGHT = 1.0
+
+_TOKEN = re.compile(r'\w+', re.UNICODE)
+
+def search_page_size():
+    return int(os.getenv('SEARCH_PAGE_SIZE', 48))
+
+def fts_query(text):
+    """
+    Turn free text into an FTS5 query that prefix-matches every word.
+    
+    Words are quoted, so FTS5 operators and punctuation in user input are
+    treated as plain text.
+    
+    Returns:
+        str: The MATCH expression, or None when the text has no words
+    """
+    tokens = _TOKEN.findall(text or '')
+    if not tokens:
+        return None
+    return ' '.join(f'"{token}"*' for token in tokens)
+
+def rank_max_hits():
+    return int(os.getenv('SEARCH_RANK_MAX_HITS', 5000))
+
+def count_matches(match):
+    """Count index hits for a MATCH expression without touching the items table."""
+    return db.session.execute(
+        db.select(db.func.count()).select_from(items_fts).where(items_fts.c.items_fts.op('MATCH')(match))
+    ).scalar()
+
+def items_query(text=None, in_stock_only=False, ranked=True):
+    """
+    Build a select of items matching ``text``.
+    
+    Without search text, items are listed by name.  With it, they are
+    ranked by relevance, or in index order when ``ranked`` is False.
+    """
+    query = db.select(Item)
+    if in_stock_only:
+        query = query.where(Item.quantity > 0)
+    
+    match = fts_query(text)
+    if match is None:
+        return query.order_by(Item.name, Item.id)
+    
+    query = (query.join(items_fts, items_fts.c.rowid == Item.id)
+             .where(items_fts.c.items_fts.op('MATCH')(match)))
+    if not ranked:
+        return query.order_by(items_fts.c.rowid)
+    rank = db.func.bm25(literal_column('items_fts'), NAME_WEIGHT, DESCRIPTION_WEIGHT)
+    return query.order_by(rank, Item.id)
+
+def search_items(text=None, page=1, per_page=None, in_stock_only=False):
+    """
+    Return one page of matching items.
+    
+    Args:
+        text: Search text; every word is prefix-matched against names and
+            descriptions. Empty text lists all items by name.
+        page: 1-based page number
+        per_page: Page size (SEARCH_PAGE_SIZE, default 48)
+        in_stock_only: Only include items with quantity above zero
+    
+    Returns:
+        Pagination: Flask-SQLAlchemy pagination with ``items`` and totals
+    """
+    match = fts_query(text)
+    hits = count_matches(match) if match else None
+    ranked = hits is None or hits <= rank_max_hits()
+    
+    # The index count is the total unless rows are also filtered on the items table
+    index_total = hits is not None and not in_stock_only
+    pagination = db.paginate(items_query(text, in_stock_only, ranked), page=page,
+                             per_page=per_page or search_page_size(), max_per_page=500,
+                             error_out=False, count=not index_total)
+    if index_total:
+        pagination.total = hits
+    return pagination
+
+def pagination_dict(pagination, text):
+    """Serialise a page of search results for the JSON API."""
+    return {
+        'query': text or '',
+        'page': pagination.page,
+        'per_page': pagination.per_page,
+        'total': pagination.total,
+        'pages': pagination.pages,
+        'items': [item.to_dict() for item in pagination.items],
+    }
@@ -0,0 +1,43 @@
+// Checkout cart kept in localStorage until it is submitted in one request.
+const CART_KEY = 'inventoryCart';
+
+function loadCart() {
+    try {
+        return JSON.parse(localStorage.getItem(CART_KEY)) || {};
+    } catch (e) {
+        return {};
+    }
+}
+
+function saveCart(cart) {
+    localStorage.setItem(CART_KEY, JSON.stringify(cart));
+}
+
+function addToCart(itemId, itemName, quantity = 1) {
+    const cart = loadCart();
+    const line = cart[itemId] || {name: itemName, quantity: 0};
+    line.name = itemName || line.name;
+    line.quantity += quantity;
+    cart[itemId] = line;
+    saveCart(cart);
+    return cart;
+}
+
+function cartSize(cart = loadCart()) {
+    return Object.values(cart).reduce((total, line) => total + line.quantity, 0);
+}
+
+async function submitCart(submitUrl, details) {
+    const cart = loadCart();
+    const items = Object.entries(cart).map(([itemId, line]) => ({item_id: Number(itemId), quantity: line.quantity}));
+    const response = await fetch(submitUrl, {
+        method: 'POST',
+        headers: {'Content-Type': 'application/json'},
+        body: JSON.stringify({...details, items})
+    });
+    const body = await response.json();
+    if (response.ok) {
+        saveCart({});
+    }
+    return {ok: response.ok, body};
+}
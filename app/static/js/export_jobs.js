@@ -0,0 +1,42 @@
+// Run exports as background jobs: submit, poll until done, then download.
+// Links keep their direct export href as a fallback when scripts are off.
+const exportSubmitUrl = document.currentScript.dataset.submitUrl;
+
+document.addEventListener('click', async function (event) {
+    const link = event.target.closest('[data-export-kind]');
+    if (!link) {
+        return;
+    }
+    event.preventDefault();
+
+    const original = link.innerHTML;
+    link.classList.add('disabled');
+    link.innerHTML = '<span class="spinner-border spinner-border-sm"></span> Preparing...';
+
+    try {
+        let response = await fetch(exportSubmitUrl, {
+            method: 'POST',
+            headers: {'Content-Type': 'application/json'},
+            body: JSON.stringify({kind: link.dataset.exportKind, format: link.dataset.exportFormat || 'xlsx'})
+        });
+        let job = await response.json();
+
+        while (job.status === 'queued' || job.status === 'running') {
+            await new Promise(resolve => setTimeout(resolve, 1000));
+            response = await fetch(job.status_url);
+            job = await response.json();
+        }
+
+        if (job.status === 'done') {
+            window.location.href = job.download_url;
+        } else {
+            alert('Export failed: ' + (job.error || 'unknown error'));
+        }
+    } catch (error) {
+        // Fall back to the synchronous export
+        window.location.href = link.href;
+    } finally {
+        link.classList.remove('disabled');
+        link.innerHTML = original;
+    }
+});
@@ -0,0 +1,73 @@
+// Live stock updates from /events/stock (server-sent events).
+// Quantity badges are marked with data-item-quantity="<id>", the rows or
+// cards holding them with data-item-row="<id>", and the admin dashboard's
+// recent transactions table body is #recentTransactions (newest 10 kept).
+// Badges marked data-stock-levels are recolored against their
+// data-reorder-point (the fixed default when it is missing).
+const eventsUrl = document.currentScript.dataset.eventsUrl;
+const DEFAULT_REORDER_POINT = 5;
+
+function stockLevelClass(quantity, reorderPoint) {
+    if (quantity <= reorderPoint) return 'bg-danger';
+    if (quantity <= 2 * reorderPoint) return 'bg-warning text-dark';
+    return 'bg-success';
+}
+
+function updateItem(item) {
+    document.querySelectorAll(`[data-item-quantity="${item.id}"]`).forEach(badge => {
+        badge.textContent = item.quantity;
+        if (badge.hasAttribute('data-stock-levels')) {
+            const reorderPoint = badge.dataset.reorderPoint === undefined
+                ? DEFAULT_REORDER_POINT : Number(badge.dataset.reorderPoint);
+            badge.className = `badge ${stockLevelClass(item.quantity, reorderPoint)}`;
+        }
+    });
+}
+
+function removeItem(item) {
+    document.querySelectorAll(`[data-item-row="${item.id}"]`).forEach(row => row.remove());
+}
+
+function addTransaction(transaction) {
+    const body = document.getElementById('recentTransactions');
+    if (!body) return;
+    const row = body.insertRow(0);
+    const timestamp = transaction.timestamp ? transaction.timestamp.slice(0, 19).replace('T', ' ') : '';
+    // Adjustments record units removed; show the change the count made instead
+    const quantity = transaction.kind === 'adjustment'
+        ? `count ${-transaction.quantity > 0 ? '+' : ''}${-transaction.quantity}` : transaction.quantity;
+    [transaction.user_name, transaction.item_name, quantity, timestamp].forEach(value => {
+        row.insertCell().textContent = value;
+    });
+    const limit = Number(body.dataset.limit) || 10;
+    while (body.rows.length > limit) {
+        body.deleteRow(body.rows.length - 1);
+    }
+}
+
+// How long to wait before reconnecting when the server turned the stream away
+const retryDelayMs = 30000;
+
+function connect(lastEventId) {
+    const url = lastEventId ? `${eventsUrl}${eventsUrl.includes('?') ? '&' : '?'}last_event_id=${lastEventId}` : eventsUrl;
+    const source = new EventSource(url);
+    source.addEventListener('item', e => updateItem(JSON.parse(e.data)));
+    source.addEventListener('item_deleted', e => removeItem(JSON.parse(e.data)));
+    source.addEventListener('transaction', e => addTransaction(JSON.parse(e.data)));
+    // Changes we cannot describe (or that were missed): show fresh data
+    source.addEventListener('reset', () => window.location.reload());
+    // The browser retries dropped streams itself, but gives up on an error
+    // response such as the 503 of a worker already serving its maximum
+    source.addEventListener('error', () => {
+        if (source.readyState === EventSource.CLOSED) {
+            setTimeout(() => connect(lastEventId), retryDelayMs);
+        }
+    });
+    ['item', 'item_deleted', 'transaction'].forEach(kind => {
+        source.addEventListener(kind, e => { lastEventId = e.lastEventId || lastEventId; });
+    });
+}
+
+if (eventsUrl && window.EventSource) {
+    connect(null);
+}
@@ -0,0 +1,57 @@
+// Local copy of the item manifest so scans resolve without a network round trip.
+// Synced with /user/api/items/manifest: a full copy first, then only changes
+// since the last watermark, revalidated with If-None-Match.
+const MANIFEST_KEY = 'itemManifest';
+const manifestUrl = document.currentScript.dataset.manifestUrl;
+
+function loadManifest() {
+    try {
+        return JSON.parse(localStorage.getItem(MANIFEST_KEY)) || {items: {}};
+    } catch (e) {
+        return {items: {}};
+    }
+}
+
+function lookupItem(itemId) {
+    const row = loadManifest().items[itemId];
+    return row ? {id: Number(itemId), name: row[0], quantity: row[1], version: row[2]} : null;
+}
+
+async function syncManifest() {
+    const manifest = loadManifest();
+    const params = manifest.watermark ? `?since=${encodeURIComponent(manifest.watermark)}` : '';
+    const headers = manifest.etag ? {'If-None-Match': manifest.etag} : {};
+
+    let response;
+    try {
+        response = await fetch(manifestUrl + params, {headers, cache: 'no-store'});
+    } catch (e) {
+        return false; // offline: keep using the local copy
+    }
+    if (response.status === 304 || !response.ok) {
+        return response.status === 304;
+    }
+
+    const delta = await response.json();
+    const items = delta.full ? {} : manifest.items;
+    const [idIndex, nameIndex, quantityIndex, versionIndex] = ['id', 'name', 'quantity', 'version'].map(field => delta.fields.indexOf(field));
+    delta.deleted.forEach(itemId => delete items[itemId]);
+    delta.items.forEach(row => {
+        const current = items[row[idIndex]];
+        if (!current || current[2] <= row[versionIndex]) {
+            items[row[idIndex]] = [row[nameIndex], row[quantityIndex], row[versionIndex]];
+        }
+    });
+
+    localStorage.setItem(MANIFEST_KEY, JSON.stringify({
+        watermark: delta.watermark,
+        etag: response.headers.get('ETag'),
+        items
+    }));
+    return true;
+}
+
+// Keep the copy fresh while the page is open and when connectivity returns
+syncManifest();
+setInterval(syncManifest, 60000);
+window.addEventListener('online', syncManifest);
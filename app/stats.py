@@ -0,0 +1,101 @@
+"""Aggregated admin dashboard statistics with a short-lived cache.
+
+The dashboard is computed with a handful of aggregate queries instead of
+loading every item, and the result is cached per worker for
+``DASHBOARD_CACHE_SECONDS``.  Any commit that writes items, transactions
+or forecasts drops the cache in the worker that made it; other workers pick the change
+up when their copy expires.
+"""
+import os
+import threading
+import time
+from app import db
+from app.changes import on_commit
+from app.ledger import total_transaction_count
+from app.forecast import reorder_point_expr, days_remaining_expr
+from app.models import Item, ItemForecast, Transaction
+
+LOW_STOCK_LIST_LIMIT = 50
+RECENT_TRANSACTIONS_LIMIT = 10
+
+# generation counts invalidations, so a result computed across one is not stored
+_cache = {'value': None, 'expires': 0.0, 'generation': 0}
+_cache_lock = threading.Lock()
+
+def compute_dashboard_stats():
+    """
+    Run the dashboard queries.
+    
+    Returns:
+        dict: total_items, total_quantity, total_transactions, low_stock_count,
+        low_stock_items (id, name, quantity, reorder_point, days_remaining)
+        and recent_transactions
+        (id, user_name, item_name, quantity, timestamp)
+    """
+    # Low stock means at or below the item's forecast reorder point (a fixed
+    # threshold for items without enough history)
+    reorder_point = reorder_point_expr()
+    total_items, total_quantity, low_stock_count = (db.session.query(
+        db.func.count(Item.id),
+        db.func.coalesce(db.func.sum(Item.quantity), 0),
+        db.func.coalesce(db.func.sum(db.case((Item.quantity <= reorder_point, 1), else_=0)), 0),
+    ).outerjoin(ItemForecast, ItemForecast.item_id == Item.id).one())
+    
+    # From the daily rollups and applied stock counts, so archived transactions still count
+    total_transactions = total_transaction_count()
+    
+    days_remaining = days_remaining_expr()
+    low_stock_items = (db.session.query(Item.id, Item.name, Item.quantity,
+                                        reorder_point.label('reorder_point'),
+                                        days_remaining.label('days_remaining'))
+                       .outerjoin(ItemForecast, ItemForecast.item_id == Item.id)
+                       .filter(Item.quantity <= reorder_point)
+                       .order_by(days_remaining.is_(None), days_remaining, Item.quantity, Item.name)
+                       .limit(LOW_STOCK_LIST_LIMIT)
+                       .all())
+    
+    recent_transactions = (db.session.query(Transaction.id, Transaction.user_name,
+                                            Item.name.label('item_name'),
+                                            Transaction.quantity, Transaction.timestamp,
+                                            Transaction.kind)
+                           .outerjoin(Item, Transaction.item_id == Item.id)
+                           .order_by(Transaction.timestamp.desc(), Transaction.id.desc())
+                           .limit(RECENT_TRANSACTIONS_LIMIT)
+                           .all())
+    
+    return {
+        'total_items': total_items,
+        'total_quantity': total_quantity,
+        'total_transactions': total_transactions,
+        'low_stock_count': low_stock_count,
+        'low_stock_items': low_stock_items,
+        'recent_transactions': recent_transactions,
+    }
+
+def get_dashboard_stats():
+    """Return dashboard stats, from the cache when it is still fresh."""
+    ttl = float(os.getenv('DASHBOARD_CACHE_SECONDS', 30))
+    now = time.monotonic()
+    with _cache_lock:
+        if _cache['value'] is not None and now < _cache['expires']:
+            return _cache['value']
+        generation = _cache['generation']
+    
+    value = compute_dashboard_stats()
+    with _cache_lock:
+        if _cache['generation'] == generation:
+            _cache['value'] = value
+            _cache['expires'] = now + ttl
+    return value
+
+def invalidate_dashboard_stats():
+    """Drop this worker's cached dashboard stats."""
+    with _cache_lock:
+        _cache['value'] = None
+        _cache['generation'] += 1
+
+@on_commit
+def _invalidate_on_write(changes):
+    if any(table in changes for table in (Item.__tablename__, Transaction.__tablename__,
+                                          ItemForecast.__tablename__)):
+        invalidate_dashboard_stats()
@@ -0,0 +1,285 @@
+"""Physical stock counts reconciled against item quantities in bulk.
+
+A stock count is a session that collects counted quantities, from uploaded
+count sheets (CSV or Excel, e.g. an items export with the Quantity column
+filled in) or from a scanner posting JSON.  Uploaded rows are validated in
+Python, then loaded into a temporary table, and from there everything is
+set-based SQL: one UPDATE resolves item names to ids, one INSERT ... SELECT
+merges the counts into ``stock_count_lines``, and one query lists the rows
+that matched no item.  Each line records the stock the item was expected to
+have when it was counted.
+
+Differences are a single query over the lines.  Applying a count corrects
+every item in one transaction by ``counted - expected``, so stock taken
+after an item was counted is not undone, and records each correction in the
+ledger as an ``adjustment`` transaction.  Adjustments hold the units that
+left stock, like takes (negative when more was found than expected), so
+stock plus the ledger still balances; they are not usage and are left out
+of rollups, forecasts and digests.  QR codes are not touched.
+"""
+from datetime import datetime
+from app import db
+from app.changes import mark_changed
+from app.models import Item, StockCount, StockCountLine, Transaction
+
+# Accepted count sheet headers; an items export works as is
+COUNT_HEADER_ALIASES = {
+    'id': 'id', 'item id': 'id',
+    'name': 'name', 'item': 'name', 'item name': 'name',
+    'count': 'counted', 'counted': 'counted', 'quantity': 'counted', 'qty': 'counted', 'stock': 'counted',
+}
+COUNT_KEY_FIELDS = ('id', 'name')
+
+COUNT_MODES = ('set', 'add')
+
+UPLOAD_CHUNK_SIZE = 5000
+
+# Past this many items, caches and live feeds are told that every item may
+# have changed: cheaper than naming each id, and IN lists stay within
+# SQLite's bound-parameter limit
+ITEMIZED_CHANGES_LIMIT = 1000
+
+_UPLOAD_TABLE = 'stock_count_upload'
+
+def create_count(name, created_by):
+    """Open a new stock count session."""
+    count = StockCount(name=name or f'Stock count {datetime.utcnow():%Y-%m-%d}', created_by=created_by)
+    db.session.add(count)
+    db.session.commit()
+    return count
+
+def list_counts():
+    """All stock counts with their number of counted items, newest first."""
+    lines = (db.select(db.func.count()).where(StockCountLine.count_id == StockCount.id)
+             .correlate(StockCount).scalar_subquery())
+    return db.session.query(StockCount, lines.label('lines')).order_by(StockCount.id.desc()).all()
+
+def _open_count(count_id):
+    count = db.session.get(StockCount, count_id)
+    if count is None:
+        raise ValueError('Stock count not found')
+    if count.status != 'open':
+        raise ValueError(f'Stock count "{count.name}" is {count.status}')
+    return count
+
+def _validate(values):
+    """Return ((item id, name, counted), None) or (None, error message) for one row."""
+    item_id = values.get('id')
+    name = values.get('name')
+    name = str(name).strip() if name is not None else ''
+    if item_id is not None and str(item_id).strip() != '':
+        try:
+            item_id = int(float(str(item_id).strip()))
+        except (ValueError, OverflowError):
+            return None, f'ID "{item_id}" is not a number'
+    else:
+        item_id = None
+    if item_id is None and not name:
+        return None, 'ID or Name is required'
+    
+    counted = values.get('counted')
+    if counted is None or str(counted).strip() == '':
+        return None, 'Count is required'
+    try:
+        number = float(str(counted).strip())
+        whole = int(number)
+    except (ValueError, OverflowError):
+        return None, f'Count "{counted}" is not a number'
+    if number != whole or number < 0:
+        return None, f'Count "{counted}" must be a whole number of 0 or more'
+    return (item_id, name or None, whole), None
+
+def record_counts(count_id, rows, mode='set'):
+    """
+    Add counted quantities to an open stock count.
+    
+    Rows for the same item are added together (an item counted in several
+    places).  With mode 'set' the total replaces the item's earlier count
+    and expected stock; with 'add' it is added to the earlier count, e.g.
+    for a scanner sending one unit per scan.
+    
+    Args:
+        count_id: The stock count's ID
+        rows: Iterable of (row number, dict with 'id' and/or 'name', and 'counted')
+        mode: 'set' or 'add'
+    
+    Returns:
+        dict: rows (accepted), items (counted in this upload), error_count
+        and 'errors' as a list of {'row', 'name', 'error'}
+    
+    Raises:
+        ValueError: If the count is not open or the mode is unknown
+    """
+    if mode not in COUNT_MODES:
+        raise ValueError(f"Unknown mode {mode}; use {' or '.join(COUNT_MODES)}")
+    _open_count(count_id)
+    report = {'rows': 0, 'items': 0, 'errors': []}
+    
+    connection = db.session.connection()
+    connection.exec_driver_sql(f'DROP TABLE IF EXISTS temp.{_UPLOAD_TABLE}')
+    connection.exec_driver_sql(
+        f'CREATE TEMP TABLE {_UPLOAD_TABLE} (row_number INTEGER, item_id INTEGER, name TEXT, counted INTEGER)')
+    try:
+        chunk = []
+        for number, values in rows:
+            cleaned, error = _validate(values)
+            if error:
+                report['errors'].append({'row': number, 'name': values.get('name') or values.get('id'),
+                                         'error': error})
+                continue
+            chunk.append((number, *cleaned))
+            if len(chunk) >= UPLOAD_CHUNK_SIZE:
+                _load_chunk(connection, chunk)
+                report['rows'] += len(chunk)
+                chunk = []
+        if chunk:
+            _load_chunk(connection, chunk)
+            report['rows'] += len(chunk)
+        
+        # Names resolve to ids in one pass; an ID column wins over the name
+        connection.exec_driver_sql(
+            f'UPDATE {_UPLOAD_TABLE} SET item_id = (SELECT id FROM main.items WHERE name = {_UPLOAD_TABLE}.name) '
+            'WHERE item_id IS NULL')
+        unmatched = connection.exec_driver_sql(
+            f'SELECT u.row_number, coalesce(u.name, u.item_id) FROM {_UPLOAD_TABLE} u '
+            'LEFT JOIN main.items i ON i.id = u.item_id WHERE i.id IS NULL ORDER BY u.row_number').all()
+        report['errors'].extend({'row': number, 'name': key, 'error': 'No such item'} for number, key in unmatched)
+        report['rows'] -= len(unmatched)
+        
+        counted = 'excluded.counted' if mode == 'set' else 'stock_count_lines.counted + excluded.counted'
+        expected = 'excluded.expected' if mode == 'set' else 'stock_count_lines.expected'
+        # WHERE true: keeps SQLite from reading ON CONFLICT as a join constraint
+        report['items'] = connection.exec_driver_sql(
+            'INSERT INTO stock_count_lines (count_id, item_id, counted, expected, counted_at) '
+            f'SELECT ?, i.id, sum(u.counted), i.quantity, ? FROM {_UPLOAD_TABLE} u '
+            'JOIN main.items i ON i.id = u.item_id WHERE true GROUP BY i.id '
+            f'ON CONFLICT (count_id, item_id) DO UPDATE SET counted = {counted}, expected = {expected}, '
+            'counted_at = excluded.counted_at',
+            (count_id, datetime.utcnow().isoformat(' '))).rowcount
+    finally:
+        connection.exec_driver_sql(f'DROP TABLE IF EXISTS temp.{_UPLOAD_TABLE}')
+    db.session.commit()
+    
+    report['errors'].sort(key=lambda error: error['row'] or 0)
+    report['error_count'] = len(report['errors'])
+    return report
+
+def _load_chunk(connection, chunk):
+    connection.exec_driver_sql(
+        f'INSERT INTO {_UPLOAD_TABLE} (row_number, item_id, name, counted) VALUES (?, ?, ?, ?)', chunk)
+
+def _difference():
+    return StockCountLine.counted - StockCountLine.expected
+
+def count_summary(count_id):
+    """
+    Totals of a stock count, in one query.
+    
+    Returns:
+        dict: counted (items), matching, over, short (items whose count is
+        above or below the expected stock), units_over, units_short and
+        uncounted (items in the catalog with no count yet)
+    """
+    difference = _difference()
+    counted, matching, over, short, units_over, units_short = db.session.query(
+        db.func.count(),
+        db.func.coalesce(db.func.sum(db.case((difference == 0, 1), else_=0)), 0),
+        db.func.coalesce(db.func.sum(db.case((difference > 0, 1), else_=0)), 0),
+        db.func.coalesce(db.func.sum(db.case((difference < 0, 1), else_=0)), 0),
+        db.func.coalesce(db.func.sum(db.case((difference > 0, difference), else_=0)), 0),
+        db.func.coalesce(db.func.sum(db.case((difference < 0, -difference), else_=0)), 0),
+    ).select_from(StockCountLine).join(Item, Item.id == StockCountLine.item_id).filter(
+        StockCountLine.count_id == count_id).one()
+    total_items = db.session.query(db.func.count(Item.id)).scalar()
+    return {'counted': counted, 'matching': matching, 'over': over, 'short': short,
+            'units_over': units_over, 'units_short': units_short, 'uncounted': total_items - counted}
+
+def count_differences(count_id, page=1, per_page=100):
+    """
+    Items whose count differs from the expected stock, largest difference first.
+    
+    Returns:
+        list: dicts with item_id, name, expected, counted, difference and
+        quantity (current stock, which may have moved since the count)
+    """
+    difference = _difference()
+    rows = (db.session.query(StockCountLine.item_id, Item.name, StockCountLine.expected,
+                             StockCountLine.counted, difference, Item.quantity)
+            .join(Item, Item.id == StockCountLine.item_id)
+            .filter(StockCountLine.count_id == count_id, difference != 0)
+            .order_by(db.func.abs(difference).desc(), Item.name)
+            .limit(per_page).offset((max(page, 1) - 1) * per_page)
+            .all())
+    return [{'item_id': item_id, 'name': name, 'expected': expected, 'counted': counted,
+             'difference': diff, 'quantity': quantity}
+            for item_id, name, expected, counted, diff, quantity in rows]
+
+def apply_count(count_id, applied_by):
+    """
+    Correct stock for every difference in a count, in one transaction.
+    
+    Each item's quantity changes by ``counted - expected`` (never below
+    zero), and the change is recorded as an adjustment transaction.
+    
+    Args:
+        count_id: The stock count's ID
+        applied_by: Name recorded on the adjustments
+    
+    Returns:
+        StockCount: The applied count, with adjusted_items and net_change
+    
+    Raises:
+        ValueError: If the count is not open
+    """
+    count = _open_count(count_id)
+    now = datetime.utcnow()
+    
+    # The first write takes SQLite's write lock, so stock cannot move until the commit
+    claimed = db.session.execute(
+        db.update(StockCount)
+        .where(StockCount.id == count_id, StockCount.status == 'open')
+        .values(status='applied', applied_by=applied_by, applied_at=now)
+        .execution_options(synchronize_session=False)).rowcount
+    if not claimed:
+        db.session.rollback()
+        raise ValueError(f'Stock count "{count.name}" has already been applied or cancelled')
+    
+    deltas = (db.select(StockCountLine.item_id, _difference().label('delta'))
+              .where(StockCountLine.count_id == count_id, _difference() != 0)
+              .subquery())
+    new_quantity = db.func.max(Item.quantity + deltas.c.delta, 0)
+    removed = (Item.quantity - new_quantity).label('quantity')
+    adjustments = (db.select(Item.id, db.literal(applied_by), removed,
+                             db.literal(f'Stock count #{count_id}: {count.name}'), db.literal(now),
+                             db.literal('adjustment'))
+                   .join(deltas, deltas.c.item_id == Item.id)
+                   .where(removed != 0))
+    recorded = db.session.execute(
+        db.insert(Transaction)
+        .from_select(['item_id', 'user_name', 'quantity', 'purpose', 'timestamp', 'kind'], adjustments)
+        .returning(Transaction.id, Transaction.item_id, Transaction.quantity)
+        .execution_options(changed_ids=[])).all()
+    
+    itemized = len(recorded) <= ITEMIZED_CHANGES_LIMIT
+    item_ids = [item_id for _, item_id, _ in recorded]
+    mark_changed(Transaction.__tablename__, [transaction_id for transaction_id, _, _ in recorded] if itemized else None)
+    if recorded:
+        db.session.execute(
+            db.update(Item)
+            .where(Item.id == deltas.c.item_id, new_quantity != Item.quantity)
+            .values(quantity=new_quantity, updated_at=now)
+            .execution_options(synchronize_session=False, changed_ids=item_ids if itemized else None))
+    
+    db.session.execute(
+        db.update(StockCount).where(StockCount.id == count_id)
+        .values(adjusted_items=len(recorded), net_change=-sum(quantity for _, _, quantity in recorded))
+        .execution_options(synchronize_session=False))
+    db.session.commit()
+    return count
+
+def cancel_count(count_id):
+    """Close an open count without changing any stock."""
+    count = _open_count(count_id)
+    count.status = 'cancelled'
+    db.session.commit()
+    return count
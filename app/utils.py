@@ -1,13 +1,62 @@
 """Utility functions for email notifications and QR code generation."""
 import os
-import smtplib
-import qrcode
+import uuid
+import hashlib
+from io import BytesIO
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
-from flask import url_for
-from dotenv import load_dotenv
+from flask import current_app
+from app.mailer import get_smtp_manager
+from app.metrics import timed
 
-load_dotenv()
+class EmailNotConfiguredError(RuntimeError):
+    """Raised when SMTP settings are missing and email cannot be delivered."""
+
+def check_email_configured():
+    """Raise EmailNotConfiguredError unless SMTP settings allow sending."""
+    if not (os.getenv('SMTP_FROM') or os.getenv('SMTP_USERNAME')):
+        raise EmailNotConfiguredError('SMTP credentials not configured')
+    if os.getenv('SMTP_USERNAME') and not os.getenv('SMTP_PASSWORD'):
+        raise EmailNotConfiguredError('SMTP_PASSWORD not configured')
+
+def build_email_message(to_email, subject, html_content):
+    """
+    Build a MIME message using the configured sender address.
+    
+    Args:
+        to_email: Recipient email address (can be a list)
+        subject: Email subject
+        html_content: HTML content of the email
+    
+    Returns:
+        MIMEMultipart: The message, ready to hand to an SMTP session
+    """
+    sender = os.getenv('SMTP_FROM') or os.getenv('SMTP_USERNAME')
+    if not sender:
+        raise EmailNotConfiguredError('SMTP credentials not configured')
+    
+    msg = MIMEMultipart('alternative')
+    msg['From'] = sender
+    msg['To'] = to_email if isinstance(to_email, str) else ', '.join(to_email)
+    msg['Subject'] = subject
+    
+    # Attach HTML content
+    html_part = MIMEText(html_content, 'html')
+    msg.attach(html_part)
+    return msg
+
+def deliver_email(to_email, subject, html_content):
+    """
+    Deliver an email over SMTP, raising on any failure.
+    
+    The message goes out over this process's pooled SMTP session (see
+    ``app.mailer``).  Used by the outbox dispatcher, which needs the error
+    to decide whether to retry.  Request handlers should queue mail with
+    ``app.outbox.enqueue_email`` instead of calling this directly.
+    """
+    check_email_configured()
+    msg = build_email_message(to_email, subject, html_content)
+    get_smtp_manager().send(msg)
 
 def send_email(to_email, subject, html_content):
     """
@@ -22,81 +71,85 @@ def send_email(to_email, subject, html_content):
         bool: True if sent successfully, False otherwise
     """
     try:
-        smtp_server = os.getenv('SMTP_SERVER', 'smtp.gmail.com')
-        smtp_port = int(os.getenv('SMTP_PORT', 587))
-        smtp_username = os.getenv('SMTP_USERNAME')
-        smtp_password = os.getenv('SMTP_PASSWORD')
-        
-        if not smtp_username or not smtp_password:
-            print("SMTP credentials not configured. Email not sent.")
-            return False
-        
-        # Create message
-        msg = MIMEMultipart('alternative')
-        msg['From'] = smtp_username
-        msg['To'] = to_email if isinstance(to_email, str) else ', '.join(to_email)
-        msg['Subject'] = subject
-        
-        # Attach HTML content
-        html_part = MIMEText(html_content, 'html')
-        msg.attach(html_part)
-        
-        # Send email
-        with smtplib.SMTP(smtp_server, smtp_port) as server:
-            server.starttls()
-            server.login(smtp_username, smtp_password)
-            server.send_message(msg)
-        
+        deliver_email(to_email, subject, html_content)
         print(f"Email sent successfully to {to_email}")
         return True
     
+    except EmailNotConfiguredError:
+        print("SMTP credentials not configured. Email not sent.")
+        return False
+    
     except Exception as e:
         print(f"Failed to send email: {str(e)}")
         return False
 
-def generate_qr_code(item_id, item_name):
+def qr_payload(item_id, item_name):
+    """Return the text encoded in an item's QR code."""
+    return f"ITEM_ID:{item_id}|NAME:{item_name}"
+
+def qr_digest(payload):
+    """Return the content hash that names a QR image for ``payload``."""
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()[:20]
+
+def qr_code_path(item_id, item_name):
     """
-    Generate a QR code for an inventory item.
-    
-    Args:
-        item_id: The item's database ID
-        item_name: The item's name
+    Return the static path of an item's QR image, without generating it.
     
-    Returns:
-        str: The relative path to the saved QR code image
+    The filename is a hash of the payload, so it only changes when the
+    payload does; the image itself is rendered on first request.
     """
-    try:
-        # Create QR code with item details
-        qr_data = f"ITEM_ID:{item_id}|NAME:{item_name}"
-        
+    return f"static/qr_codes/{qr_digest(qr_payload(item_id, item_name))}.png"
+
+def render_qr_png(payload):
+    """Render a QR code for ``payload`` and return the PNG bytes."""
+    # Imported on first use: most workers never render a QR image
+    import qrcode
+    with timed('qr_render'):
         qr = qrcode.QRCode(
             version=1,
             error_correction=qrcode.constants.ERROR_CORRECT_L,
             box_size=10,
             border=4,
         )
-        qr.add_data(qr_data)
+        qr.add_data(payload)
         qr.make(fit=True)
         
-        # Generate image
         img = qr.make_image(fill_color="black", back_color="white")
+        output = BytesIO()
+        img.save(output, format='PNG')
+        return output.getvalue()
+
+def qr_codes_dir():
+    """Directory holding rendered QR images."""
+    return os.path.join(current_app.static_folder, 'qr_codes')
+
+def generate_qr_code(item_id, item_name):
+    """
+    Make sure the QR image for an item exists on disk.
+    
+    Args:
+        item_id: The item's database ID
+        item_name: The item's name
+    
+    Returns:
+        str: The relative path to the saved QR code image
+    """
+    try:
+        payload = qr_payload(item_id, item_name)
         
-        # Save to static folder
-        # Sanitize item_name to prevent path traversal attacks
-        safe_item_name = "".join(c if c.isalnum() or c in (' ', '-', '_') else '_' for c in item_name)
-        safe_item_name = safe_item_name.replace(' ', '_')
-        qr_filename = f"item_{item_id}_{safe_item_name}.png"
-        
-        # Use hardcoded directory path to prevent path traversal
-        qr_dir = os.path.join('app', 'static', 'qr_codes')
+        # The filename is a hex digest, so it cannot be used for path traversal
+        qr_dir = qr_codes_dir()
         os.makedirs(qr_dir, exist_ok=True)
+        qr_path = os.path.join(qr_dir, f"{qr_digest(payload)}.png")
         
-        qr_path = os.path.join(qr_dir, qr_filename)
-        
-        img.save(qr_path)
+        if not os.path.exists(qr_path):
+            # Unique per call: threads of one worker may render the same image at once
+            tmp_path = f"{qr_path}.{uuid.uuid4().hex}.tmp"
+            with open(tmp_path, 'wb') as f:
+                f.write(render_qr_png(payload))
+            os.replace(tmp_path, qr_path)
         
-        # Return relative path for web access
-        return f"static/qr_codes/{qr_filename}"
+        return qr_code_path(item_id, item_name)
     
     except Exception as e:
         print(f"Failed to generate QR code: {str(e)}")
@@ -139,3 +192,106 @@ def create_item_taken_email(user_name, user_email, item_name, quantity, purpose)
         </body>
     </html>
     """
+
+def create_checkout_email(user_name, user_email, taken, purpose):
+    """Create HTML email content for a checkout of several items at once."""
+    item_rows = ''.join(f"""
+                    <tr>
+                        <td>{item_name}</td>
+                        <td>{quantity}</td>
+                    </tr>""" for item_name, quantity in taken)
+    return f"""
+    <html>
+        <body style="font-family: Arial, sans-serif; padding: 20px;">
+            <h2 style="color: #e74c3c;">Items Taken from Inventory</h2>
+            <div style="background-color: #fff3cd; padding: 15px; border-radius: 5px;">
+                <p><strong>User Name:</strong> {user_name}</p>
+                <p><strong>User Email:</strong> {user_email or 'N/A'}</p>
+                <p><strong>Purpose:</strong> {purpose or 'N/A'}</p>
+                <table cellpadding="6" style="border-collapse: collapse;">
+                    <tr><th align="left">Item</th><th align="left">Quantity</th></tr>{item_rows}
+                </table>
+            </div>
+            <p style="margin-top: 20px; color: #7f8c8d;">
+                This is an automated notification from the Inventory Management System.
+            </p>
+        </body>
+    </html>
+    """
+
+def create_items_imported_email(report, preview=20):
+    """Create HTML email content summarising a bulk item import."""
+    new_items = report['new_items'][:preview]
+    if new_items:
+        more = len(report['new_items']) - len(new_items)
+        new_items_section = f"""
+            <h3 style="color: #2c3e50;">New Items</h3>
+            <ul>{''.join(f'<li>{name}</li>' for _, name in new_items)}</ul>
+            {f'<p>...and {more} more.</p>' if more else ''}"""
+    else:
+        new_items_section = ''
+    
+    return f"""
+    <html>
+        <body style="font-family: Arial, sans-serif; padding: 20px;">
+            <h2 style="color: #2c3e50;">Items Imported into Inventory</h2>
+            <div style="background-color: #f8f9fa; padding: 15px; border-radius: 5px;">
+                <p><strong>New Items:</strong> {report['inserted']}</p>
+                <p><strong>Updated Items:</strong> {report['updated']}</p>
+                <p><strong>Rows Rejected:</strong> {report['error_count']}</p>
+            </div>
+            {new_items_section}
+            <p style="margin-top: 20px; color: #7f8c8d;">
+                This is an automated notification from the Inventory Management System.
+            </p>
+        </body>
+    </html>
+    """
+
+def create_admin_digest_email(period_start, period_end, new_items, rollups):
+    """Create HTML email content summarising activity over a digest window."""
+    if new_items:
+        new_item_rows = ''.join(f"""
+                    <tr>
+                        <td>{item.name}</td>
+                        <td>{item.quantity}</td>
+                        <td>{item.description or 'N/A'}</td>
+                    </tr>""" for item in new_items)
+        new_items_section = f"""
+            <h3 style="color: #2c3e50;">New Items ({len(new_items)})</h3>
+            <table cellpadding="6" style="border-collapse: collapse; background-color: #f8f9fa;">
+                <tr><th align="left">Item</th><th align="left">Quantity</th><th align="left">Description</th></tr>{new_item_rows}
+            </table>"""
+    else:
+        new_items_section = ''
+    
+    if rollups:
+        rollup_rows = ''.join(f"""
+                    <tr>
+                        <td>{rollup['name']}</td>
+                        <td>{rollup['total_taken']}</td>
+                        <td>{', '.join(f'{user_name} ({quantity})' for user_name, quantity in rollup['takers'])}</td>
+                        <td>{rollup['current_stock']}</td>
+                        <td>{'%.1f' % rollup['days_remaining'] if rollup['days_remaining'] is not None else '-'}</td>
+                    </tr>""" for rollup in rollups)
+        rollup_section = f"""
+            <h3 style="color: #e74c3c;">Items Taken</h3>
+            <table cellpadding="6" style="border-collapse: collapse; background-color: #fff3cd;">
+                <tr><th align="left">Item</th><th align="left">Total Taken</th><th align="left">Taken By</th><th align="left">Current Stock</th><th align="left">Days of Stock Left</th></tr>{rollup_rows}
+            </table>"""
+    else:
+        rollup_section = ''
+    
+    return f"""
+    <html>
+        <body style="font-family: Arial, sans-serif; padding: 20px;">
+            <h2 style="color: #2c3e50;">Inventory Digest</h2>
+            <p>Activity from {period_start.strftime('%Y-%m-%d %H:%M')} to {period_end.strftime('%Y-%m-%d %H:%M')} UTC.</p>
+            {new_items_section}
+            {rollup_section}
+            <p style="margin-top: 20px; color: #7f8c8d;">
+                This is an automated notification from the Inventory Management System.
+            </p>
+        </body>
+    </html>
+    """
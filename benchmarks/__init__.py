@@ -0,0 +1 @@
+"""Benchmarks for the inventory system (run as ``python -m benchmarks.<name>``)."""
@@ -0,0 +1,118 @@
+"""Peak memory and wall time of the transaction export, old vs. streaming.
+
+Each variant runs in a fresh process against the same seeded database so
+peak RSS (ru_maxrss) is measured per variant:
+
+- ``pandas``: the original path (ORM objects -> dicts -> DataFrame -> BytesIO)
+- ``xlsx``: write-only openpyxl workbook fed by a ``yield_per`` cursor
+- ``csv``: streamed CSV response, also reporting time to first byte
+
+Usage:
+    python -m benchmarks.export_memory --transactions 200000
+"""
+import argparse
+import multiprocessing
+import os
+import random
+import resource
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+def seed(path, items, transactions):
+    os.environ['DATABASE_PATH'] = path
+    from app import create_app
+    create_app()
+    conn = sqlite3.connect(path)
+    now = datetime.utcnow()
+    conn.executemany('INSERT INTO items (id, name, description, quantity, created_at, updated_at) '
+                     'VALUES (?, ?, ?, ?, ?, ?)',
+                     ((i, f'item-{i}', 'benchmark item', 100, now, now) for i in range(1, items + 1)))
+    conn.executemany('INSERT INTO transactions (item_id, user_name, user_email, quantity, purpose, timestamp) '
+                     'VALUES (?, ?, ?, 1, ?, ?)',
+                     ((random.randint(1, items), f'user-{n % 50}', f'user{n % 50}@example.com',
+                       'rack maintenance', (now - timedelta(seconds=n)).strftime('%Y-%m-%d %H:%M:%S.%f'))
+                      for n in range(transactions)))
+    conn.commit()
+    conn.close()
+
+def pandas_export():
+    """The export as it was implemented before streaming."""
+    from io import BytesIO
+    import pandas as pd
+    from app.models import Transaction
+    transactions = Transaction.query.order_by(Transaction.timestamp.desc()).all()
+    data = [{
+        'ID': t.id,
+        'Item Name': t.item.name if t.item else 'Unknown',
+        'User Name': t.user_name,
+        'User Email': t.user_email or '',
+        'Quantity': t.quantity,
+        'Purpose': t.purpose or '',
+        'Timestamp': t.timestamp.strftime('%Y-%m-%d %H:%M:%S') if t.timestamp else ''
+    } for t in transactions]
+    df = pd.DataFrame(data)
+    output = BytesIO()
+    with pd.ExcelWriter(output, engine='openpyxl') as writer:
+        df.to_excel(writer, index=False, sheet_name='Transactions')
+    return len(output.getvalue())
+
+def run_variant(variant, path, results):
+    os.environ['DATABASE_PATH'] = path
+    os.environ['EMAIL_OUTBOX_DISPATCHER'] = 'false'
+    from app import create_app
+    app = create_app()
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    first_byte = None
+    start = time.perf_counter()
+    
+    if variant == 'pandas':
+        with app.app_context():
+            size = pandas_export()
+    else:
+        client = app.test_client()
+        with client.session_transaction() as session:
+            session['user_id'] = 0
+            session['role'] = 'admin'
+        query = '?format=csv' if variant == 'csv' else ''
+        response = client.get(f'/admin/export/transactions{query}', buffered=False)
+        size = 0
+        for chunk in response.response:
+            if first_byte is None:
+                first_byte = time.perf_counter() - start
+            size += len(chunk)
+        response.close()
+    
+    elapsed = time.perf_counter() - start
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    results.put((variant, elapsed, first_byte, rss_before / 1024, peak / 1024, size))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--items', type=int, default=1000)
+    parser.add_argument('--transactions', type=int, default=200000)
+    parser.add_argument('--variants', default='pandas,xlsx,csv')
+    args = parser.parse_args()
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'bench.db')
+        seed(path, args.items, args.transactions)
+        
+        ctx = multiprocessing.get_context('spawn')
+        print(f"{'variant':<8} {'wall s':>8} {'1st byte s':>10} {'base MB':>8} {'peak MB':>8} {'bytes':>12}")
+        for variant in args.variants.split(','):
+            results = ctx.Queue()
+            proc = ctx.Process(target=run_variant, args=(variant, path, results))
+            proc.start()
+            name, elapsed, first_byte, base, peak, size = results.get()
+            proc.join()
+            first = f'{first_byte:.3f}' if first_byte is not None else '-'
+            print(f'{name:<8} {elapsed:>8.2f} {first:>10} {base:>8.1f} {peak:>8.1f} {size:>12}')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,447 @@
+"""Load test of the hot endpoints through the real WSGI app.
+
+Seeds a database with a catalog and a ledger, starts the app in its own
+process on a threaded werkzeug server (outgoing mail goes to a local SMTP
+sink, so the outbox dispatcher does real deliveries), and drives it with
+concurrent clients for a fixed time.  Each client logs in once as a user
+and once as the admin and then picks requests from a weighted mix:
+
+- ``take``: ``POST /user/take/<id>`` (one unit of a random item)
+- ``api_item``: ``GET /user/api/item/<id>``
+- ``dashboard``: ``GET /admin/dashboard``
+- ``transactions``: ``GET /admin/transactions``
+- ``export_items``: ``GET /admin/export/items?format=csv``
+- ``export_transactions``: ``GET /admin/export/transactions?format=csv``
+- ``export_job``: ``POST /admin/export/jobs`` (cached ledger export)
+
+Reports p50/p99 latency and throughput per request type, the server's
+peak RSS and the mail the sink received, then checks that the ledger
+balances: stock went down by exactly the quantity of the transactions
+written, and there is one transaction per successful take.  Results can be
+saved as a baseline and later runs compared against it; the exit status
+is 1 when a run regresses past ``--tolerance`` or the ledger does not
+balance.  Baselines are machine specific, so record one on the machine
+that runs the comparison.
+
+Usage:
+    python -m benchmarks.load --items 10000 --transactions 1000000 --clients 8 --seconds 30
+    python -m benchmarks.load --db /tmp/load.db --save-baseline
+    python -m benchmarks.load --db /tmp/load.db --mix take=1,api_item=1
+"""
+import argparse
+import http.cookiejar
+import json
+import multiprocessing
+import os
+import random
+import socketserver
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+DEFAULT_BASELINE = os.path.join(ROOT, 'benchmarks', 'load_baseline.json')
+
+DEFAULT_MIX = {
+    'take': 30,
+    'api_item': 40,
+    'dashboard': 10,
+    'transactions': 15,
+    'export_items': 1,
+    'export_transactions': 1,
+    'export_job': 3,
+}
+
+USER_NAME = 'loadtest'
+USER_PASSWORD = 'loadtest-password'
+ADMIN_USERNAME = 'loadadmin'
+ADMIN_PASSWORD = 'loadadmin-password'
+
+# Seeding
+
+def seed(path, items, transactions):
+    """Create the schema through the app, then bulk insert items, a ledger and a user."""
+    os.environ['DATABASE_PATH'] = path
+    os.environ['EMAIL_OUTBOX_DISPATCHER'] = 'false'
+    from app import create_app
+    from werkzeug.security import generate_password_hash
+    create_app()
+    rng = random.Random(42)
+    now = datetime.utcnow()
+    conn = sqlite3.connect(path)
+    # Plenty of stock, so takes never fail and the ledger check stays exact
+    conn.executemany('INSERT INTO items (id, name, description, quantity, created_at, updated_at) '
+                     'VALUES (?, ?, ?, ?, ?, ?)',
+                     ((i, f'item-{i}', 'load test item', 10 ** 6, now, now) for i in range(1, items + 1)))
+    conn.executemany('INSERT INTO transactions (item_id, user_name, user_email, quantity, purpose, timestamp) '
+                     'VALUES (?, ?, ?, ?, ?, ?)',
+                     ((rng.randint(1, items), f'user-{n % 50}', f'user{n % 50}@example.com', rng.randint(1, 3),
+                       'rack maintenance', now - timedelta(seconds=transactions - n))
+                      for n in range(transactions)))
+    conn.execute('INSERT INTO users (username, password, role, created_at) VALUES (?, ?, ?, ?)',
+                 (USER_NAME, generate_password_hash(USER_PASSWORD), 'user', now))
+    conn.commit()
+    conn.close()
+
+def ledger_totals(path):
+    """Return (total stock, transaction count, total quantity taken)."""
+    conn = sqlite3.connect(path)
+    try:
+        stock = conn.execute('SELECT coalesce(sum(quantity), 0) FROM items').fetchone()[0]
+        count, taken = conn.execute('SELECT count(*), coalesce(sum(quantity), 0) FROM transactions').fetchone()
+        return stock, count, taken
+    finally:
+        conn.close()
+
+# SMTP sink
+
+class SMTPSink(socketserver.ThreadingTCPServer):
+    """Accept SMTP sessions and count delivered messages, storing nothing."""
+    daemon_threads = True
+    allow_reuse_address = True
+    
+    def __init__(self):
+        super().__init__(('127.0.0.1', 0), SMTPSinkHandler)
+        self.messages = 0
+        self.lock = threading.Lock()
+
+class SMTPSinkHandler(socketserver.StreamRequestHandler):
+    def reply(self, line):
+        self.wfile.write(f'{line}\r\n'.encode())
+    
+    def handle(self):
+        self.reply('220 loadtest sink')
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line.decode(errors='replace').strip().upper()
+            if command.startswith('EHLO'):
+                self.reply('250-loadtest')
+                self.reply('250 8BITMIME')
+            elif command.startswith('DATA'):
+                self.reply('354 end with .')
+                while self.rfile.readline() not in (b'.\r\n', b'.\n', b''):
+                    pass
+                with self.server.lock:
+                    self.server.messages += 1
+                self.reply('250 queued')
+            elif command.startswith('QUIT'):
+                self.reply('221 bye')
+                return
+            else:
+                self.reply('250 ok')
+
+# Server process
+
+def serve(path, env, ready):
+    """Run the app on a threaded werkzeug server; report the port on ``ready``."""
+    os.environ.update(env)
+    os.environ['DATABASE_PATH'] = path
+    import logging
+    from werkzeug.serving import make_server
+    from app import create_app
+    # One access log line per request would cost more than some requests
+    logging.getLogger('werkzeug').setLevel(logging.WARNING)
+    server = make_server('127.0.0.1', 0, create_app(), threaded=True)
+    ready.put(server.server_port)
+    server.serve_forever()
+
+def peak_rss_mb(pid):
+    """Peak resident set size of a process, from /proc (None elsewhere)."""
+    try:
+        with open(f'/proc/{pid}/status') as status:
+            for line in status:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        return None
+    return None
+
+# Clients
+
+class _NoRedirect(urllib.request.HTTPRedirectHandler):
+    def redirect_request(self, req, fp, code, msg, headers, newurl):
+        return None
+
+class Client:
+    """One simulated browser: a cookie jar, without following redirects."""
+    
+    def __init__(self, base_url):
+        self.base_url = base_url
+        self.opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()), _NoRedirect())
+    
+    def request(self, method, path, form=None, payload=None):
+        """Send a request and read the whole body; returns (status, headers)."""
+        data = headers = None
+        if form is not None:
+            data = urllib.parse.urlencode(form).encode()
+        elif payload is not None:
+            data = json.dumps(payload).encode()
+            headers = {'Content-Type': 'application/json'}
+        req = urllib.request.Request(self.base_url + path, data=data, method=method, headers=headers or {})
+        try:
+            with self.opener.open(req, timeout=300) as response:
+                while response.read(65536):
+                    pass
+                return response.status, response.headers
+        except urllib.error.HTTPError as e:
+            e.read()
+            return e.code, e.headers
+    
+    def login(self, username, password):
+        status, headers = self.request('POST', '/login', form={'username': username, 'password': password})
+        if status != 302 or headers.get('Location', '').endswith('/login'):
+            raise RuntimeError(f'Login as {username} failed ({status})')
+
+def run_request(kind, user, admin, items, rng):
+    """Issue one request of the given kind; returns (ok, took an item)."""
+    item_id = rng.randint(1, items)
+    if kind == 'take':
+        status, headers = user.request('POST', f'/user/take/{item_id}', form={
+            'user_name': 'Load Test', 'user_email': 'load@example.com', 'quantity': 1, 'purpose': 'load test'})
+        took = status == 302 and headers.get('Location', '').endswith('/user/dashboard')
+        return took, took
+    if kind == 'api_item':
+        status, _ = user.request('GET', f'/user/api/item/{item_id}')
+    elif kind == 'dashboard':
+        status, _ = admin.request('GET', '/admin/dashboard')
+    elif kind == 'transactions':
+        status, _ = admin.request('GET', '/admin/transactions')
+    elif kind == 'export_items':
+        status, _ = admin.request('GET', '/admin/export/items?format=csv')
+    elif kind == 'export_transactions':
+        status, _ = admin.request('GET', '/admin/export/transactions?format=csv')
+    elif kind == 'export_job':
+        status, _ = admin.request('POST', '/admin/export/jobs', payload={'kind': 'transactions', 'format': 'csv'})
+    else:
+        raise ValueError(f'Unknown request type {kind}')
+    return status < 400, False
+
+def client_loop(base_url, mix, items, warmup_until, deadline, seed_value, results):
+    rng = random.Random(seed_value)
+    user, admin = Client(base_url), Client(base_url)
+    user.login(USER_NAME, USER_PASSWORD)
+    admin.login(ADMIN_USERNAME, ADMIN_PASSWORD)
+    kinds, weights = zip(*mix.items())
+    timings = {kind: [] for kind in kinds}
+    errors = {kind: 0 for kind in kinds}
+    takes = 0
+    
+    while True:
+        now = time.perf_counter()
+        if now >= deadline:
+            break
+        kind = rng.choices(kinds, weights)[0]
+        try:
+            ok, took = run_request(kind, user, admin, items, rng)
+        except (OSError, urllib.error.URLError):
+            ok, took = False, False
+        elapsed = time.perf_counter() - now
+        # Takes always count for the ledger check, warm-up or not
+        takes += took
+        if now < warmup_until:
+            continue
+        timings[kind].append(elapsed)
+        errors[kind] += not ok
+    results.append((timings, errors, takes))
+
+# Reporting
+
+def percentile(values, fraction):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+def summarize(results, seconds):
+    summary = {}
+    for timings, errors, _ in results:
+        for kind, values in timings.items():
+            entry = summary.setdefault(kind, {'timings': [], 'errors': 0})
+            entry['timings'].extend(values)
+            entry['errors'] += errors[kind]
+    report = {}
+    for kind, entry in summary.items():
+        values = entry['timings']
+        report[kind] = {
+            'requests': len(values),
+            'errors': entry['errors'],
+            'throughput': len(values) / seconds,
+            'p50_ms': percentile(values, 0.50) * 1000 if values else None,
+            'p99_ms': percentile(values, 0.99) * 1000 if values else None,
+        }
+    total = sum(entry['requests'] for entry in report.values())
+    report['all'] = {
+        'requests': total,
+        'errors': sum(entry['errors'] for entry in report.values()),
+        'throughput': total / seconds,
+        'p50_ms': None,
+        'p99_ms': None,
+    }
+    all_timings = [value for entry in summary.values() for value in entry['timings']]
+    if all_timings:
+        report['all']['p50_ms'] = percentile(all_timings, 0.50) * 1000
+        report['all']['p99_ms'] = percentile(all_timings, 0.99) * 1000
+    return report
+
+def _fmt(value, spec):
+    return format(value, spec) if value is not None else '-'
+
+def print_report(report):
+    print(f"{'request':<20} {'count':>8} {'errors':>7} {'req/s':>9} {'p50 ms':>9} {'p99 ms':>9}")
+    for kind, entry in report.items():
+        print(f"{kind:<20} {entry['requests']:>8} {entry['errors']:>7} {entry['throughput']:>9.1f} "
+              f"{_fmt(entry['p50_ms'], '>9.1f')} {_fmt(entry['p99_ms'], '>9.1f')}")
+
+def compare(report, peak_rss, baseline, tolerance):
+    """Return regression messages against a baseline run."""
+    regressions = []
+    for kind, entry in report.items():
+        base = baseline['requests'].get(kind)
+        if not base or not entry['requests'] or not base['requests']:
+            continue
+        if entry['p99_ms'] > base['p99_ms'] * (1 + tolerance):
+            regressions.append(f"{kind}: p99 {entry['p99_ms']:.1f} ms vs. baseline {base['p99_ms']:.1f} ms")
+        if entry['throughput'] < base['throughput'] * (1 - tolerance):
+            regressions.append(f"{kind}: {entry['throughput']:.1f} req/s vs. baseline {base['throughput']:.1f} req/s")
+    base_rss = baseline.get('peak_rss_mb')
+    if peak_rss and base_rss and peak_rss > base_rss * (1 + tolerance):
+        regressions.append(f'peak RSS {peak_rss:.0f} MB vs. baseline {base_rss:.0f} MB')
+    return regressions
+
+def parse_mix(text):
+    if not text:
+        return dict(DEFAULT_MIX)
+    mix = {}
+    for part in text.split(','):
+        kind, _, weight = part.partition('=')
+        if kind.strip() not in DEFAULT_MIX:
+            raise SystemExit(f"Unknown request type {kind.strip()!r}; choose from {', '.join(DEFAULT_MIX)}")
+        mix[kind.strip()] = float(weight or 1)
+    return mix
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--items', type=int, default=10000)
+    parser.add_argument('--transactions', type=int, default=1000000)
+    parser.add_argument('--clients', type=int, default=8)
+    parser.add_argument('--seconds', type=float, default=30)
+    parser.add_argument('--warmup', type=float, default=3, help='seconds excluded from the statistics')
+    parser.add_argument('--mix', help='weights, e.g. take=3,api_item=5 (default: all request types)')
+    parser.add_argument('--db', help='database to seed (or reuse if it exists); default: a temporary file')
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE)
+    parser.add_argument('--save-baseline', action='store_true')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='allowed regression, as a fraction')
+    parser.add_argument('--json', help='also write the report to this file')
+    args = parser.parse_args()
+    mix = parse_mix(args.mix)
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.abspath(args.db) if args.db else os.path.join(tmp, 'load.db')
+        if os.path.exists(path):
+            items = sqlite3.connect(path).execute('SELECT max(id) FROM items').fetchone()[0]
+            print(f'Reusing {path} ({items} items)')
+        else:
+            started = time.perf_counter()
+            ctx = multiprocessing.get_context('spawn')
+            proc = ctx.Process(target=seed, args=(path, args.items, args.transactions))
+            proc.start()
+            proc.join()
+            if proc.exitcode:
+                raise SystemExit('Seeding failed')
+            items = args.items
+            print(f'Seeded {args.items} items and {args.transactions} transactions '
+                  f'in {time.perf_counter() - started:.1f}s')
+        
+        sink = SMTPSink()
+        threading.Thread(target=sink.serve_forever, daemon=True).start()
+        env = {
+            'SMTP_SERVER': '127.0.0.1',
+            'SMTP_PORT': str(sink.server_address[1]),
+            'SMTP_USE_TLS': 'false',
+            'SMTP_USERNAME': '',
+            'SMTP_PASSWORD': '',
+            'SMTP_FROM': 'inventory@loadtest.local',
+            'ADMIN_EMAIL': 'admin@loadtest.local',
+            'ADMIN_USERNAME': ADMIN_USERNAME,
+            'ADMIN_PASSWORD': ADMIN_PASSWORD,
+            'EMAIL_OUTBOX_DISPATCHER': 'true',
+            'EMAIL_OUTBOX_POLL_SECONDS': '1',
+            'EXPORT_CACHE_DIR': os.path.join(tmp, 'exports'),
+            'METRICS_DIR': os.path.join(tmp, 'metrics'),
+        }
+        ctx = multiprocessing.get_context('spawn')
+        ready = ctx.Queue()
+        server = ctx.Process(target=serve, args=(path, env, ready), daemon=True)
+        server.start()
+        base_url = f'http://127.0.0.1:{ready.get(timeout=120)}'
+        
+        before = ledger_totals(path)
+        results = []
+        warmup_until = time.perf_counter() + args.warmup
+        deadline = warmup_until + args.seconds
+        clients = [threading.Thread(target=client_loop,
+                                    args=(base_url, mix, items, warmup_until, deadline, n, results))
+                   for n in range(args.clients)]
+        for client in clients:
+            client.start()
+        for client in clients:
+            client.join()
+        if len(results) < args.clients:
+            raise SystemExit('Some clients failed to start; see the errors above')
+        
+        # Let the dispatcher deliver what the takes queued
+        time.sleep(2)
+        peak_rss = peak_rss_mb(server.pid)
+        server.terminate()
+        server.join()
+        sink.shutdown()
+        after = ledger_totals(path)
+    
+    report = summarize(results, args.seconds)
+    print(f'{args.clients} clients, {args.seconds:.0f}s after {args.warmup:.0f}s warm-up')
+    print_report(report)
+    print(f"Server peak RSS: {_fmt(peak_rss, '.0f')} MB; SMTP sink received {sink.messages} messages")
+    
+    takes = sum(result[2] for result in results)
+    stock_drop = before[0] - after[0]
+    new_transactions = after[1] - before[1]
+    taken = after[2] - before[2]
+    balanced = stock_drop == taken and new_transactions == takes
+    print(f'Ledger: {takes} successful takes, {new_transactions} new transactions, '
+          f'stock down {stock_drop}, quantity taken {taken}: {"balanced" if balanced else "MISMATCH"}')
+    
+    run = {'clients': args.clients, 'seconds': args.seconds, 'mix': mix,
+           'peak_rss_mb': peak_rss, 'requests': report}
+    if args.json:
+        with open(args.json, 'w') as output:
+            json.dump(run, output, indent=2)
+    
+    status = 0 if balanced else 1
+    if args.save_baseline:
+        with open(args.baseline, 'w') as output:
+            json.dump(run, output, indent=2)
+        print(f'Saved baseline to {args.baseline}')
+    elif os.path.exists(args.baseline):
+        with open(args.baseline) as source:
+            regressions = compare(report, peak_rss, json.load(source), args.tolerance)
+        for message in regressions:
+            print(f'REGRESSION {message}')
+        if regressions:
+            status = 1
+        else:
+            print(f'No regressions beyond {args.tolerance:.0%} of {args.baseline}')
+    sys.exit(status)
+
+if __name__ == '__main__':
+    main()
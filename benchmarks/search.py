@@ -0,0 +1,101 @@
+"""Item search latency: FTS5 index vs. LIKE scans.
+
+Seeds a database through the app (so migrations create ``items_fts`` and
+its triggers) with generated item names and descriptions, then times the
+same searches three ways:
+
+- ``fts``: ``app.search.search_items`` (prefix MATCH, bm25 ranking, one page)
+- ``like``: ``name LIKE '%term%' OR description LIKE '%term%'`` for every
+  word, ordered by name, one page plus a count, as a LIKE-based search
+  endpoint would need
+- ``like-prefix``: ``name LIKE 'term%'`` only, the cheapest LIKE variant
+
+Usage:
+    python -m benchmarks.search --items 100000 --repeat 20
+"""
+import argparse
+import os
+import random
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+WORDS = ['cable', 'patch', 'power', 'fiber', 'optic', 'switch', 'router', 'server', 'rack', 'rail',
+         'screw', 'cage', 'nut', 'transceiver', 'adapter', 'console', 'serial', 'ethernet', 'copper',
+         'blue', 'red', 'yellow', 'short', 'long', 'spare', 'module', 'fan', 'psu', 'disk', 'ssd',
+         'memory', 'dimm', 'battery', 'label', 'tie', 'velcro', 'kvm', 'monitor', 'keyboard', 'mouse']
+
+QUERIES = ['cab', 'patch cable', 'fib opt', 'transceiver', 'ssd 480', 'velcro tie', 'zzz']
+
+def seed(path, items):
+    os.environ['DATABASE_PATH'] = path
+    os.environ.setdefault('EMAIL_OUTBOX_DISPATCHER', 'false')
+    from app import create_app
+    app = create_app()
+    rng = random.Random(42)
+    now = datetime.utcnow()
+    conn = sqlite3.connect(path)
+    conn.executemany(
+        'INSERT INTO items (id, name, description, quantity, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?)',
+        ((i, f'{" ".join(rng.sample(WORDS, 3))} {rng.randint(1, 999)} #{i}',
+          ' '.join(rng.choices(WORDS, k=12)), rng.randint(0, 50), now, now)
+         for i in range(1, items + 1)))
+    conn.commit()
+    conn.close()
+    return app
+
+def time_call(func, repeat):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - started) * 1000)
+    return statistics.median(timings), max(timings)
+
+def like_search(conn, text, per_page):
+    terms = text.split()
+    where = ' AND '.join('(name LIKE ? OR description LIKE ?)' for _ in terms)
+    params = [value for term in terms for value in (f'%{term}%', f'%{term}%')]
+    conn.execute(f'SELECT count(*) FROM items WHERE {where}', params).fetchone()
+    return conn.execute(f'SELECT * FROM items WHERE {where} ORDER BY name LIMIT ?',
+                        params + [per_page]).fetchall()
+
+def like_prefix_search(conn, text, per_page):
+    return conn.execute('SELECT * FROM items WHERE name LIKE ? ORDER BY name LIMIT ?',
+                        (f'{text.split()[0]}%', per_page)).fetchall()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--items', type=int, default=100000)
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--per-page', type=int, default=48)
+    args = parser.parse_args()
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'bench.db')
+        started = time.perf_counter()
+        app = seed(path, args.items)
+        print(f'Seeded {args.items} items (FTS kept in sync by triggers) in {time.perf_counter() - started:.1f}s')
+        
+        from app.search import search_items
+        conn = sqlite3.connect(path)
+        
+        print(f"{'query':<14} {'hits':>7} {'fts ms':>8} {'like ms':>8} {'prefix ms':>10}   (median; max)")
+        with app.app_context():
+            for text in QUERIES:
+                hits = search_items(text, per_page=args.per_page).total
+                fts = time_call(lambda: search_items(text, per_page=args.per_page), args.repeat)
+                like = time_call(lambda: like_search(conn, text, args.per_page), args.repeat)
+                prefix = time_call(lambda: like_prefix_search(conn, text, args.per_page), args.repeat)
+                print(f'{text:<14} {hits:>7} {fts[0]:>8.2f} {like[0]:>8.2f} {prefix[0]:>10.2f}'
+                      f'   ({fts[1]:.1f}; {like[1]:.1f}; {prefix[1]:.1f})')
+        conn.close()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,127 @@
+"""Mixed read/write throughput with and without the SQLite tuning profile.
+
+Reader processes run the admin dashboard queries in a loop while writer
+processes run take_item-style conditional decrements plus ledger inserts.
+The same workload runs once with SQLite's defaults (rollback journal,
+synchronous=FULL) and once with the profile from ``app.sqlite``.
+
+Usage:
+    python -m benchmarks.sqlite_profile --readers 4 --writers 4 --seconds 10
+"""
+import argparse
+import multiprocessing
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.sqlite import apply_pragmas, sqlite_pragmas_from_env
+
+BASELINE_PROFILE = {'journal_mode': 'DELETE', 'synchronous': 'FULL'}
+
+READ_QUERIES = [
+    'SELECT count(*), sum(quantity) FROM items',
+    'SELECT count(*) FROM transactions',
+    'SELECT id, name, quantity FROM items WHERE quantity <= 5',
+    'SELECT t.id, t.user_name, i.name, t.quantity, t.timestamp FROM transactions t '
+    'JOIN items i ON i.id = t.item_id ORDER BY t.timestamp DESC LIMIT 10',
+]
+
+def seed(path, items, transactions):
+    conn = sqlite3.connect(path)
+    conn.executescript('''
+        CREATE TABLE items (id INTEGER PRIMARY KEY, name TEXT UNIQUE NOT NULL, description TEXT,
+                            quantity INTEGER NOT NULL, qr_code_path TEXT, created_at DATETIME,
+                            updated_at DATETIME);
+        CREATE TABLE transactions (id INTEGER PRIMARY KEY, item_id INTEGER NOT NULL REFERENCES items(id),
+                                   user_name TEXT NOT NULL, user_email TEXT, quantity INTEGER NOT NULL,
+                                   purpose TEXT, timestamp DATETIME);
+    ''')
+    conn.executemany('INSERT INTO items (id, name, quantity, updated_at) VALUES (?, ?, ?, datetime())',
+                     ((i, f'item-{i}', 10 ** 9) for i in range(1, items + 1)))
+    conn.executemany('INSERT INTO transactions (item_id, user_name, quantity, timestamp) '
+                     'VALUES (?, ?, 1, datetime())',
+                     ((random.randint(1, items), 'seed') for _ in range(transactions)))
+    conn.commit()
+    conn.close()
+
+def _connect(path, pragmas):
+    # isolation_level=None: we issue BEGIN ourselves, like the app's write path
+    conn = sqlite3.connect(path, timeout=5, isolation_level=None)
+    apply_pragmas(conn, pragmas)
+    return conn
+
+def reader(path, pragmas, deadline, results):
+    conn = _connect(path, pragmas)
+    ops = errors = 0
+    while time.time() < deadline:
+        try:
+            for query in READ_QUERIES:
+                conn.execute(query).fetchall()
+            ops += 1
+        except sqlite3.OperationalError:
+            errors += 1
+    results.put(('read', ops, errors))
+
+def writer(path, pragmas, deadline, items, results):
+    conn = _connect(path, pragmas)
+    ops = errors = 0
+    while time.time() < deadline:
+        item_id = random.randint(1, items)
+        try:
+            conn.execute('BEGIN')
+            conn.execute('UPDATE items SET quantity = quantity - 1, updated_at = datetime() '
+                         'WHERE id = ? AND quantity >= 1', (item_id,))
+            conn.execute("INSERT INTO transactions (item_id, user_name, quantity, timestamp) "
+                         "VALUES (?, 'bench', 1, datetime())", (item_id,))
+            conn.execute('COMMIT')
+            ops += 1
+        except sqlite3.OperationalError:
+            if conn.in_transaction:
+                conn.execute('ROLLBACK')
+            errors += 1
+    results.put(('write', ops, errors))
+
+def run(label, pragmas, args):
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'bench.db')
+        seed(path, args.items, args.transactions)
+        
+        results = multiprocessing.Queue()
+        deadline = time.time() + args.seconds
+        procs = [multiprocessing.Process(target=reader, args=(path, pragmas, deadline, results))
+                 for _ in range(args.readers)]
+        procs += [multiprocessing.Process(target=writer, args=(path, pragmas, deadline, args.items, results))
+                  for _ in range(args.writers)]
+        for proc in procs:
+            proc.start()
+        totals = {'read': [0, 0], 'write': [0, 0]}
+        for _ in procs:
+            kind, ops, errors = results.get()
+            totals[kind][0] += ops
+            totals[kind][1] += errors
+        for proc in procs:
+            proc.join()
+    
+    print(f"{label:<10} reads/s {totals['read'][0] / args.seconds:>9.1f}  "
+          f"writes/s {totals['write'][0] / args.seconds:>8.1f}  "
+          f"locked errors {totals['read'][1] + totals['write'][1]}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--readers', type=int, default=4)
+    parser.add_argument('--writers', type=int, default=4)
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--items', type=int, default=2000)
+    parser.add_argument('--transactions', type=int, default=50000)
+    args = parser.parse_args()
+    
+    run('default', BASELINE_PROFILE, args)
+    run('tuned', sqlite_pragmas_from_env(), args)
+
+if __name__ == '__main__':
+    main()
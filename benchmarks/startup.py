@@ -0,0 +1,186 @@
+"""Worker boot time and per-worker memory, eager vs. lazy vs. preloaded startup.
+
+Starts ``--workers`` app processes at once, the way gunicorn does, and
+reports how long each takes from process start to serving its first
+request. Memory is read from /proc/<pid>/smaps_rollup once every worker is
+up: RSS, PSS (RSS with shared pages split between the processes sharing
+them) and USS (pages private to the worker). Linux only.
+
+- ``eager``: the previous startup. Excel, QR, image and pandas imports at
+  boot, and ``create_all`` plus the migration run in every worker.
+- ``lazy``: the current ``create_app``. Those libraries are imported on
+  first use, and booting only reads the schema version.
+- ``preload``: ``gunicorn.conf.py``. The app is loaded once in a master
+  that forks the workers, so boot time is from fork to first response. The
+  totals include the master. Each forked worker reports to the master over
+  its own pipe, and the master prints all reports as one line, so reports
+  from several processes never share the stdout pipe.
+
+Usage:
+    python -m benchmarks.startup --workers 4
+"""
+import argparse
+import json
+import os
+import runpy
+import signal
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from types import SimpleNamespace
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+VARIANTS = ('eager', 'lazy', 'preload')
+
+def seed(path):
+    os.environ['DATABASE_PATH'] = path
+    from app import create_app, db
+    from app.models import Item
+    app = create_app()
+    with app.app_context():
+        db.session.add_all(Item(name=f'item-{i}', quantity=100) for i in range(100))
+        db.session.commit()
+
+def first_request(app):
+    response = app.test_client().get('/login')
+    assert response.status_code == 200, response.status_code
+
+def boot(eager=False):
+    """Boot one worker's app, as before this change when ``eager``."""
+    if eager:
+        import openpyxl, pandas, qrcode  # noqa: F401
+        from PIL import Image, ImageDraw, ImageFont  # noqa: F401
+    from app import create_app, db
+    app = create_app()
+    if eager:
+        with app.app_context():
+            db.create_all()
+            from app.migrations import upgrade_database
+            upgrade_database()
+    return app
+
+def run_worker(variant):
+    """Worker process: boot, serve one request, then wait to be measured."""
+    first_request(boot(eager=variant == 'eager'))
+    print(json.dumps({'pid': os.getpid()}), flush=True)
+    sys.stdin.read()
+
+def run_master(workers):
+    """Preloading master: load the app once, fork workers with the gunicorn hooks."""
+    config = runpy.run_path(os.path.join(ROOT, 'gunicorn.conf.py'))
+    config['on_starting'](None)
+    app = boot()
+    server = SimpleNamespace(app=SimpleNamespace(wsgi=lambda: app))
+    children = []
+    for _ in range(workers):
+        config['pre_fork'](server, None)
+        read_fd, write_fd = os.pipe()
+        sys.stdout.flush()
+        forked = time.perf_counter()
+        pid = os.fork()
+        if pid == 0:
+            os.close(read_fd)
+            # Only the master writes to stdout; the report goes over this worker's pipe
+            os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+            config['post_fork'](server, None)
+            first_request(app)
+            os.write(write_fd, json.dumps({'pid': os.getpid(), 'boot': time.perf_counter() - forked}).encode())
+            os.close(write_fd)
+            signal.pause()
+            os._exit(0)
+        os.close(write_fd)
+        children.append((pid, read_fd))
+    
+    reports = []
+    for _, read_fd in children:
+        with os.fdopen(read_fd) as channel:
+            reports.append(json.loads(channel.read()))
+    print(json.dumps({'pid': os.getpid(), 'master': True, 'workers': reports}), flush=True)
+    sys.stdin.read()
+    for pid, _ in children:
+        os.kill(pid, signal.SIGTERM)
+        os.waitpid(pid, 0)
+
+def memory(pid):
+    """RSS, PSS and USS of a process in MB."""
+    values = {}
+    with open(f'/proc/{pid}/smaps_rollup') as rollup:
+        for line in rollup:
+            parts = line.split()
+            if len(parts) == 3 and parts[2] == 'kB':
+                values[parts[0].rstrip(':')] = int(parts[1]) / 1024
+    return values['Rss'], values['Pss'], values['Private_Clean'] + values['Private_Dirty']
+
+def read_report(stream):
+    # Background jobs started by the first request may print too
+    while True:
+        line = stream.readline()
+        if not line:
+            raise RuntimeError('worker exited before reporting')
+        if line.startswith('{'):
+            return json.loads(line)
+
+def measure(variant, workers):
+    """Start the workers of one variant; return boot times and memory of each process."""
+    command = [sys.executable, '-m', 'benchmarks.startup']
+    if variant == 'preload':
+        procs = [subprocess.Popen(command + ['--master', '--workers', str(workers)], cwd=ROOT,
+                                  stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True)]
+        master = read_report(procs[0].stdout)
+        reports = master.pop('workers') + [master]
+    else:
+        started = time.perf_counter()
+        procs = [subprocess.Popen(command + ['--worker', variant], cwd=ROOT,
+                                  stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True)
+                 for _ in range(workers)]
+        reports = []
+        for proc in procs:
+            report = read_report(proc.stdout)
+            report['boot'] = time.perf_counter() - started
+            reports.append(report)
+    
+    # Measured only once every worker is up, so shared pages are split between all of them
+    for report in reports:
+        report['rss'], report['pss'], report['uss'] = memory(report['pid'])
+    for proc in procs:
+        proc.stdin.close()
+        proc.wait()
+    return reports
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--variants', default=','.join(VARIANTS))
+    parser.add_argument('--worker', choices=VARIANTS, help=argparse.SUPPRESS)
+    parser.add_argument('--master', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    
+    if args.worker:
+        return run_worker(args.worker)
+    if args.master:
+        return run_master(args.workers)
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ.update(DATABASE_PATH=os.path.join(tmp, 'bench.db'),
+                          METRICS_DIR=os.path.join(tmp, 'metrics'),
+                          EMAIL_OUTBOX_DISPATCHER='false')
+        seed(os.environ['DATABASE_PATH'])
+        
+        print(f"{'variant':<8} {'boot ms':>8} {'max ms':>8} {'RSS MB':>8} {'PSS MB':>8} {'USS MB':>8} "
+              f"{'total PSS MB':>13}")
+        for variant in args.variants.split(','):
+            reports = measure(variant, args.workers)
+            worker_reports = [report for report in reports if not report.get('master')]
+            boots = [report['boot'] * 1000 for report in worker_reports]
+            print(f"{variant:<8} {statistics.median(boots):>8.0f} {max(boots):>8.0f} "
+                  f"{statistics.mean(r['rss'] for r in worker_reports):>8.1f} "
+                  f"{statistics.mean(r['pss'] for r in worker_reports):>8.1f} "
+                  f"{statistics.mean(r['uss'] for r in worker_reports):>8.1f} "
+                  f"{sum(r['pss'] for r in reports):>13.1f}")
+
+if __name__ == '__main__':
+    main()
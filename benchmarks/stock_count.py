@@ -0,0 +1,106 @@
+"""Full stock-count reconciliation: set-based stock count vs. one edit per item.
+
+Seeds a catalog through the app, writes a count sheet covering every item
+with a share of them off by a few units, then reconciles it two ways:
+
+- ``stock count``: ``app.stock_count``, uploading the sheet (temp table and
+  set-based merge), reading the totals and first page of differences, and
+  applying every adjustment in one transaction
+- ``per item``: what ``admin.edit_item`` does for each item that is off,
+  loading the item, setting its quantity and QR path and committing, timed
+  on ``--sample`` items and extrapolated to all of them
+
+Usage:
+    python -m benchmarks.stock_count --items 50000 --off 0.1
+"""
+import argparse
+import csv
+import io
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+def seed(path, items):
+    os.environ['DATABASE_PATH'] = path
+    os.environ.setdefault('EMAIL_OUTBOX_DISPATCHER', 'false')
+    from app import create_app
+    app = create_app()
+    now = datetime.utcnow()
+    conn = sqlite3.connect(path)
+    conn.executemany('INSERT INTO items (id, name, description, quantity, created_at, updated_at) '
+                     'VALUES (?, ?, ?, ?, ?, ?)',
+                     ((i, f'item {i}', '', 50, now, now) for i in range(1, items + 1)))
+    conn.commit()
+    conn.close()
+    return app
+
+def count_sheet(items, off, rng):
+    """CSV bytes with a count for every item; ``off`` of them differ from stock."""
+    output = io.StringIO()
+    writer = csv.writer(output)
+    writer.writerow(['ID', 'Name', 'Count'])
+    for item_id in range(1, items + 1):
+        counted = 50 + rng.choice([-3, -2, -1, 1, 2]) if rng.random() < off else 50
+        writer.writerow([item_id, f'item {item_id}', counted])
+    return output.getvalue().encode()
+
+def per_item_edit(item_id, quantity):
+    from app import db
+    from app.models import Item
+    from app.utils import qr_code_path
+    item = db.session.get(Item, item_id)
+    item.quantity = quantity
+    item.qr_code_path = qr_code_path(item.id, item.name)
+    db.session.commit()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--items', type=int, default=50000)
+    parser.add_argument('--off', type=float, default=0.1, help='Share of items whose count differs')
+    parser.add_argument('--sample', type=int, default=500, help='Items edited one by one for the baseline')
+    args = parser.parse_args()
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ['METRICS_DIR'] = os.path.join(tmp, 'metrics')
+        os.environ['ITEM_CACHE_PATH'] = os.path.join(tmp, 'item_cache.db')
+        app = seed(os.path.join(tmp, 'bench.db'), args.items)
+        sheet = count_sheet(args.items, args.off, random.Random(42))
+        
+        from app.imports import read_import_rows
+        from app.stock_count import (COUNT_HEADER_ALIASES, COUNT_KEY_FIELDS, create_count, record_counts,
+                                     count_summary, count_differences, apply_count)
+        with app.app_context():
+            count = create_count('benchmark', 'bench')
+            started = time.perf_counter()
+            report = record_counts(count.id, read_import_rows(io.BytesIO(sheet), 'csv', aliases=COUNT_HEADER_ALIASES,
+                                                              key_fields=COUNT_KEY_FIELDS))
+            uploaded = time.perf_counter()
+            summary = count_summary(count.id)
+            count_differences(count.id)
+            diffed = time.perf_counter()
+            applied = apply_count(count.id, 'bench')
+            finished = time.perf_counter()
+            
+            differing = summary['over'] + summary['short']
+            print(f"Counted {report['items']} items, {differing} off; applied {applied.adjusted_items} "
+                  f"adjustments (net {applied.net_change:+d})")
+            print(f"stock count: upload {(uploaded - started) * 1000:.0f} ms, diff {(diffed - uploaded) * 1000:.0f} ms, "
+                  f"apply {(finished - diffed) * 1000:.0f} ms, total {finished - started:.2f}s")
+            
+            sample = min(args.sample, args.items)
+            started = time.perf_counter()
+            for item_id in range(1, sample + 1):
+                per_item_edit(item_id, 40)
+            per_edit = (time.perf_counter() - started) / sample
+            print(f'per item:    {per_edit * 1000:.2f} ms per edit, about {per_edit * differing:.1f}s '
+                  f'for {differing} items (one commit each, plus the form round trip per item)')
+
+if __name__ == '__main__':
+    main()
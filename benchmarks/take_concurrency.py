@@ -0,0 +1,133 @@
+"""Concurrent takes from one item, across processes, against a real database.
+
+Seeds a database with a single item, then starts several worker processes
+(one app and one SQLite connection each, like gunicorn workers) that all
+take from that item at once through ``app.checkout``, the path behind the
+take form and the cart API.  Together they ask for more than is in stock,
+so the last takes race for the last units.
+
+Afterwards the item and its ledger must agree:
+
+- the stock never went below zero
+- successful takes x quantity == starting stock - final stock
+- the item's transactions add up to the same number, one per successful take
+- the stock ran out, since more was asked for than there was
+
+Exits with status 1 if any of these fail.
+
+Usage:
+    python -m benchmarks.take_concurrency --processes 8 --takes 200 --stock 1000 --quantity 3
+"""
+import argparse
+import multiprocessing
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+ITEM_ID = 1
+
+def seed(path, stock):
+    """Create the schema through the app, then insert the one item."""
+    os.environ['DATABASE_PATH'] = path
+    os.environ['EMAIL_OUTBOX_DISPATCHER'] = 'false'
+    from app import create_app
+    create_app()
+    now = datetime.utcnow()
+    conn = sqlite3.connect(path)
+    conn.execute('INSERT INTO items (id, name, description, quantity, created_at, updated_at) '
+                 'VALUES (?, ?, ?, ?, ?, ?)', (ITEM_ID, 'contended item', '', stock, now, now))
+    conn.commit()
+    conn.close()
+
+def worker(path, worker_id, takes, quantity, start_at):
+    """Take ``quantity`` units ``takes`` times; returns (taken, short, errors)."""
+    os.environ['DATABASE_PATH'] = path
+    os.environ['EMAIL_OUTBOX_DISPATCHER'] = 'false'
+    os.environ['METRICS_ENABLED'] = 'false'
+    os.environ['BACKUP_INTERVAL_HOURS'] = '0'
+    from app import create_app, db
+    from app.checkout import checkout, InsufficientStockError
+    app = create_app()
+    
+    taken = short = 0
+    errors = []
+    with app.app_context():
+        # Every worker starts at the same moment so the takes overlap
+        time.sleep(max(0.0, start_at - time.time()))
+        for _ in range(takes):
+            try:
+                checkout([(ITEM_ID, quantity)], f'worker-{worker_id}', purpose='concurrency test')
+            except InsufficientStockError:
+                short += 1
+            except Exception as e:
+                db.session.rollback()
+                errors.append(f'{e.__class__.__name__}: {e}')
+            else:
+                taken += 1
+    return taken, short, errors
+
+def ledger(path):
+    """Return (stock, transaction count, quantity in transactions) for the item."""
+    conn = sqlite3.connect(path)
+    try:
+        stock = conn.execute('SELECT quantity FROM items WHERE id = ?', (ITEM_ID,)).fetchone()[0]
+        count, total = conn.execute('SELECT count(*), coalesce(sum(quantity), 0) FROM transactions '
+                                    'WHERE item_id = ?', (ITEM_ID,)).fetchone()
+        return stock, count, total
+    finally:
+        conn.close()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--processes', type=int, default=8)
+    parser.add_argument('--takes', type=int, default=200, help='Takes per process')
+    parser.add_argument('--stock', type=int, default=1000, help='Starting stock of the item')
+    parser.add_argument('--quantity', type=int, default=3, help='Units per take')
+    args = parser.parse_args()
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'take_concurrency.db')
+        os.environ['METRICS_DIR'] = os.path.join(tmp, 'metrics')
+        os.environ['ITEM_CACHE_PATH'] = os.path.join(tmp, 'item_cache.db')
+        seed(path, args.stock)
+        
+        ctx = multiprocessing.get_context('spawn')
+        start_at = time.time() + 3
+        with ctx.Pool(args.processes) as pool:
+            results = pool.starmap(worker, [(path, n, args.takes, args.quantity, start_at)
+                                            for n in range(args.processes)])
+        seconds = time.time() - start_at
+        
+        taken = sum(result[0] for result in results)
+        short = sum(result[1] for result in results)
+        errors = [error for result in results for error in result[2]]
+        stock, count, total = ledger(path)
+    
+    print(f'{args.processes} processes x {args.takes} takes of {args.quantity} in {seconds:.1f}s: '
+          f'{taken} taken, {short} short, {len(errors)} error(s)')
+    for error in sorted(set(errors))[:5]:
+        print(f'  {error}')
+    
+    drop = args.stock - stock
+    checks = [
+        ('stock never negative', stock >= 0, f'final stock {stock}'),
+        ('takes match the stock drop', taken * args.quantity == drop,
+         f'{taken} x {args.quantity} = {taken * args.quantity}, stock down {drop}'),
+        ('transactions match the stock drop', total == drop and count == taken,
+         f'{count} transaction(s) for {total} unit(s)'),
+    ]
+    if args.processes * args.takes * args.quantity > args.stock:
+        checks.append(('stock ran out', stock < args.quantity, f'{stock} left, takes of {args.quantity}'))
+    
+    for name, ok, detail in checks:
+        print(f'{"ok      " if ok else "MISMATCH"} {name}: {detail}')
+    sys.exit(0 if all(ok for _, ok, _ in checks) else 1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,46 @@
+"""Gunicorn settings: ``gunicorn -c gunicorn.conf.py app:app``.
+
+With ``GUNICORN_PRELOAD`` (the default) the app is loaded once in the
+master and workers are forked from it, so they boot almost instantly and
+share the master's memory copy-on-write instead of each importing and
+initialising everything again.  The schema check also runs once, in the
+master.  Libraries the app otherwise imports on first use (Excel, QR and
+image rendering) are imported in the master too, so workers share them.
+
+Connections opened in the master must not be used by the children, so each
+worker drops the inherited pool after the fork.  Other per-process state
+(metrics, SMTP sessions, background threads) already starts afresh in a
+new process.
+"""
+import gc
+import importlib
+import os
+
+# Importing the package also loads .env, for the settings below
+from app import db
+
+bind = f"{os.getenv('APP_HOST', '0.0.0.0')}:{os.getenv('APP_PORT', 5000)}"
+workers = int(os.getenv('GUNICORN_WORKERS', 4))
+worker_class = 'gthread'
+threads = int(os.getenv('GUNICORN_THREADS', 16))
+preload_app = os.getenv('GUNICORN_PRELOAD', 'true').lower() == 'true'
+accesslog = '-'
+errorlog = '-'
+
+PRELOAD_MODULES = ('openpyxl', 'qrcode', 'PIL.Image', 'PIL.ImageDraw', 'PIL.ImageFont')
+
+def on_starting(server):
+    if preload_app:
+        for module in PRELOAD_MODULES:
+            importlib.import_module(module)
+
+def pre_fork(server, worker):
+    # Objects that exist before the fork are never collected in the
+    # children, so the collector does not write to (and copy) shared pages
+    gc.freeze()
+
+def post_fork(server, worker):
+    if preload_app:
+        with server.app.wsgi().app_context():
+            # close=False: leave the master's connections alone, just forget them
+            db.engine.dispose(close=False)
@@ -73,14 +73,8 @@ chmod 600 .env  # Secure the .env file
 # Initialize database
 echo "Initializing database..."
 source venv/bin/activate
-python3 << EOF
-from app import create_app, db
-
-app = create_app()
-with app.app_context():
-    db.create_all()
-    print("Database initialized successfully!")
-EOF
+flask --app app db upgrade
+echo "Database initialized successfully!"
 
 echo ""
 echo "=========================================="
@@ -97,7 +91,7 @@ echo "   python3 app.py"
 echo ""
 echo "   OR for production with Gunicorn:"
 echo "   source venv/bin/activate"
-echo "   gunicorn -w 4 -b 0.0.0.0:5000 app:app"
+echo "   gunicorn -c gunicorn.conf.py app:app"
 echo ""
 echo "3. Access the application:"
 echo "   http://localhost:5000"
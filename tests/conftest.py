@@ -0,0 +1,66 @@
+"""Shared fixtures: a fresh app and database per test.
+
+Background threads are kept out of the way: the outbox dispatcher is off
+and the scheduler's tick is longer than any test, so jobs run only when a
+test runs them.
+"""
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    for name in ('ADMIN_EMAIL', 'ADMIN_DIGEST_MINUTES', 'SMTP_FROM', 'SMTP_USERNAME', 'SMTP_PASSWORD'):
+        monkeypatch.delenv(name, raising=False)
+    monkeypatch.setenv('DATABASE_PATH', str(tmp_path / 'test.db'))
+    monkeypatch.setenv('ITEM_CACHE_PATH', str(tmp_path / 'item_cache.db'))
+    monkeypatch.setenv('METRICS_DIR', str(tmp_path / 'metrics'))
+    monkeypatch.setenv('EXPORT_CACHE_DIR', str(tmp_path / 'exports'))
+    monkeypatch.setenv('BACKUP_DIR', str(tmp_path / 'backups'))
+    monkeypatch.setenv('EMAIL_OUTBOX_DISPATCHER', 'false')
+    monkeypatch.setenv('METRICS_ENABLED', 'false')
+    monkeypatch.setenv('BACKUP_INTERVAL_HOURS', '0')
+    monkeypatch.setenv('SCHEDULER_TICK_SECONDS', '86400')
+    
+    from app import create_app
+    app = create_app()
+    app.config['TESTING'] = True
+    yield app
+    
+    from app import db
+    with app.app_context():
+        db.session.remove()
+        db.engine.dispose()
+
+def _client(app, role):
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['user_id'] = 0 if role == 'admin' else 1
+        session['username'] = role
+        session['role'] = role
+    return client
+
+@pytest.fixture
+def admin_client(app):
+    return _client(app, 'admin')
+
+@pytest.fixture
+def user_client(app):
+    return _client(app, 'user')
+
+@pytest.fixture
+def make_item(app):
+    """Create an item and return its id."""
+    def make(name='Cable', quantity=10, description=''):
+        from app import db
+        from app.models import Item
+        with app.app_context():
+            item = Item(name=name, quantity=quantity, description=description)
+            db.session.add(item)
+            db.session.commit()
+            return item.id
+    return make
@@ -0,0 +1,21 @@
+import pytest
+
+@pytest.mark.parametrize('body', [[], [{'item_id': 1, 'counted': 3}], 'x'])
+def test_stock_count_lines_rejects_non_object_body(app, admin_client, body):
+    from app.stock_count import create_count
+    with app.app_context():
+        count_id = create_count('Spring count', 'admin').id
+    response = admin_client.post(f'/admin/api/stock-counts/{count_id}/lines', json=body)
+    assert response.status_code == 400
+    assert 'error' in response.get_json()
+
+@pytest.mark.parametrize('body', [[], ['items'], 'items'])
+def test_export_job_rejects_non_object_body(admin_client, body):
+    response = admin_client.post('/admin/export/jobs', json=body)
+    assert response.status_code == 400
+    assert 'error' in response.get_json()
+
+def test_export_job_accepts_form(admin_client):
+    response = admin_client.post('/admin/export/jobs', data={'kind': 'nothing', 'format': 'csv'})
+    assert response.status_code == 400
+    assert response.get_json()['error'] == 'Unknown export nothing.csv'
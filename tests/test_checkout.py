@@ -0,0 +1,23 @@
+import pytest
+
+@pytest.mark.parametrize('body', [[], ['x'], 'x', 3])
+def test_checkout_rejects_non_object_body(user_client, body):
+    response = user_client.post('/user/api/checkout', json=body)
+    assert response.status_code == 400
+    assert 'error' in response.get_json()
+
+@pytest.mark.parametrize('field', ['user_name', 'user_email', 'purpose'])
+def test_checkout_rejects_non_string_fields(user_client, make_item, field):
+    item_id = make_item()
+    body = {'items': [{'item_id': item_id, 'quantity': 1}], 'user_name': 'ann', field: 123}
+    response = user_client.post('/user/api/checkout', json=body)
+    assert response.status_code == 400
+    assert field in response.get_json()['error']
+
+def test_checkout_takes_stock(user_client, make_item):
+    item_id = make_item(quantity=5)
+    response = user_client.post('/user/api/checkout', json={'items': [{'item_id': item_id, 'quantity': 2}],
+                                                        'user_name': ' ann '})
+    assert response.status_code == 201
+    [transaction] = response.get_json()['transactions']
+    assert (transaction['user_name'], transaction['quantity']) == ('ann', 2)
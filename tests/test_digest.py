@@ -0,0 +1,19 @@
+def test_take_before_first_tick_is_in_first_digest(app, make_item, monkeypatch):
+    from app import create_app, db, scheduler
+    from app.checkout import checkout
+    from app.digest import JOB_NAME
+    from app.models import EmailOutbox
+    monkeypatch.setattr(scheduler, '_jobs', {})
+    monkeypatch.setenv('ADMIN_DIGEST_MINUTES', '60')
+    monkeypatch.setenv('ADMIN_EMAIL', 'admin@example.com')
+    item_id = make_item(name='Soldering iron')
+    digest_app = create_app()
+    
+    # Taken after boot, before any request started the scheduler
+    with digest_app.app_context():
+        checkout([(item_id, 2)], 'ann')
+        scheduler.run_job(JOB_NAME)
+        messages = db.session.query(EmailOutbox).all()
+        assert len(messages) == 1
+        assert 'Soldering iron' in messages[0].html_content
+        db.session.remove()
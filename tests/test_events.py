@@ -0,0 +1,33 @@
+"""Live update streams (/events/stock)."""
+
+def test_stream_cap_per_worker(user_client, monkeypatch):
+    monkeypatch.setenv('SSE_MAX_STREAMS', '2')
+    
+    first = user_client.get('/events/stock')
+    second = user_client.get('/events/stock')
+    assert first.status_code == 200 and second.status_code == 200
+    assert first.mimetype == 'text/event-stream'
+    
+    refused = user_client.get('/events/stock')
+    assert refused.status_code == 503
+    assert refused.headers['Retry-After'] == '30'
+    
+    # Closing a stream frees its slot
+    first.close()
+    third = user_client.get('/events/stock')
+    assert third.status_code == 200
+    
+    second.close()
+    third.close()
+
+def test_refused_stream_takes_no_slot(user_client, monkeypatch):
+    monkeypatch.setenv('SSE_MAX_STREAMS', '1')
+    
+    stream = user_client.get('/events/stock')
+    for _ in range(3):
+        assert user_client.get('/events/stock').status_code == 503
+    stream.close()
+    
+    again = user_client.get('/events/stock')
+    assert again.status_code == 200
+    again.close()
@@ -0,0 +1,22 @@
+import re
+
+def _badge(html, item_id):
+    return re.search(rf'<span class="badge ([^"]+)" data-item-quantity="{item_id}"[^>]*>', html)
+
+def test_stock_badges_use_reorder_points(app, admin_client, make_item):
+    from app import db
+    from app.models import ItemForecast
+    forecast = make_item(name='Gloves', quantity=15)
+    fallback = make_item(name='Tape', quantity=8)
+    with app.app_context():
+        db.session.add(ItemForecast(item_id=forecast, burn_rate=3.0, demand_std=1.0, reorder_point=20))
+        db.session.commit()
+    
+    html = admin_client.get('/admin/items').get_data(as_text=True)
+    badge = _badge(html, forecast)
+    assert badge.group(1) == 'bg-danger'
+    assert 'data-reorder-point="20"' in badge.group(0)
+    # No forecast: the fixed thresholds
+    badge = _badge(html, fallback)
+    assert badge.group(1) == 'bg-warning text-dark'
+    assert 'data-reorder-point="5"' in badge.group(0)
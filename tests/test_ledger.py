@@ -0,0 +1,80 @@
+import sqlite3
+from datetime import datetime, timedelta
+
+def _take(app, item_id, days_ago=0, quantity=1):
+    from app import db
+    from app.models import Transaction
+    with app.app_context():
+        transaction = Transaction(item_id=item_id, user_name='ann', quantity=quantity,
+                                  timestamp=datetime.utcnow() - timedelta(days=days_ago))
+        db.session.add(transaction)
+        db.session.commit()
+        return transaction.id
+
+def test_archived_ids_are_not_reused(app, make_item):
+    from app.ledger import archive_transactions
+    item_id = make_item()
+    first = _take(app, item_id, days_ago=30)
+    second = _take(app, item_id, days_ago=30)
+    with app.app_context():
+        result = archive_transactions(7)
+    assert (result['moved'], result['left']) == (2, 0)
+    
+    third = _take(app, item_id)
+    assert third > max(first, second)
+    
+    # An item deleted with its newest take does not free that id either
+    other = make_item(name='Plug')
+    fourth = _take(app, other)
+    from app import db
+    from app.models import Item
+    with app.app_context():
+        db.session.delete(db.session.get(Item, other))
+        db.session.commit()
+    assert _take(app, item_id) > fourth
+
+def test_migration_renumbers_reused_ids(app, tmp_path):
+    from app import db
+    from app.migrations import upgrade_database
+    with app.app_context():
+        db.engine.dispose()
+    
+    # A ledger from before migration 7, whose id 1 was archived and then handed out again
+    conn = sqlite3.connect(tmp_path / 'test.db')
+    conn.executescript('''
+        DROP TABLE transactions;
+        CREATE TABLE transactions (
+            id INTEGER NOT NULL, item_id INTEGER NOT NULL, user_name VARCHAR(100) NOT NULL,
+            user_email VARCHAR(120), quantity INTEGER NOT NULL, purpose TEXT, timestamp DATETIME,
+            kind VARCHAR(20) DEFAULT 'take' NOT NULL, PRIMARY KEY (id), FOREIGN KEY(item_id) REFERENCES items (id));
+        INSERT INTO items (id, name, description, quantity, created_at, updated_at)
+            VALUES (1, 'Cable', '', 10, '2026-01-01 00:00:00', '2026-01-01 00:00:00');
+        INSERT INTO transactions (id, item_id, user_name, quantity, timestamp)
+            VALUES (1, 1, 'bob', 2, '2026-02-01 00:00:00'), (2, 1, 'bob', 3, '2026-02-02 00:00:00');
+        PRAGMA user_version = 6;
+    ''')
+    conn.close()
+    archive = sqlite3.connect(tmp_path / 'archive.db')
+    archive.executescript('''
+        CREATE TABLE archived_transactions (
+            id INTEGER PRIMARY KEY, item_id INTEGER NOT NULL, item_name VARCHAR(100),
+            user_name VARCHAR(100) NOT NULL, user_email VARCHAR(120), quantity INTEGER NOT NULL,
+            purpose TEXT, timestamp DATETIME, archived_at DATETIME NOT NULL, kind VARCHAR(20) NOT NULL DEFAULT 'take');
+        INSERT INTO archived_transactions (id, item_id, user_name, quantity, timestamp, archived_at)
+            VALUES (1, 1, 'ann', 1, '2025-01-01 00:00:00', '2026-01-01 00:00:00');
+    ''')
+    archive.close()
+    
+    with app.app_context():
+        assert upgrade_database() == [7]
+    conn = sqlite3.connect(tmp_path / 'test.db')
+    try:
+        sql = conn.execute("SELECT sql FROM sqlite_master WHERE name = 'transactions'").fetchone()[0]
+        assert 'AUTOINCREMENT' in sql
+        assert conn.execute('SELECT id, quantity FROM transactions ORDER BY id').fetchall() == [(2, 3), (3, 2)]
+        conn.execute("INSERT INTO transactions (item_id, user_name, quantity) VALUES (1, 'ann', 1)")
+        assert conn.execute('SELECT max(id) FROM transactions').fetchone()[0] == 4
+        # The usage trigger is back, and the copied rows were not counted twice
+        assert conn.execute('SELECT sum(transaction_count) FROM item_daily_usage').fetchone()[0] == 1
+    finally:
+        conn.close()
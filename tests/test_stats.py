@@ -0,0 +1,14 @@
+def test_total_transactions_counts_adjustments(app, make_item):
+    from app.checkout import checkout
+    from app.stats import compute_dashboard_stats
+    from app.stock_count import apply_count, create_count, record_counts
+    item_id = make_item(quantity=10)
+    with app.app_context():
+        checkout([(item_id, 2)], 'ann')
+        count_id = create_count('Spring count', 'admin').id
+        record_counts(count_id, [(1, {'id': item_id, 'name': None, 'counted': 5})])
+        apply_count(count_id, 'admin')
+        
+        stats = compute_dashboard_stats()
+        assert stats['total_transactions'] == 2
+        assert stats['total_quantity'] == 5